@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Benchmark of the headless batch highlight (KodeBatch)
+#
+# A workspace of python/c/js/sh files is generated with a fixed seed
+# (or an existing folder is used) and highlighted to ANSI and to token runs
+# in the calling process (-j 0) and in process pools of increasing size,
+# the throughput is reported in files/sec and MB/sec.
+#
+# Usage:
+#    tools/bench/benchBatch.py [--files N] [--lines N] [-j N,...] [--json OUT] [folder]
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# benchSymbols (through benchHighlight) sets up the paths and the pseudo terminal
+from benchSymbols import generateWorkspace
+
+from TermTk import TTkTimer
+
+from ttkode.app.cfg import TTKodeCfg
+from ttkode.app.kodebatch import KodeBatch
+
+def bench(paths, output, workers):
+    t = time.perf_counter()
+    size, errors = 0, 0
+    for _, _, fileSize, _, _, error in KodeBatch.highlight(paths, output=output, workers=workers):
+        size += fileSize
+        errors += bool(error)
+    elapsed = time.perf_counter()-t
+    return {'time': elapsed, 'files': len(paths), 'errors': errors, 'size': size,
+            'filesSec': len(paths)/elapsed, 'mbSec': size/elapsed/1e6}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-j', help='workers of each run, 0 is the calling process (default: 0,2,4,cpus-1)',
+                        default=f"0,2,4,{KodeBatch.workers}")
+    parser.add_argument('--files', help='files of the generated workspace (default: 400)', type=int, default=400)
+    parser.add_argument('--lines', help='lines of each generated file (default: 500)', type=int, default=500)
+    parser.add_argument('--json', help='save the results to this file')
+    parser.add_argument('folder', type=str, nargs='?', help='folder highlighted (default: generated workspace)')
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='ttkode-bench-') as tmpPath:
+        TTKodeCfg.pathCfg = os.path.join(tmpPath,'cfg')
+        if not (folder := args.folder):
+            generateWorkspace(folder := os.path.join(tmpPath,'workspace'), args.files, args.lines)
+        paths = [p for p, _ in KodeBatch.files([folder])]
+        print(f"{'output':7} {'workers':>7} {'time s':>8} {'files/s':>9} {'MB/s':>7} {'errors':>6}")
+        for output in KodeBatch.outputs:
+            for workers in sorted({int(j) for j in args.j.split(',')}):
+                r = results[f"{output}-{workers}"] = bench(paths, output, workers)
+                print(f"{output:7} {workers:7} {r['time']:8.2f} {r['filesSec']:9.1f} {r['mbSec']:7.2f} {r['errors']:6}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    TTkTimer.quitAll()
+    sys.exit(1 if any(r['errors'] for r in results.values()) else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Benchmark of the on disk highlight cache (KodeHighlightCache)
+#
+# The corpus of benchHighlight is generated in a temporary folder and each
+# file is opened as TTKode does (cached documents) and measured:
+#   highlight: first open, full highlight and save of the cache entry
+#   cached:    second open, the highlight is loaded from the cache,
+#              the colors and the lexer states are compared with the highlight
+#   corrupted: open with a truncated/garbage entry, it must fall back to
+#              the highlight and replace the entry
+# and finally the entries are evicted with a max size of half the cache
+#
+# Usage:
+#    tools/bench/benchCache.py [--sizes 1000,10000] [--filter REGEX] [--json OUT]
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# benchHighlight sets up the paths and the pseudo terminal
+from benchHighlight import generateCorpus, _highlight
+
+from TermTk import TTkTimer
+
+from ttkode.app.cfg import TTKodeCfg
+from ttkode.app.kodelexer import KodeLexer
+from ttkode.app.kodetextdocument import KodeTextDocument
+from ttkode.app.kodehighlighter import KodeHighlighter
+from ttkode.app.kodehighlightcache import KodeHighlightCache
+
+def _open(filePath):
+    '''Open the document as TTKode does, return (doc, time)'''
+    t = time.perf_counter()
+    with open(filePath) as f:
+        content = f.read()
+    doc = KodeTextDocument(
+                text=content, filePath=filePath, cached=True,
+                lexer=KodeLexer.forFile(filePath, content, guess=False))
+    return doc, time.perf_counter()-t
+
+def _colors(doc):
+    '''Token type of each char and the lexer state of each line'''
+    tokens = doc._formatter.kodeStyle()._tokens
+    return [[tokens[id(c)] for c in l._colors] for l in doc._dataLines], [KodeLexer.state(s) for s in doc._states]
+
+def benchFile(filePath):
+    res = {}
+    entryPath = KodeHighlightCache._entryPath(os.path.realpath(filePath))
+    doc, t = _open(filePath)
+    _, elapsed, _ = _highlight(doc)
+    res['highlight'] = {'time': t+elapsed, 'lines': len(doc._dataLines), 'entry': os.path.getsize(entryPath)}
+    expected = _colors(doc)
+
+    doc, t = _open(filePath)
+    res['cached'] = {'time': t, 'pending': doc._pending(), 'same': _colors(doc) == expected}
+
+    with open(entryPath, 'rb') as f:
+        data = f.read()
+    corrupted = {'truncated': data[:len(data)//2], 'garbage': data[:64] + b'\xff'*(len(data)-64), 'empty': b''}
+    for name, data in corrupted.items():
+        with open(entryPath, 'wb') as f:
+            f.write(data)
+        # Highlighted again and the entry replaced by a valid one
+        doc, t = _open(filePath)
+        fallback = doc._pending()
+        _highlight(doc)
+        expected = _colors(doc)
+        doc, _ = _open(filePath)
+        res[f'corrupted-{name}'] = {'time': t, 'same': fallback and not doc._pending() and _colors(doc) == expected}
+    return res
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', help='lines of the generated files (default: 1000,10000)', default='1000,10000')
+    parser.add_argument('--filter', help='regex of the files measured', default='')
+    parser.add_argument('--json', help='save the results to this file')
+    args = parser.parse_args()
+
+    # The documents are driven calling _refreshEvent directly
+    KodeHighlighter.setEnabled(False)
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='ttkode-bench-') as tmpPath:
+        TTKodeCfg.pathCfg = os.path.join(tmpPath,'cfg')
+        corpus = generateCorpus(tmpPath, [int(s) for s in args.sizes.split(',')])
+        print(f"{'file':24} {'lines':>7} {'highlight ms':>13} {'cached ms':>10} {'entry KB':>9}  same  corrupted")
+        for name, filePath in corpus:
+            if not re.search(args.filter, name):
+                continue
+            r = results[name] = benchFile(filePath)
+            h, c = r['highlight'], r['cached']
+            corrupted = all(v['same'] for k, v in r.items() if k.startswith('corrupted-'))
+            print(f"{name:24} {h['lines']:7} {h['time']*1000:13.1f} {c['time']*1000:10.1f} {h['entry']/1024:9.1f}  "
+                  f"{str(c['same'] and not c['pending']):5} {corrupted}")
+
+        folder = KodeHighlightCache._folder()
+        total = sum(e.stat().st_size for e in os.scandir(folder))
+        TTKodeCfg.options['highlightCacheSize'] = total//2
+        KodeHighlightCache._evict()
+        left = sum(e.stat().st_size for e in os.scandir(folder))
+        results['evict'] = {'before': total, 'after': left, 'max': total//2}
+        print(f"{'evict':24} {total/1024:.1f} KB -> {left/1024:.1f} KB (max {total//2/1024:.1f} KB)")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    TTkTimer.quitAll()
+    ok = all(r['cached']['same'] and not r['cached']['pending'] and
+             all(v['same'] for k, v in r.items() if k.startswith('corrupted-'))
+             for k, r in results.items() if k != 'evict')
+    sys.exit(0 if ok and left <= total//2 else 1)
+
+if __name__ == '__main__':
+    main()
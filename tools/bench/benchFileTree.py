@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Benchmark of the file tree listing (KodeFileTree vs TTkFileTree)
+#
+# A workspace with a big folder, a node_modules folder and a .gitignore
+# is generated and measured:
+#   open:    time spent in the constructor (the UI is blocked) and time
+#            until the root folder is displayed
+#   expand:  time spent in the expand handler of the big folder and
+#            time until its entries are displayed
+#   check:   periodic check of the expanded folders with no changes
+#   walk:    files walked by the indexes, ignore aware walk vs os.walk
+#
+# Usage:
+#    tools/bench/benchFileTree.py [--files N] [--modules N] [--json OUT]
+
+import os
+import sys
+import pty
+import json
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),'../..'))
+
+# TermTk reads the terminal attributes at import time,
+# a pseudo terminal is used as stdin when running without one
+if not os.isatty(0):
+    _, _slave = pty.openpty()
+    os.dup2(_slave, 0)
+
+from TermTk import TTkTimer, TTkFileTree
+
+from ttkode.app.cfg import TTKodeCfg
+from ttkode.app.kodeignore import KodeIgnore
+from ttkode.app.kodefiletree import KodeFileTree, KodeFileTreeWidget
+
+def generateWorkspace(path, files, modules):
+    for folder, count in (('big', files), ('node_modules', modules), ('build', files//10)):
+        os.makedirs(os.path.join(path, folder))
+        for i in range(count):
+            with open(os.path.join(path, folder, f"file{i:06}.js"), 'w') as f:
+                f.write('x')
+    for i in range(100):
+        with open(os.path.join(path, f"top{i:03}.py"), 'w') as f:
+            f.write('x')
+    with open(os.path.join(path, '.gitignore'), 'w') as f:
+        f.write('build/\n*.log\n')
+
+def _wait(fn, timeout=60):
+    t = time.perf_counter()
+    while not fn() and time.perf_counter()-t < timeout:
+        time.sleep(0.001)
+
+def _listed(widget, path):
+    # TTkFileTree lists the folders synchronously
+    return not isinstance(widget, KodeFileTreeWidget) or (path in widget._applied and not widget._requests)
+
+def _item(widget, name):
+    return next(i for i in widget._rootItem.children() if i._raw[0] == name)
+
+def bench(folder):
+    res = {}
+    t = time.perf_counter()
+    files = sum(len(f) for _, _, f in os.walk(folder))
+    res['os.walk'] = {'time': time.perf_counter()-t, 'files': files}
+    t = time.perf_counter()
+    files = sum(1 for _ in KodeIgnore.forRoot(folder).walk())
+    res['KodeIgnore.walk'] = {'time': time.perf_counter()-t, 'files': files}
+    for name, cls in (('TTkFileTree', TTkFileTree), ('KodeFileTree', KodeFileTree)):
+        r = res[name] = {}
+        t = time.perf_counter()
+        tree = cls(path=folder)
+        r['open'] = time.perf_counter()-t
+        widget = tree._fileTreeWidget
+        _wait(lambda: _listed(widget, os.path.realpath(folder)))
+        r['openDisplayed'] = time.perf_counter()-t
+        r['top'] = len(widget._rootItem.children())
+
+        big = _item(widget, 'big')
+        t = time.perf_counter()
+        big.setExpanded(True)
+        widget.itemExpanded.emit(big)
+        r['expand'] = time.perf_counter()-t
+        _wait(lambda: _listed(widget, big.path()))
+        r['expandDisplayed'] = time.perf_counter()-t
+        r['big'] = len(big.children())
+
+        if cls is KodeFileTree:
+            t = time.perf_counter()
+            widget._check()
+            r['check'] = time.perf_counter()-t
+    return res
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', help='files in the big folder (default: 20000)', type=int, default=20000)
+    parser.add_argument('--modules', help='files in node_modules (default: 50000)', type=int, default=50000)
+    parser.add_argument('--json', help='save the results to this file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='ttkode-bench-') as tmpPath:
+        TTKodeCfg.pathCfg = os.path.join(tmpPath,'cfg')
+        generateWorkspace(folder := os.path.join(tmpPath,'workspace'), args.files, args.modules)
+        res = bench(folder)
+
+    for name in ('TTkFileTree', 'KodeFileTree'):
+        r = res[name]
+        print(f"{name:13} open {r['open']*1000:8.1f}ms (displayed {r['openDisplayed']*1000:8.1f}ms, {r['top']} items)  "
+              f"expand {r['expand']*1000:8.1f}ms (displayed {r['expandDisplayed']*1000:8.1f}ms, {r['big']} items)")
+    print(f"{'check':13} {res['KodeFileTree']['check']*1000:8.3f}ms")
+    for name in ('os.walk', 'KodeIgnore.walk'):
+        r = res[name]
+        print(f"{name:15} {r['time']*1000:8.1f}ms  {r['files']} files")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(res, f, indent=2)
+    TTkTimer.quitAll()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Benchmark of the follow mode of KodeTextDocument (a growing log)
+#
+# A writer thread appends log lines to a file at the requested rate
+# while a document follows it keeping at most --max-lines lines,
+# the highlight is driven after each append and measured:
+#   lines/s:  lines ingested per second (written and appended)
+#   append:   mean/max time to splice a batch in the document
+#   lexed:    lines highlighted, only the new ones are expected
+#   memory:   memory of the document (memorySize) at the start and at the end of the run,
+#             bounded by the retained lines (tracemalloc would slow down the appends)
+# the retained lines are compared with the tail of the file.
+#
+# Usage:
+#    tools/bench/benchFollow.py [--rate N] [--time SECS] [--max-lines N] [--json OUT]
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# benchHighlight sets up the paths and the pseudo terminal
+from benchHighlight import _words, _highlight
+
+from TermTk import TTkTimer
+
+from ttkode.app.cfg import TTKodeCfg
+from ttkode.app.kodelexer import KodeLexer
+from ttkode.app.kodetextdocument import KodeTextDocument
+from ttkode.app.kodehighlighter import KodeHighlighter
+from ttkode.app.kodefollow import KodeFileFollower
+
+_levels = ('INFO:', 'DEBUG:', 'DEBUG:', 'DEBUG:', 'ERROR:')
+
+def _logLines(rnd, count):
+    words = _words
+    return ''.join(
+        f"{rnd.choice(_levels)} {time.time():.6f} {' '.join(rnd.choices(words, k=rnd.randint(3,12)))}\n"
+        for _ in range(count))
+
+def _writer(filePath, rate, duration, done):
+    rnd = random.Random(0x2e16)
+    written = 0
+    t0 = time.perf_counter()
+    with open(filePath, 'a') as f:
+        while (elapsed := time.perf_counter()-t0) < duration:
+            if (count := int(elapsed*rate)-written) > 0:
+                f.write(_logLines(rnd, count))
+                f.flush()
+                written += count
+            time.sleep(0.005)
+    done.append(written)
+
+def bench(filePath, rate, duration, maxLines):
+    with open(filePath, 'w') as f:
+        f.write(_logLines(random.Random(0x2e17), 1000))
+    with open(filePath) as f:
+        text = f.read()
+    doc = KodeTextDocument(text=text, filePath=filePath, lexer=KodeLexer.forFile(filePath, text))
+    KodeHighlighter.unregister(doc)
+    _highlight(doc)
+    doc.setStatsEnabled(True)
+
+    appends = []
+    lexed = [0]
+    def _append(text):
+        t = time.perf_counter()
+        doc.appendText(text)
+        appends.append(time.perf_counter()-t)
+        # The lines to be highlighted after each append
+        lexed[0] += sum(1 for d in doc._dirty if d != KodeTextDocument._CLEAN)
+        _highlight(doc)
+
+    mem0 = doc.memorySize()
+    doc.setFollow(True, maxLines=maxLines)
+    doc._follower._callback = _append
+    done = []
+    t0 = time.perf_counter()
+    threading.Thread(target=_writer, args=(filePath, rate, duration, done)).start()
+    # Wait the writer and the follower to read the last bytes
+    while not done or doc._follower.offset() < os.path.getsize(filePath):
+        time.sleep(KodeFileFollower.interval)
+    elapsed = time.perf_counter()-t0
+    doc.setFollow(False)
+    mem1 = doc.memorySize()
+
+    with open(filePath) as f:
+        tail = f.read().split('\n')[-len(doc._dataLines):]
+    return {
+        'written': done[0], 'linesSec': done[0]/elapsed,
+        'appends': len(appends),
+        'appendMean': sum(appends)/max(1,len(appends)), 'appendMax': max(appends, default=0),
+        'lexed': lexed[0], 'lines': len(doc._dataLines),
+        'memStart': mem0, 'memEnd': mem1,
+        'same': [l._text for l in doc._dataLines] == tail }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rate', help='lines written per second (default: 5000)', type=int, default=5000)
+    parser.add_argument('--time', help='seconds of writing (default: 10)', type=float, default=10)
+    parser.add_argument('--max-lines', help='lines kept by the document (default: 20000)', type=int, default=20000)
+    parser.add_argument('--json', help='save the results to this file')
+    args = parser.parse_args()
+
+    # The document is driven calling _refreshEvent directly
+    KodeHighlighter.setEnabled(False)
+    with tempfile.TemporaryDirectory(prefix='ttkode-bench-') as tmpPath:
+        TTKodeCfg.pathCfg = os.path.join(tmpPath,'cfg')
+        res = bench(os.path.join(tmpPath, 'session.log'), args.rate, args.time, args.max_lines)
+
+    print(f"written:  {res['written']} lines, {res['linesSec']:.0f} lines/s")
+    print(f"appends:  {res['appends']}, mean {res['appendMean']*1000:.2f} ms, max {res['appendMax']*1000:.2f} ms")
+    print(f"lexed:    {res['lexed']} lines")
+    print(f"retained: {res['lines']} lines (max {args.max_lines})")
+    print(f"memory:   {res['memStart']/1024/1024:.1f} MB -> {res['memEnd']/1024/1024:.1f} MB")
+    print(f"same:     {res['same']}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(res, f, indent=2)
+    TTkTimer.quitAll()
+    sys.exit(0 if res['same'] and res['lines'] <= args.max_lines else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Micro benchmark of KodeFormatter.format
+#
+# The files are lexed once, the formatter is timed on the
+# stored tokens and the result is reported in tokens/sec,
+# the previous per token implementation is used as reference
+#
+# Usage:
+#    tools/bench/benchFormatter.py [-n RUNS] [file ...]
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),'../..'))
+
+import pygments
+from pygments.lexers import get_lexer_for_filename
+
+from TermTk import TTkString, TTkTimer
+
+from ttkode.app.kodeformatter import KodeFormatter
+from ttkode.app.kodelexer import KodeLexer
+
+# Previous implementation, each token walks the style parents
+# and is appended to the line allocating a new TTkString
+def legacyFormat(formatter, tokens, dl):
+    kodeStyles = formatter.kodeStyle()._colors
+    for ttype, value in tokens:
+        while ttype not in kodeStyles:
+            ttype = ttype.parent
+        color = kodeStyles[ttype]
+        values = value.split('\n')
+        dl.lines[-1] += TTkString(values[0],color)
+        dl.lines += [TTkString(t,color) for t in values[1:]]
+
+def bench(fun, runs):
+    best = None
+    for _ in range(runs):
+        t = time.perf_counter()
+        fun()
+        t = time.perf_counter() - t
+        best = t if best is None else min(best, t)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', help='runs (default: 5)', type=int, default=5)
+    parser.add_argument('files', type=str, nargs='*', help='the file/s to be formatted',
+                        default=[os.path.join(os.path.dirname(pygments.__file__),'lexer.py')])
+    args = parser.parse_args()
+
+    for fileName in args.files:
+        with open(fileName) as f:
+            text = f.read()
+        lexer = KodeLexer(get_lexer_for_filename(fileName))
+        tokens = list(lexer.tokens(text, KodeLexer.ROOT, []))
+
+        formatter = KodeFormatter(style='gruvbox-dark')
+        def _new():
+            formatter.setDl(KodeFormatter.Data([], [KodeLexer.ROOT]))
+            formatter.format(tokens, None)
+        def _legacy():
+            legacyFormat(formatter, tokens, KodeFormatter.Data([TTkString()], [KodeLexer.ROOT]))
+
+        tNew    = bench(_new,    args.n)
+        tLegacy = bench(_legacy, args.n)
+        print(f"{os.path.basename(fileName)}: {len(tokens)} tokens, {text.count(chr(10))} lines")
+        print(f"  legacy: {len(tokens)/tLegacy:12.0f} tokens/sec ({tLegacy*1000:.1f} ms)")
+        print(f"  new:    {len(tokens)/tNew:12.0f} tokens/sec ({tNew*1000:.1f} ms) x{tLegacy/tNew:.2f}")
+
+    TTkTimer.quitAll()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Headless benchmark suite of the KodeTextDocument highlight
+#
+# A synthetic corpus (several languages and sizes plus pathological inputs)
+# is generated in a temporary folder with a fixed seed, the document timer
+# is stopped and _refreshEvent is driven directly, measuring:
+#
+#   full:      whole file highlight (lines/sec, MB/sec, refresh count)
+#   key-*:     one char typed at the start/middle/end of the highlighted file,
+#              time to the first refresh of the displayed lines and to the
+#              convergence of the whole file
+#   quote-*:   same, typing a string delimiter that changes the lexer state
+#              of all the following lines
+#   paste:     1000 lines pasted in the middle of the file
+#   stats:     (--stats) KodeTextDocument stats of the full highlight
+#
+# The results are saved in json (--json) and can be compared with the
+# ones of another revision (--compare)
+#
+# Usage:
+#    tools/bench/benchHighlight.py [-n RUNS] [--sizes 1000,10000] [--filter REGEX] [--json OUT] [--compare OLD]
+
+import os
+import re
+import sys
+import pty
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+
+repoPath = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)),'../..'))
+sys.path.insert(0, repoPath)
+
+# TermTk reads the terminal attributes at import time,
+# a pseudo terminal is used as stdin when running without one
+if not os.isatty(0):
+    _, _slave = pty.openpty()
+    os.dup2(_slave, 0)
+
+import pygments
+
+from TermTk import TTkString, TTkTimer, TTkTextCursor
+
+from ttkode.app.cfg import TTKodeCfg
+from ttkode.app.kodelexer import KodeLexer
+from ttkode.app.kodetextdocument import KodeTextDocument
+from ttkode.app.kodehighlighter import KodeHighlighter
+
+# Snippets used to generate the corpus,
+# {a},{b} = identifiers, {n} = number, {s} = words
+_snippets = {
+    'py': [
+        'def {a}(self, {b}, n={n}):\n    """{s}"""\n    if {b} is None:\n        return [x*{n} for x in range(n)]\n    return {{"{a}": {b}, "n": n}}\n\n',
+        'class {A}({B}):\n    __slots__ = ("_{a}", "_{b}")\n    def __init__(self, *args, **kwargs):\n        super().__init__(*args, **kwargs)\n        self._{a} = kwargs.get("{a}", {n})\n\n',
+        '# {s}\n{a} = [{n}, 0x{n:x}, {n}.5, "{s}", \'{b}\', f"{{{a}}} {s}"]\n',
+        'try:\n    {a}.{b}({n})\nexcept (ValueError, KeyError) as e:\n    raise RuntimeError(f"{s} {{e}}")\n',
+        '@staticmethod\ndef _{a}({b}):\n    \'\'\'{s}\n    {s}\n    \'\'\'\n    while {b} < {n}:\n        {b} += 1\n    return {b}\n\n' ],
+    'c': [
+        '/* {s}\n * {s}\n */\nstatic int {a}(struct {b} *p, int n)\n{{\n    for (int i = 0; i < n; i++) {{\n        p->{a}[i] = i * {n};\n    }}\n    return 0;\n}}\n\n',
+        '#define {A}_MAX ({n})\ntypedef struct {b} {{\n    char name[{A}_MAX]; // {s}\n    unsigned long {a};\n}} {b}_t;\n\n',
+        'const char *{a} = "{s} %d\\n";\nint {b}[{n}] = {{ {n}, 0x{n:x}, \'x\' }};\n',
+        '#include <{a}.h>\n#if defined({A})\nextern void {b}(void);\n#endif\n' ],
+    'js': [
+        'function {a}({b}, n = {n}) {{\n  // {s}\n  return {b}.map((x) => x * n).filter(Boolean);\n}}\n\n',
+        'class {A} extends {B} {{\n  constructor(...args) {{\n    super(...args);\n    this.{a} = `{s} ${{args.length}}`;\n  }}\n}}\n\n',
+        'const {a} = {{ "{b}": {n}, re: /{b}[0-9]+/g, s: \'{s}\' }};\n/* {s} */\n',
+        'export async function {a}() {{\n  const r = await fetch("/{b}/{n}");\n  return r.json();\n}}\n' ],
+    'html': [
+        '<div class="{a}" id="{b}{n}">\n  <p>{s}</p>\n  <a href="/{a}/{n}">{b}</a>\n</div>\n',
+        '<!-- {s} -->\n<ul>\n  <li data-n="{n}">{a}</li>\n  <li>{b}</li>\n</ul>\n',
+        '<script>\n  var {a} = {n}; // {s}\n</script>\n<style>\n  .{a} {{ color: #{n:06x}; }}\n</style>\n' ],
+    'json': [
+        '  "{a}{n}": {{\n    "{b}": [{n}, {n}.25, true, null],\n    "text": "{s}"\n  }},\n' ],
+    'sql': [
+        'SELECT {a}.{b}, COUNT(*) AS n\n  FROM {a}\n  JOIN {b} ON {a}.id = {b}.{a}_id\n WHERE {a}.v > {n} AND {b}.s = \'{s}\'\n GROUP BY {a}.{b};\n',
+        '-- {s}\nINSERT INTO {a} ({b}, n) VALUES (\'{s}\', {n});\n',
+        'CREATE TABLE {a} (\n  id INTEGER PRIMARY KEY,\n  {b} VARCHAR({n}) NOT NULL /* {s} */\n);\n' ],
+    'sh': [
+        '# {s}\n{a}() {{\n  local {b}="$1"\n  if [ -z "${b}" ]; then\n    echo "{s}" >&2\n    return {n}\n  fi\n}}\n\n',
+        'for {a} in $(seq 1 {n}); do\n  {b}="${{{b}}}:${a}" # {s}\ndone\n',
+        'cat <<EOF > /tmp/{a}\n{s}\n{s}\nEOF\n' ],
+    'md': [
+        '## {A} {n}\n\n{s} **{b}** _{a}_ `{a}({n})`\n\n- {s}\n- [{b}](http://{a}/{n})\n\n',
+        '```python\ndef {a}():\n    return {n}\n```\n\n> {s}\n\n' ],
+    'rb': [
+        'def {a}({b}, n = {n})\n  # {s}\n  text = <<~EOS\n    {s}\n    #{{{b}}} "{a}" {n}\n  EOS\n  {b}.map {{ |x| x * n }}\nend\n\n',
+        'class {A} < {B}\n  attr_reader :{a}, :{b}\n  def initialize(*args)\n    @{a} = %w[{s}]\n    @{b} = "{s} #{{args.size}}"\n  end\nend\n\n',
+        '=begin\n{s}\n{s}\n=end\n{A}_MAX = {n} # {s}\n' ],
+}
+_words = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod '
+          'tempor incididunt ut labore et dolore magna aliqua').split()
+
+def _generate(rnd, lang, lines):
+    out = []
+    count = 0
+    if lang == 'json':
+        out.append('{\n')
+    while count < lines:
+        a, b = rnd.choice(_words)+str(rnd.randint(0,99)), rnd.choice(_words)
+        chunk = rnd.choice(_snippets[lang]).format(
+            a=a, b=b, A=a.capitalize(), B=b.capitalize(),
+            n=rnd.randint(0,65535), s=' '.join(rnd.choices(_words, k=rnd.randint(2,10))))
+        out.append(chunk)
+        count += chunk.count('\n')
+    if lang == 'json':
+        out.append('  "end": 0\n}\n')
+    return ''.join(out)
+
+def generateCorpus(path, sizes):
+    '''Write the corpus files in path, return [(name, filePath)]'''
+    rnd = random.Random(0x7743)
+    ret = []
+    def _write(name, text):
+        filePath = os.path.join(path, name)
+        with open(filePath, 'w') as f:
+            f.write(text)
+        ret.append((name, filePath))
+    for size in sizes:
+        for lang in _snippets:
+            _write(f"{lang}-{size}.{lang}", _generate(rnd, lang, size))
+    size = max(sizes)
+    # Pathological inputs
+    _write("unterminated-string.py", '"""\n' + _generate(rnd, 'py', size))
+    _write("unterminated-comment.c", '/*\n' + _generate(rnd, 'c', size))
+    _write("huge-comment.c", '/*\n' + ' * comment\n'*size + ' */\n' + _generate(rnd, 'c', 1000))
+    _write("long-lines.js", ''.join(_generate(rnd, 'js', 200).replace('\n',' ')+'\n' for _ in range(size//1000+1)))
+    return ret
+
+class _View():
+    '''Placeholder of a KodeTextEditView displaying [fr,fr+height)'''
+    height = 40
+
+def _highlight(doc, view=None, line=0):
+    '''Drive the highlight until completion,
+    return (time to the first displayed refresh, total time, refreshes)'''
+    if view:
+        fr = max(0, line-_View.height//2)
+        doc._views[view] = (fr, fr+_View.height)
+    refreshes = 0
+    first = None
+    t = time.perf_counter()
+    while doc._pending():
+        doc._refreshEvent()
+        refreshes += 1
+        if first is None and (not view or doc._viewDirty(*doc._views[view]) is None):
+            first = time.perf_counter()-t
+    return first or 0.0, time.perf_counter()-t, refreshes
+
+def _newDoc(text, filePath):
+    doc = KodeTextDocument(text=text, filePath=filePath, lexer=KodeLexer.forFile(filePath, text))
+    KodeHighlighter.unregister(doc)
+    return doc
+
+def _edit(doc, line, pos, text):
+    cursor = TTkTextCursor(document=doc)
+    with doc.getLock():
+        cursor.setPosition(line, pos)
+        cursor.insertText(TTkString(text))
+
+def benchFile(name, filePath, runs, stats=False):
+    with open(filePath) as f:
+        text = f.read()
+    lines = text.count('\n')+1
+    res = {'lines':lines, 'bytes':len(text.encode())}
+    lexer = KodeLexer.forFile(filePath, text)
+    res['lexer'] = lexer.name()
+    res['resumable'] = lexer.isResumable()
+
+    best = None
+    for _ in range(runs):
+        doc = _newDoc(text, filePath)
+        _, total, refreshes = _highlight(doc)
+        best = total if best is None else min(best, total)
+    res['full'] = {
+        'time':best, 'refreshes':refreshes,
+        'linesSec':lines/best, 'mbSec':res['bytes']/best/1e6 }
+    if stats:
+        # Extra run with the document stats, it is not timed
+        doc = _newDoc(text, filePath)
+        doc.setStatsEnabled()
+        _highlight(doc)
+        res['stats'] = doc.stats().summary()
+
+    # Edits on a fully highlighted document displayed around the edited line
+    quote = {'py':'"""', 'c':'/*', 'js':'`', 'html':'<!--', 'sql':"'", 'sh':'"', 'md':'```', 'json':'"'}
+    ext = filePath.rsplit('.',1)[-1]
+    cases = [
+        ('key-start',  0,        'x'),
+        ('key-middle', lines//2, 'x'),
+        ('key-end',    lines-1,  'x'),
+        ('quote-start',  0,        quote.get(ext,'"')),
+        ('quote-middle', lines//2, quote.get(ext,'"')) ]
+    paste = '\n'.join(text.split('\n')[:1000])+'\n'
+    cases.append(('paste', lines//2, paste))
+    for case, line, insert in cases:
+        best = None
+        for _ in range(runs):
+            doc = _newDoc(text, filePath)
+            _highlight(doc)
+            view = _View()
+            _edit(doc, line, 0, insert)
+            r = _highlight(doc, view, line)
+            best = r if best is None or r[1] < best[1] else best
+        res[case] = {'first':best[0], 'time':best[1], 'refreshes':best[2]}
+    return res
+
+def _revision():
+    try:
+        return subprocess.run(['git','describe','--always','--dirty'], cwd=repoPath,
+                              capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ''
+
+def report(results, old):
+    def _cmp(key, case, field):
+        try:
+            if old['results'][key]['lines'] != results[key]['lines']:
+                return ''
+            prev = old['results'][key][case][field]
+            new  = results[key][case][field]
+            return f" x{prev/new:5.2f}" if new else ''
+        except (KeyError, TypeError):
+            return ''
+    if old:
+        print(f"xN = speedup compared to {old['meta']['revision']}")
+    print(f"{'file':28} {'lexer':12} {'lines/sec':>10} {'MB/sec':>7}   {'case':13} {'first ms':>9} {'total ms':>9} {'refr':>5}")
+    for key, res in results.items():
+        full = res['full']
+        print(f"{key:28} {res['lexer'][:12]:12} {full['linesSec']:10.0f} {full['mbSec']:7.2f}"
+              f"{_cmp(key,'full','time')}")
+        for case, r in res.items():
+            if not isinstance(r, dict) or case in ('full','stats'):
+                continue
+            print(f"{'':61}{case:13} {r['first']*1000:9.1f} {r['time']*1000:9.1f} {r['refreshes']:5}{_cmp(key,case,'time')}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', help='runs, the best one is reported (default: 1)', type=int, default=1)
+    parser.add_argument('--sizes', help='lines of the generated files (default: 1000,10000)', default='1000,10000')
+    parser.add_argument('--filter', help='regex, run only the matching files')
+    parser.add_argument('--stats', help='add the KodeTextDocument stats of the full highlight', action='store_true')
+    parser.add_argument('--corpus', help='keep the generated corpus in this folder')
+    parser.add_argument('--json', help='save the results to this file')
+    parser.add_argument('--compare', help='results file of a previous run')
+    args = parser.parse_args()
+
+    # The documents are driven calling _refreshEvent directly
+    KodeHighlighter.setEnabled(False)
+    sizes = [int(s) for s in args.sizes.split(',')]
+    with tempfile.TemporaryDirectory(prefix='ttkode-bench-') as tmpPath:
+        corpusPath = args.corpus or os.path.join(tmpPath,'corpus')
+        TTKodeCfg.pathCfg = os.path.join(tmpPath,'cfg')
+        os.makedirs(corpusPath, exist_ok=True)
+        results = {}
+        for name, filePath in generateCorpus(corpusPath, sizes):
+            if args.filter and not re.search(args.filter, name):
+                continue
+            results[name] = benchFile(name, filePath, args.n, args.stats)
+            print(f"{name}: {results[name]['full']['linesSec']:.0f} lines/sec", file=sys.stderr)
+
+    old = None
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+    report(results, old)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'meta': {
+                    'revision': _revision(),
+                    'python':   platform.python_version(),
+                    'pygments': pygments.__version__,
+                    'sizes':    sizes, 'runs': args.n,
+                    'date':     time.strftime('%Y-%m-%d %H:%M:%S') },
+                'results': results }, f, indent=2)
+
+    TTkTimer.quitAll()
+
+if __name__ == '__main__':
+    main()
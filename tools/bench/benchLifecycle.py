@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Benchmark of the document lifecycle (KodeTextDocument.evict/close)
+#
+# Few python files of the benchHighlight generator are opened and highlighted,
+# then KodeHighlighter.trim evicts the least recently used ones and measured:
+#   memory:    traced bytes of the documents highlighted, trimmed and closed
+#   estimate:  the same estimated by KodeTextDocument.memorySize
+#   trim:      time of KodeHighlighter.trim at a tab change (evicting and not)
+#   rehydrate: time to display again an evicted document, with the
+#              highlight loaded from KodeHighlightCache and lexed again
+#              from the kept states (first view and whole document)
+# the rehydrated lines are compared with the original highlight.
+#
+# Usage:
+#    tools/bench/benchLifecycle.py [--files N] [--lines N] [--json OUT]
+
+import os
+import sys
+import gc
+import json
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# benchHighlight sets up the paths and the pseudo terminal
+from benchHighlight import _generate, _highlight
+
+from TermTk import TTkTimer
+
+from ttkode.app.cfg import TTKodeCfg
+from ttkode.app.kodelexer import KodeLexer
+from ttkode.app.kodetextdocument import KodeTextDocument
+from ttkode.app.kodehighlighter import KodeHighlighter
+from ttkode.app.kodesymbols import KodeSymbolIndex
+
+class _View():
+    '''Placeholder of a KodeTextEditView, displayed or in a hidden tab'''
+    height = 40
+    def __init__(self):
+        self.visible = False
+    def isVisibleAndParent(self):
+        return self.visible
+
+def _traced():
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+def _open(filePath, cached):
+    with open(filePath) as f:
+        text = f.read()
+    doc = KodeTextDocument(text=text, filePath=filePath, cached=cached, lexer=KodeLexer.forFile(filePath, text))
+    view = _View()
+    doc._views[view] = (0, _View.height)
+    return doc, view
+
+def _lines(doc):
+    return [(l._text, l._colors) for l in doc._dataLines]
+
+def _rehydrate(filePath, cached):
+    '''Display again an evicted document, return (first view time, total time, same highlight)'''
+    doc, view = _open(filePath, cached)
+    _highlight(doc)
+    original = _lines(doc)
+    doc.evict()
+    view.visible = True
+    t = time.perf_counter()
+    doc.setVisibleRange(view, 0, _View.height)
+    t = time.perf_counter()-t
+    first, total, _ = _highlight(doc, view)
+    same = _lines(doc) == original
+    doc.close()
+    return t+first, t+total, same
+
+def bench(tmpPath, files, lines):
+    rnd = random.Random(0x11fe)
+    paths = []
+    for i in range(files):
+        paths.append(filePath := os.path.join(tmpPath, f"file{i}.py"))
+        with open(filePath, 'w') as f:
+            f.write(_generate(rnd, 'py', lines))
+
+    # The lexer and the formatter modules are loaded before tracing
+    doc, _ = _open(paths[0], cached=False)
+    doc.close()
+
+    tracemalloc.start()
+    base = _traced()
+    docs = []
+    for filePath in paths:
+        doc, _ = _open(filePath, cached=True)
+        _highlight(doc)
+        docs.append(doc)
+    res = {'highlighted': _traced()-base,
+           'estimate':    sum(doc.memorySize() for doc in docs)}
+
+    # Only the most recent document fits
+    KodeHighlighter.setActive(docs[-1])
+    t = time.perf_counter()
+    kept = KodeHighlighter.trim(docs[-1].memorySize())
+    res['trim'] = time.perf_counter()-t
+    res['trimmed'] = _traced()-base
+    res['trimmedEstimate'] = kept
+    res['evicted'] = sum(doc.evicted() for doc in docs)
+    # The next tab change, nothing left to evict
+    t = time.perf_counter()
+    KodeHighlighter.trim(docs[-1].memorySize())
+    res['retrim'] = time.perf_counter()-t
+
+    for doc in docs:
+        doc.close()
+    del doc, docs
+    res['closed'] = _traced()-base
+    res['live'] = len(KodeSymbolIndex._live)
+    tracemalloc.stop()
+
+    # The highlight saved in the cache by the previous documents
+    # and lexed again from the states kept by the evicted document
+    res['cached'] = _rehydrate(paths[0], cached=True)
+    res['lexed']  = _rehydrate(paths[1], cached=False)
+    res['same'] = res['cached'][2] and res['lexed'][2]
+    return res
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', help='documents opened (default: 5)', type=int, default=5)
+    parser.add_argument('--lines', help='lines of each document (default: 10000)', type=int, default=10000)
+    parser.add_argument('--json', help='save the results to this file')
+    args = parser.parse_args()
+
+    # The documents are driven calling _refreshEvent directly
+    KodeHighlighter.setEnabled(False)
+    with tempfile.TemporaryDirectory(prefix='ttkode-bench-') as tmpPath:
+        TTKodeCfg.pathCfg = os.path.join(tmpPath,'cfg')
+        res = bench(tmpPath, args.files, args.lines)
+
+    print(f"{'documents':12} {'traced MB':>10} {'estimate MB':>12}")
+    print(f"{'highlighted':12} {res['highlighted']/1e6:10.1f} {res['estimate']/1e6:12.1f}")
+    print(f"{'trimmed':12} {res['trimmed']/1e6:10.1f} {res['trimmedEstimate']/1e6:12.1f}   {res['evicted']} evicted in {res['trim']*1000:.1f}ms (traced)")
+    print(f"{'':12} {'':10} {'':12}   trimmed again in {res['retrim']*1000:.2f}ms (traced)")
+    print(f"{'closed':12} {res['closed']/1e6:10.1f} {'':12}   {res['live']} live in the symbol index")
+    print(f"{'rehydrate':12} {'view ms':>10} {'total ms':>12}")
+    for name in ('cached', 'lexed'):
+        print(f"{name:12} {res[name][0]*1000:10.1f} {res[name][1]*1000:12.1f}")
+    print(f"same highlight: {res['same']}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(res, f, indent=2)
+    TTkTimer.quitAll()
+    sys.exit(0 if res['same'] and res['evicted'] == args.files-1 and not res['live'] else 1)
+
+if __name__ == '__main__':
+    main()
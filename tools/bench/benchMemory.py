@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Memory/Speed benchmark of the per line highlight metadata
+#
+# The lexer states of a highlighted python file are repeated up to the
+# requested number of lines and stored in the two layouts:
+#   list:  a tuple (or None) per line and a list of ints (the previous one)
+#   array: interned state ids in array('i') and a bytearray (KodeTextDocument)
+# For each layout the memory is measured with tracemalloc and the
+# operations done by KodeTextDocument are timed:
+#   splice:  100 lines inserted and removed in the middle (an edit)
+#   pending: scan of a fully highlighted document for dirty lines
+#   view:    dirty lines lookup in the last 100 lines
+#
+# Usage:
+#    tools/bench/benchMemory.py [--lines N,...] [-n RUNS] [--json OUT]
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+from array import array
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# benchHighlight sets up the paths and the pseudo terminal
+from benchHighlight import generateCorpus, _newDoc, _highlight
+
+from TermTk import TTkTimer
+
+from ttkode.app.cfg import TTKodeCfg
+from ttkode.app.kodelexer import KodeLexer
+from ttkode.app.kodetextdocument import KodeTextDocument
+from ttkode.app.kodehighlighter import KodeHighlighter
+
+_CLEAN = KodeTextDocument._CLEAN
+_DIRTY = KodeTextDocument._DIRTY
+
+def _sampleStates(tmpPath):
+    '''Lexer states at the beginning of each line of a highlighted python file'''
+    filePath = dict(generateCorpus(tmpPath, [10000]))['py-10000.py']
+    with open(filePath) as f:
+        doc = _newDoc(f.read(), filePath)
+    _highlight(doc)
+    return [KodeLexer.state(sid) for sid in doc._states]
+
+def _buildList(sample, lines):
+    # The lexer produced a new tuple for each line
+    states = [None if s is None else tuple(list(s)) for s in (sample*(lines//len(sample)+1))[:lines]]
+    dirty  = [_CLEAN]*lines
+    return states, dirty
+
+def _buildArray(sample, lines):
+    ids = array('i', [KodeLexer.stateId(s) for s in sample])
+    states = (ids*(lines//len(ids)+1))[:lines]
+    dirty  = bytearray([_CLEAN])*lines
+    return states, dirty
+
+def _listOps(states, dirty):
+    def splice():
+        a = len(states)//2
+        states[a:a] = [None]*100
+        dirty[a:a]  = [_DIRTY]*100
+        del states[a:a+100]
+        del dirty[a:a+100]
+    def pending():
+        return any(dirty)
+    def view():
+        try:
+            return dirty.index(_DIRTY, len(dirty)-100, len(dirty))
+        except ValueError:
+            return None
+    return splice, pending, view
+
+def _arrayOps(states, dirty):
+    def splice():
+        a = len(states)//2
+        states[a:a] = array('i', [KodeLexer.NOSTATE])*100
+        dirty[a:a]  = bytearray([_DIRTY])*100
+        del states[a:a+100]
+        del dirty[a:a+100]
+    def pending():
+        for status in (KodeTextDocument._GUESSED, _DIRTY):
+            try:
+                return dirty.index(status) >= 0
+            except ValueError:
+                pass
+        return False
+    def view():
+        try:
+            return dirty.index(_DIRTY, len(dirty)-100, len(dirty))
+        except ValueError:
+            return None
+    return splice, pending, view
+
+def _time(fn, runs):
+    best = None
+    for _ in range(runs):
+        t = time.perf_counter()
+        fn()
+        t = time.perf_counter()-t
+        best = t if best is None else min(best, t)
+    return best
+
+def benchLayout(name, build, ops, sample, lines, runs):
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    t = time.perf_counter()
+    states, dirty = build(sample, lines)
+    buildTime = time.perf_counter()-t
+    mem = tracemalloc.get_traced_memory()[0]-base
+    tracemalloc.stop()
+    splice, pending, view = ops(states, dirty)
+    return {
+        'memory':  mem,
+        'build':   buildTime,
+        'splice':  _time(splice, runs),
+        'pending': _time(pending, runs),
+        'view':    _time(view, runs) }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', help='runs of each operation, the best one is reported (default: 20)', type=int, default=20)
+    parser.add_argument('--lines', help='lines of the document (default: 100000,1000000)', default='100000,1000000')
+    parser.add_argument('--json', help='save the results to this file')
+    args = parser.parse_args()
+
+    # The sample document is driven calling _refreshEvent directly
+    KodeHighlighter.setEnabled(False)
+    with tempfile.TemporaryDirectory(prefix='ttkode-bench-') as tmpPath:
+        TTKodeCfg.pathCfg = os.path.join(tmpPath,'cfg')
+        sample = _sampleStates(tmpPath)
+
+    results = {}
+    print(f"{'lines':>9} {'layout':7} {'memory MB':>10} {'bytes/line':>10} {'build ms':>9} {'splice ms':>10} {'pending ms':>11} {'view us':>8}")
+    for lines in [int(l) for l in args.lines.split(',')]:
+        for name, build, ops in (('list', _buildList, _listOps), ('array', _buildArray, _arrayOps)):
+            r = results[f"{name}-{lines}"] = benchLayout(name, build, ops, sample, lines, args.n)
+            print(f"{lines:9} {name:7} {r['memory']/1e6:10.1f} {r['memory']/lines:10.1f} {r['build']*1000:9.1f} "
+                  f"{r['splice']*1000:10.3f} {r['pending']*1000:11.3f} {r['view']*1e6:8.1f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    TTkTimer.quitAll()
+
+if __name__ == '__main__':
+    main()
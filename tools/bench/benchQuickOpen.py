@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Benchmark of the Quick Open path index (KodePathIndex)
+#
+# A list of paths is generated with a fixed seed (or the files of an
+# existing folder are used) and measured:
+#   build:  time and memory of the search tables
+#   typing: each query is typed one char at a time, the time of
+#           each keystroke is reported (median/max)
+# The paths found are compared with a naive scan (the query chars
+# in order) with no limit on the results.
+#
+# Usage:
+#    tools/bench/benchQuickOpen.py [--paths N] [--limit N] [--json OUT] [folder]
+
+import os
+import sys
+import pty
+import json
+import time
+import random
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),'../..'))
+
+# TermTk reads the terminal attributes at import time,
+# a pseudo terminal is used as stdin when running without one
+if not os.isatty(0):
+    _, _slave = pty.openpty()
+    os.dup2(_slave, 0)
+
+from TermTk import TTkTimer
+
+from ttkode.app.kodequickopen import KodePathIndex, KodeQuickOpenWindow, _KodePathTable
+
+_queries = ('kodetextedit', 'main.py', 'tree', 'src/util/help', 'wdgmdl', 'render999', 'zzqx', 'readme')
+
+_words = ('src', 'lib', 'test', 'core', 'util', 'widgets', 'model', 'view', 'app', 'internal', 'render',
+          'io', 'net', 'http', 'parser', 'lexer', 'tree', 'file', 'kode', 'text', 'edit', 'main', 'helper')
+_exts = ('.py', '.js', '.c', '.h', '.md', '.json', '.ts')
+
+def generatePaths(count):
+    rnd = random.Random(0x9a7b)
+    paths = set()
+    while len(paths) < count:
+        folder = '/'.join(rnd.choice(_words) for _ in range(rnd.randint(1,6)))
+        paths.add(f"{folder}/{rnd.choice(_words)}{rnd.choice(_words)}{rnd.randint(0,999)}{rnd.choice(_exts)}")
+    return list(paths)
+
+def _naive(paths, query):
+    def _match(path):
+        pos = 0
+        for c in query:
+            if (pos := path.find(c, pos)+1) == 0:
+                return False
+        return True
+    return {p for p in paths if _match(p.lower())}
+
+def bench(paths, limit):
+    res = {}
+    tracemalloc.start()
+    t = time.perf_counter()
+    table = _KodePathTable()
+    for _ in table._build(paths):
+        pass
+    res['build'] = {'time': time.perf_counter()-t, 'memory': tracemalloc.get_traced_memory()[0], 'paths': len(table)}
+    tracemalloc.stop()
+    KodePathIndex._table = table
+
+    every = []
+    for query in _queries:
+        times = []
+        for i in range(1, len(query)+1):
+            t = time.perf_counter()
+            found = KodePathIndex.find(query[:i], limit)
+            times.append(time.perf_counter()-t)
+        every += times
+        times.sort()
+        # The results narrowed while typing are the ones of the full search
+        same = ({p for p, _ in table.find(query, len(paths))[0]} == _naive(paths, query) and
+                [p for p, _ in found] == [p for p, _ in table.find(query, limit)[0]])
+        res[f"query-{query}"] = {'median': times[len(times)//2], 'max': times[-1], 'found': len(found), 'same': same}
+    every.sort()
+    res['keystrokes'] = {'median': every[len(every)//2], 'p95': every[len(every)*95//100], 'max': every[-1]}
+    return res
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--paths', help='generated paths (default: 100000)', type=int, default=100000)
+    parser.add_argument('--limit', help=f'results of each query (default: {KodeQuickOpenWindow.maxResults})', type=int, default=KodeQuickOpenWindow.maxResults)
+    parser.add_argument('--json', help='save the results to this file')
+    parser.add_argument('folder', type=str, nargs='?', help='folder indexed (default: generated paths)')
+    args = parser.parse_args()
+
+    if args.folder:
+        KodePathIndex.scan(args.folder)
+        paths = KodePathIndex._table.paths()
+    else:
+        paths = generatePaths(args.paths)
+    res = bench(paths, args.limit)
+
+    b = res['build']
+    print(f"{'build':16} {b['time']:8.2f}s  {b['paths']} paths, {b['memory']/1e6:.1f} MB")
+    for query in _queries:
+        r = res[f"query-{query}"]
+        print(f"{query:16} median {r['median']*1000:6.2f}ms  max {r['max']*1000:6.2f}ms  {r['found']:3} results  same:{r['same']}")
+    k = res['keystrokes']
+    print(f"{'keystrokes':16} median {k['median']*1000:6.2f}ms  p95 {k['p95']*1000:6.2f}ms  max {k['max']*1000:6.2f}ms")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(res, f, indent=2)
+    TTkTimer.quitAll()
+    sys.exit(0 if all(r['same'] for k, r in res.items() if k.startswith('query-')) else 1)
+
+if __name__ == '__main__':
+    main()
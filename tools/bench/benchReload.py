@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Benchmark of the reload of the files changed on disk (KodeFileWatcher)
+#
+# A python file of the benchHighlight corpus is opened and highlighted,
+# then it is rewritten on disk (in place and replaced by a rename like
+# git does) with few kinds of changes and measured:
+#   detect:  time from the write to the watcher callback
+#   reload:  time to diff and apply the changed hunks to the document
+#   dirty:   lines to be highlighted again (the whole file without the diff)
+# the reloaded text is compared with the file.
+#
+# Usage:
+#    tools/bench/benchReload.py [--lines N] [--poll] [--json OUT]
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# benchHighlight sets up the paths and the pseudo terminal
+from benchHighlight import _generate, _highlight
+
+from TermTk import TTkTimer
+
+from ttkode.app.cfg import TTKodeCfg
+from ttkode.app.kodelexer import KodeLexer
+from ttkode.app.kodetextdocument import KodeTextDocument
+from ttkode.app.kodehighlighter import KodeHighlighter
+from ttkode.app.kodewatcher import KodeFileWatcher
+
+def _changes(rnd, lines):
+    '''{name:function(lines)->lines} of the changes applied to the file'''
+    def _edit(lines):
+        lines = lines.copy()
+        for i in rnd.sample(range(len(lines)), 5):
+            lines[i] = lines[i] + '  # changed'
+        return lines
+    def _insert(lines):
+        i = len(lines)//3
+        return lines[:i] + _generate(rnd, 'py', 100).split('\n') + lines[i:]
+    def _delete(lines):
+        i = len(lines)//2
+        return lines[:i] + lines[i+200:]
+    def _append(lines):
+        return lines + _generate(rnd, 'py', 50).split('\n')
+    return {'edit':_edit, 'insert':_insert, 'delete':_delete, 'append':_append}
+
+def _write(filePath, text, rename):
+    if rename:
+        with open(filePath+'.new', 'w') as f:
+            f.write(text)
+        os.replace(filePath+'.new', filePath)
+    else:
+        with open(filePath, 'w') as f:
+            f.write(text)
+
+def bench(filePath, lines):
+    rnd = random.Random(0x2e10)
+    res = {}
+    with open(filePath) as f:
+        text = f.read()
+    doc = KodeTextDocument(text=text, filePath=filePath, lexer=KodeLexer.forFile(filePath, text))
+    KodeHighlighter.unregister(doc)
+    _highlight(doc)
+
+    changed = threading.Event()
+    times = {}
+    def _changed(path):
+        times['detect'] = time.perf_counter()
+        t = time.perf_counter()
+        times['reloaded'] = doc.reloadFile()
+        times['reload'] = time.perf_counter()-t
+        changed.set()
+    KodeFileWatcher.watch(filePath, _changed)
+
+    for i, (name, change) in enumerate(_changes(rnd, lines).items()):
+        new = change(text.split('\n'))
+        text = '\n'.join(new)
+        changed.clear()
+        # The mtime granularity of some file systems
+        time.sleep(0.02)
+        t = time.perf_counter()
+        _write(filePath, text, rename=i%2)
+        if not changed.wait(10):
+            res[name] = {'detected': False}
+            continue
+        dirty = sum(1 for d in doc._dirty if d != KodeTextDocument._CLEAN)
+        same = [l._text for l in doc._dataLines] == new
+        _highlight(doc)
+        res[name] = {
+            'detected': True, 'reloaded': times['reloaded'], 'same': same,
+            'detect': times['detect']-t, 'reload': times['reload'],
+            'dirty': dirty, 'lines': len(new) }
+    KodeFileWatcher.unwatch(filePath)
+    return res
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lines', help='lines of the generated file (default: 10000)', type=int, default=10000)
+    parser.add_argument('--poll', help='poll the file instead of using inotify', action='store_true')
+    parser.add_argument('--json', help='save the results to this file')
+    args = parser.parse_args()
+
+    # The document is driven calling _refreshEvent directly
+    KodeHighlighter.setEnabled(False)
+    if args.poll:
+        KodeFileWatcher._inotify = False
+    with tempfile.TemporaryDirectory(prefix='ttkode-bench-') as tmpPath:
+        TTKodeCfg.pathCfg = os.path.join(tmpPath,'cfg')
+        filePath = os.path.join(tmpPath, 'reload.py')
+        with open(filePath, 'w') as f:
+            f.write(_generate(random.Random(0x2e11), 'py', args.lines))
+        res = bench(filePath, args.lines)
+
+    print(f"watcher: {'inotify' if KodeFileWatcher.isInotify() else 'polling'}")
+    print(f"{'change':8} {'detect ms':>10} {'reload ms':>10} {'dirty':>7} {'lines':>7}  same")
+    for name, r in res.items():
+        if not r['detected']:
+            print(f"{name:8} not detected")
+            continue
+        print(f"{name:8} {r['detect']*1000:10.1f} {r['reload']*1000:10.1f} {r['dirty']:7} {r['lines']:7}  {r['same'] and r['reloaded']}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(res, f, indent=2)
+    TTkTimer.quitAll()
+    sys.exit(0 if all(r['detected'] and r['reloaded'] and r['same'] for r in res.values()) else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Benchmark of the view repaints driven by the highlight
+#
+# A python file is displayed by two KodeTextEditView (top and middle of the
+# file), the highlight is driven calling _refreshEvent and each repaint
+# requested by a view is painted in its canvas and written (double buffered,
+# only the changed cells) to a counting terminal, comparing:
+#   whole:  every highlight update repaints every view (the previous behaviour)
+#   range:  the views repaint only if the highlighted lines are displayed
+# in the scenarios:
+#   open:   highlight of the whole file
+#   typing: a char typed near the top of the highlighted file, 50 times
+#
+# Usage:
+#    tools/bench/benchRepaint.py [--lines N] [--json OUT]
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# benchHighlight sets up the paths and the pseudo terminal
+from benchHighlight import _generate, _newDoc, _edit
+
+from TermTk import TTkTimer, TTkTerm
+
+from ttkode.app.cfg import TTKodeCfg
+from ttkode.app.kodehighlighter import KodeHighlighter
+from ttkode.app.kodetextedit import KodeTextEditView
+from ttkode.app.kodestats import KodeRepaintStats
+
+_size = (100, 40)
+
+def _views(doc, mode):
+    '''Return the views displaying the top and the middle of the document
+    and the set filled with the views requesting a repaint'''
+    requested = set()
+    views = []
+    for line in (0, len(doc._dataLines)//2):
+        view = KodeTextEditView(document=doc)
+        view.resize(*_size)
+        view.viewMoveTo(0, line)
+        view.update = lambda *args, view=view, **kwargs: requested.add(view)
+        if mode == 'whole':
+            doc.kodeHighlightUpdate.connect(lambda fr, to, view=view: view.update())
+        else:
+            doc.kodeHighlightUpdate.connect(view.highlightUpdate)
+        canvas = view.getCanvas()
+        canvas.updateSize()
+        canvas.enableDoubleBuffer()
+        views.append(view)
+    _paint(views)
+    return views, requested
+
+def _paint(views):
+    for view in views:
+        canvas = view.getCanvas()
+        canvas.clean()
+        view.paintEvent(canvas)
+        canvas.pushToTerminalBuffered(0, 0, *_size)
+
+def _drive(doc, views, requested):
+    while doc._pending():
+        doc._refreshEvent()
+        _paint(requested)
+        requested.clear()
+
+def bench(filePath, text, mode, scenario):
+    doc = _newDoc(text, filePath)
+    views, requested = _views(doc, mode)
+    if scenario == 'typing':
+        _drive(doc, views, requested)
+    counters = KodeRepaintStats.counters()
+    t = time.perf_counter()
+    if scenario == 'open':
+        _drive(doc, views, requested)
+    else:
+        for i in range(50):
+            _edit(doc, 5, 0, 'x')
+            _drive(doc, views, requested)
+    elapsed = time.perf_counter()-t
+    updates, skipped, repaints, written = (b-a for a,b in zip(counters, KodeRepaintStats.counters()))
+    return {'updates': updates, 'skipped': skipped, 'repaints': repaints, 'bytes': written, 'time': elapsed}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lines', help='lines of the generated file (default: 10000)', type=int, default=10000)
+    parser.add_argument('--json', help='save the results to this file')
+    args = parser.parse_args()
+
+    # The document is driven calling _refreshEvent directly
+    KodeHighlighter.setEnabled(False)
+    # Count the bytes without writing them
+    TTkTerm.push = staticmethod(lambda *args: None)
+    KodeRepaintStats.enable()
+    res = {}
+    with tempfile.TemporaryDirectory(prefix='ttkode-bench-') as tmpPath:
+        TTKodeCfg.pathCfg = os.path.join(tmpPath,'cfg')
+        filePath = os.path.join(tmpPath, 'repaint.py')
+        text = _generate(random.Random(0x2e18), 'py', args.lines)
+        for scenario in ('open', 'typing'):
+            for mode in ('whole', 'range'):
+                res[f"{scenario}-{mode}"] = bench(filePath, text, mode, scenario)
+
+    print(f"{'case':14} {'updates':>8} {'skipped':>8} {'repaints':>9} {'KB':>9} {'ms':>8}")
+    for name, r in res.items():
+        print(f"{name:14} {r['updates']:8} {r['skipped']:8} {r['repaints']:9} {r['bytes']/1024:9.1f} {r['time']*1000:8.1f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(res, f, indent=2)
+    TTkTimer.quitAll()
+
+if __name__ == '__main__':
+    main()
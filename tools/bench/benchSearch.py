@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Benchmark of the Find in Files trigram index (KodeSearchIndex)
+#
+# A workspace is generated with a fixed seed (or an existing folder is used)
+# and measured:
+#   build:   first index of the folder with the worker processes
+#   noop:    update with no changed files (walk + stat)
+#   changed: update after rewriting 1% of the files (generated workspace only)
+#   query:   the indexed search compared with a naive scan of all the files,
+#            the two must find the same lines
+#
+# Usage:
+#    tools/bench/benchSearch.py [--files N] [--lines N] [--workers N] [--json OUT] [folder]
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# benchSymbols (through benchHighlight) sets up the paths and the pseudo terminal
+from benchSymbols import generateWorkspace
+
+from TermTk import TTkTimer
+
+from ttkode.app.cfg import TTKodeCfg
+from ttkode.app.kodesearch import KodeSearchIndex
+from ttkode.app.kodeignore import KodeIgnore
+
+_queries = ('lorem12', 'consectetur adipiscing', 'def __init__', 'dolor', 'zzqx_nothing', 'x')
+
+def _naive(folder, query):
+    needle = query.lower()
+    ret = []
+    for path, _ in KodeIgnore.forRoot(folder).walk():
+        try:
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                lines = f.read().split('\n')
+        except OSError:
+            continue
+        ret += [(path, i) for i, l in enumerate(lines) if needle in l.lower()]
+    return sorted(ret)
+
+def _indexed(query):
+    return sorted((path, line) for path, line, _, _ in KodeSearchIndex.search(query) if line is not None)
+
+def _indexSize():
+    return sum(e.stat().st_size for e in os.scandir(KodeSearchIndex._path))
+
+def bench(folder, generated):
+    res = {}
+    KodeSearchIndex.setRoot(folder)
+    t = time.perf_counter()
+    KodeSearchIndex.update()
+    res['build'] = {'time': time.perf_counter()-t, 'files': len(KodeSearchIndex._files),
+                    'bytes': sum(f[2] for f in KodeSearchIndex._files.values()), 'index': _indexSize()}
+
+    t = time.perf_counter()
+    KodeSearchIndex.update()
+    res['noop'] = {'time': time.perf_counter()-t}
+
+    # The files of a given folder are never modified
+    changed = sorted(KodeSearchIndex._files)[::100] if generated else []
+    for path in changed:
+        with open(path, 'a') as f:
+            f.write('\n# appended by the benchmark\n')
+        st = os.stat(path)
+        os.utime(path, (st.st_atime, st.st_mtime+1))
+    t = time.perf_counter()
+    KodeSearchIndex.update()
+    res['changed'] = {'time': time.perf_counter()-t, 'files': len(changed), 'segments': len(KodeSearchIndex._segments)}
+
+    # Reload from the disk
+    KodeSearchIndex.setRoot(folder)
+    t = time.perf_counter()
+    KodeSearchIndex.update()
+    res['reload'] = {'time': time.perf_counter()-t}
+
+    for query in _queries:
+        t = time.perf_counter()
+        naive = _naive(folder, query)
+        naiveTime = time.perf_counter()-t
+        t = time.perf_counter()
+        candidates = len(KodeSearchIndex.candidates(query))
+        indexed = _indexed(query)
+        res[f"query-{query}"] = {
+            'naive': naiveTime, 'indexed': time.perf_counter()-t,
+            'candidates': candidates, 'results': len(indexed), 'same': naive == indexed }
+    return res
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', help='files of the generated workspace (default: 5000)', type=int, default=5000)
+    parser.add_argument('--lines', help='lines of each generated file (default: 200)', type=int, default=200)
+    parser.add_argument('--workers', help=f'worker processes (default: {KodeSearchIndex.workers})', type=int, default=KodeSearchIndex.workers)
+    parser.add_argument('--json', help='save the results to this file')
+    parser.add_argument('folder', type=str, nargs='?', help='folder indexed (default: generated workspace)')
+    args = parser.parse_args()
+
+    KodeSearchIndex.workers = args.workers
+    with tempfile.TemporaryDirectory(prefix='ttkode-bench-') as tmpPath:
+        TTKodeCfg.pathCfg = os.path.join(tmpPath,'cfg')
+        if not (folder := args.folder):
+            generateWorkspace(folder := os.path.join(tmpPath,'workspace'), args.files, args.lines)
+        res = bench(folder, not args.folder)
+
+    b = res['build']
+    print(f"{'build':8} {b['time']:8.2f}s {b['files']/b['time']:8.0f} files/s {b['bytes']/b['time']/1e6:6.1f} MB/s  "
+          f"{b['files']} files, {b['bytes']/1e6:.1f} MB, index {b['index']/1e6:.1f} MB ({args.workers} workers)")
+    print(f"{'noop':8} {res['noop']['time']:8.3f}s")
+    print(f"{'changed':8} {res['changed']['time']:8.3f}s  {res['changed']['files']} files, {res['changed']['segments']} segments")
+    print(f"{'reload':8} {res['reload']['time']:8.3f}s")
+    for query in _queries:
+        r = res[f"query-{query}"]
+        print(f"{query[:16]:16} naive {r['naive']*1000:8.1f}ms  indexed {r['indexed']*1000:8.1f}ms  "
+              f"x{r['naive']/r['indexed']:6.1f}  {r['candidates']:6} candidates {r['results']:7} results  same:{r['same']}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(res, f, indent=2)
+    TTkTimer.quitAll()
+    sys.exit(0 if all(r['same'] for k, r in res.items() if k.startswith('query-')) else 1)
+
+if __name__ == '__main__':
+    main()
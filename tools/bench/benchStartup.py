@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Cold start benchmark of ttkode
+#
+# ttkode is started in a pseudo terminal of a fixed size with an empty
+# config folder, the time is measured from the process spawn to the
+# first frame containing the marker text ("Quit" button by default).
+# Each run is executed with "-X importtime" and the import time is
+# reported per top level package and for the slowest modules.
+#
+# Usage:
+#    tools/bench/benchStartup.py [-n RUNS] [--cold] [--json OUT] [--compare OLD] [file ...]
+
+import os
+import re
+import sys
+import pty
+import json
+import time
+import fcntl
+import shutil
+import signal
+import select
+import struct
+import termios
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+repoPath = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)),'../..'))
+
+_importRe = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)')
+
+def parseImportTime(text):
+    '''Return the list of (module, self us, cumulative us, depth)'''
+    ret = []
+    for line in text.splitlines():
+        if m := _importRe.match(line):
+            ret.append((m.group(4), int(m.group(1)), int(m.group(2)), (len(m.group(3))-1)//2))
+    return ret
+
+def startupRun(args, cfgPath, pycachePath):
+    master, slave = pty.openpty()
+    fcntl.ioctl(slave, termios.TIOCSWINSZ, struct.pack('HHHH', args.height, args.width, 0, 0))
+    env = dict(os.environ,
+               PYTHONPATH=repoPath + os.pathsep + os.environ.get('PYTHONPATH',''),
+               TERM=os.environ.get('TERM','xterm-256color'))
+    if pycachePath:
+        env['PYTHONPYCACHEPREFIX'] = pycachePath
+    marker = args.marker.encode()
+    with tempfile.TemporaryFile() as err:
+        t0 = time.perf_counter()
+        proc = subprocess.Popen(
+                    [sys.executable, '-X', 'importtime', '-m', 'ttkode', '-c', cfgPath] + args.files,
+                    stdin=slave, stdout=slave, stderr=err, env=env, start_new_session=True)
+        os.close(slave)
+        firstPaint = None
+        out = b''
+        try:
+            while firstPaint is None and time.perf_counter()-t0 < args.timeout:
+                if master in select.select([master],[],[],0.05)[0]:
+                    try:
+                        out += os.read(master, 0x10000)
+                    except OSError:
+                        break
+                    if marker in out:
+                        firstPaint = time.perf_counter()-t0
+                elif proc.poll() is not None:
+                    break
+        finally:
+            proc.send_signal(signal.SIGKILL)
+            proc.wait()
+            os.close(master)
+        err.seek(0)
+        stderr = err.read().decode(errors='replace')
+    if firstPaint is None:
+        sys.exit(f"No first paint within {args.timeout}s, stderr:\n{stderr[-2000:]}")
+    return firstPaint, parseImportTime(stderr)
+
+def summary(firstPaints, imports, top):
+    packages = {}
+    for module, selfUs, _, _ in imports:
+        package = module.split('.')[0]
+        packages[package] = packages.get(package,0) + selfUs
+    return {
+        'firstPaint': {
+            'min':    min(firstPaints),
+            'median': statistics.median(firstPaints),
+            'runs':   firstPaints },
+        'imports': sum(i[1] for i in imports)/1e6,
+        'packages': {k:v/1e6 for k,v in sorted(packages.items(), key=lambda x:-x[1])},
+        'modules':  {m:c/1e6 for m,_,c,_ in sorted(imports, key=lambda x:-x[2])[:top]} }
+
+def report(res, old):
+    def _delta(new, key, table=None):
+        if not old:
+            return ''
+        prev = old.get(table,{}).get(key) if table else old.get(key)
+        if prev is None:
+            return '     (new)'
+        return f" {(new-prev)*1000:+8.1f} ms"
+
+    fp = res['firstPaint']
+    print(f"first paint:  median {fp['median']*1000:7.1f} ms  min {fp['min']*1000:7.1f} ms  ({len(fp['runs'])} runs)"
+          + (f"  median {(fp['median']-old['firstPaint']['median'])*1000:+.1f} ms" if old else ''))
+    print(f"imports:      {res['imports']*1000:7.1f} ms{_delta(res['imports'],'imports')}")
+    print("\nimport time per package (self, median run):")
+    for name, t in list(res['packages'].items())[:len(res['modules'])]:
+        print(f"  {t*1000:8.1f} ms  {name:40}{_delta(t, name, 'packages')}")
+    print("\nslowest imports (cumulative, median run):")
+    for name, t in res['modules'].items():
+        print(f"  {t*1000:8.1f} ms  {name:40}{_delta(t, name, 'modules')}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', help='runs (default: 5)', type=int, default=5)
+    parser.add_argument('--cold', help='empty bytecode cache on each run', action='store_true')
+    parser.add_argument('--marker', help='text identifying the first frame (default: "Quit")', default='Quit')
+    parser.add_argument('--width',  help='terminal width (default: 120)',  type=int, default=120)
+    parser.add_argument('--height', help='terminal height (default: 40)', type=int, default=40)
+    parser.add_argument('--timeout', help='max seconds for a run (default: 20)', type=float, default=20)
+    parser.add_argument('--top', help='number of modules reported (default: 20)', type=int, default=20)
+    parser.add_argument('--json', help='save the results to this file')
+    parser.add_argument('--compare', help='results file of a previous run')
+    parser.add_argument('files', type=str, nargs='*', help='the file/s opened at startup',
+                        default=[os.path.join(repoPath,'ttkode/app/main.py')])
+    args = parser.parse_args()
+    args.files = [os.path.abspath(f) for f in args.files]
+
+    runs = []
+    tmpPath = tempfile.mkdtemp(prefix='ttkode-bench-')
+    try:
+        for i in range(args.n):
+            # The first run builds the lexers index in the config folder,
+            # the next ones are the usual startup with the index cached
+            cfgPath = os.path.join(tmpPath,'cfg')
+            pycachePath = os.path.join(tmpPath,f'pycache{i}') if args.cold else None
+            runs.append(startupRun(args, cfgPath, pycachePath))
+    finally:
+        shutil.rmtree(tmpPath, ignore_errors=True)
+
+    firstPaints = [r[0] for r in runs]
+    median = sorted(runs, key=lambda r:r[0])[len(runs)//2]
+    res = summary(firstPaints, median[1], args.top)
+
+    old = None
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+    report(res, old)
+
+    if args.json:
+        with open(args.json,'w') as f:
+            json.dump(res, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Benchmark of the workspace symbol index (KodeSymbolIndex)
+#
+# A workspace of small python/c/js/sh files is generated with a fixed seed
+# (or an existing folder is used) and measured:
+#   scan:   first scan of the folder (files/sec, symbols)
+#   cached: second scan, loading the cache saved by the first one
+#   query:  "go to symbol" lookups (exact, prefix, substring, no match),
+#           the symbol index is queried like the Go to Symbol window does
+#
+# Usage:
+#    tools/bench/benchSymbols.py [--files N] [--lines N] [-n RUNS] [--json OUT] [folder]
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# benchHighlight sets up the paths and the pseudo terminal
+from benchHighlight import _generate
+
+from TermTk import TTkTimer
+
+from ttkode.app.cfg import TTKodeCfg
+from ttkode.app.kodesymbols import KodeSymbolIndex
+
+_queries = {
+    'exact':     ['__init__', 'main', 'lorem12'],
+    'prefix':    ['lor', 'dolor4', 'temp'],
+    'substring': ['psum', 'olor9', 'cing'],
+    'nomatch':   ['zzqx', 'nothing_here'] }
+
+def generateWorkspace(path, files, lines):
+    rnd = random.Random(0x5e3b)
+    exts = ('py', 'c', 'js', 'sh')
+    for i in range(files):
+        folder = os.path.join(path, f"pkg{i//100:03}")
+        os.makedirs(folder, exist_ok=True)
+        lang = exts[i%len(exts)]
+        with open(os.path.join(folder, f"mod{i:05}.{lang}"), 'w') as f:
+            f.write(_generate(rnd, lang, lines))
+
+def _reset():
+    KodeSymbolIndex._files.clear()
+    KodeSymbolIndex._stamps.clear()
+    KodeSymbolIndex._names.clear()
+    KodeSymbolIndex._searchDirty = True
+    KodeSymbolIndex._searchTime = 0.0
+
+def bench(folder, runs):
+    res = {}
+    for name in ('scan', 'cached'):
+        _reset()
+        t = time.perf_counter()
+        KodeSymbolIndex.scan(folder)
+        elapsed = time.perf_counter()-t
+        files, symbols = KodeSymbolIndex.count()
+        res[name] = {'time': elapsed, 'files': files, 'symbols': symbols,
+                     'filesSec': len(KodeSymbolIndex._stamps)/elapsed}
+    res['names'] = len(KodeSymbolIndex._names)
+    # The first query builds the search tables
+    t = time.perf_counter()
+    KodeSymbolIndex.find('x')
+    res['searchBuild'] = time.perf_counter()-t
+    for kind, queries in _queries.items():
+        times = []
+        found = 0
+        for q in queries:
+            for _ in range(runs):
+                t = time.perf_counter()
+                found += len(KodeSymbolIndex.find(q))
+                times.append(time.perf_counter()-t)
+        times.sort()
+        res[f"query-{kind}"] = {'median': times[len(times)//2], 'max': times[-1], 'found': found//runs}
+    return res
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', help='runs of each query (default: 20)', type=int, default=20)
+    parser.add_argument('--files', help='files of the generated workspace (default: 2000)', type=int, default=2000)
+    parser.add_argument('--lines', help='lines of each generated file (default: 200)', type=int, default=200)
+    parser.add_argument('--json', help='save the results to this file')
+    parser.add_argument('folder', type=str, nargs='?', help='folder indexed (default: generated workspace)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='ttkode-bench-') as tmpPath:
+        TTKodeCfg.pathCfg = os.path.join(tmpPath,'cfg')
+        if not (folder := args.folder):
+            generateWorkspace(folder := os.path.join(tmpPath,'workspace'), args.files, args.lines)
+        res = bench(folder, args.n)
+
+    for name in ('scan', 'cached'):
+        r = res[name]
+        print(f"{name:10} {r['time']:8.2f}s {r['filesSec']:9.0f} files/s  {r['files']} files, {r['symbols']} symbols")
+    print(f"{'names':10} {res['names']}  search tables built in {res['searchBuild']*1000:.1f}ms")
+    for kind in _queries:
+        r = res[f"query-{kind}"]
+        print(f"{kind:10} median {r['median']*1000:7.3f}ms  max {r['max']*1000:7.3f}ms  {r['found']} results")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(res, f, indent=2)
+    TTkTimer.quitAll()
+
+if __name__ == '__main__':
+    main()
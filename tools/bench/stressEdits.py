@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Concurrent edits/highlight stress test of KodeTextDocument
+#
+# The document is highlighted by the KodeHighlighter thread while the main thread
+# types, deletes, pastes, undoes and scrolls as fast as possible holding
+# the document lock like KodeTextEditView.keyEvent.
+# At the end the highlight must converge to the same result
+# of a fresh document with the final text.
+#
+# The generated files (python docstrings, markdown fenced code, ruby heredocs,
+# C block comments) are edited in turn, the tokens matched by a single
+# multiline regex must not depend on where a refresh starts or stops,
+# no line may differ from the single pass highlight.
+#
+# Usage:
+#    tools/bench/stressEdits.py [--duration SECS] [--seed N] [--lines N] [--langs py,md,rb,c] [--json OUT] [file]
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# benchHighlight sets up the paths and the pseudo terminal
+from benchHighlight import generateCorpus, _newDoc, _highlight, _View
+
+from TermTk import TTkString, TTkTimer, TTkTextCursor
+
+from ttkode.app.cfg import TTKodeCfg
+from ttkode.app.kodetextdocument import KodeTextDocument
+from ttkode.app.kodehighlighter import KodeHighlighter
+
+def _lineKey(l):
+    # Each token type has its own color object (KodeStyle), the ids
+    # compare the token types, equal colors of different types differ
+    return l._text, [id(c) for c in l._colors]
+
+def stress(args, filePath):
+    rnd = random.Random(args.seed)
+    with open(filePath) as f:
+        text = f.read()
+    doc = KodeTextDocument(text=text, filePath=filePath)
+    doc.setStatsEnabled()
+    view = _View()
+    cursor = TTkTextCursor(document=doc)
+    snippets = text.split('\n')
+    waits = []
+    ops = {}
+
+    def _pos():
+        line = rnd.randrange(len(doc._dataLines))
+        return line, rnd.randint(0, len(doc._dataLines[line]))
+
+    def _type():
+        line, pos = _pos()
+        cursor.setPosition(line, pos)
+        cursor.insertText(TTkString(rnd.choice(['x', ' ', '"', "'", '#', '(', ')', '`', '*', '/', '<', '\n'])))
+    def _delete():
+        line, pos = _pos()
+        cursor.setPosition(line, pos)
+        toLine = min(len(doc._dataLines)-1, line+rnd.randint(0,3))
+        cursor.setPosition(toLine, rnd.randint(0, len(doc._dataLines[toLine])), moveMode=TTkTextCursor.KeepAnchor)
+        cursor.removeSelectedText()
+    def _paste():
+        line, pos = _pos()
+        cursor.setPosition(line, pos)
+        fr = rnd.randrange(len(snippets))
+        cursor.insertText(TTkString('\n'.join(snippets[fr:fr+rnd.randint(1,200)])))
+    def _undo():
+        doc.restoreSnapshotPrev() if rnd.random() < 0.7 else doc.restoreSnapshotNext()
+    def _scroll():
+        fr = rnd.randrange(len(doc._dataLines))
+        doc.setVisibleRange(view, fr, fr+_View.height)
+
+    actions = [(_type,60), (_delete,10), (_paste,5), (_undo,10), (_scroll,15)]
+    population = [a for a,_ in actions]
+    weights    = [w for _,w in actions]
+
+    end = time.perf_counter() + args.duration
+    while time.perf_counter() < end:
+        action = rnd.choices(population, weights)[0]
+        ops[action.__name__] = ops.get(action.__name__, 0) + 1
+        if action is _scroll:
+            # Like the view paintEvent, outside the key lock
+            _scroll()
+            continue
+        t = time.perf_counter()
+        with doc.getLock('key'):
+            waits.append(time.perf_counter()-t)
+            action()
+            if action is not _undo:
+                doc.saveSnapshot(cursor.copy())
+        if args.pause:
+            time.sleep(args.pause)
+
+    # Wait the highlight to converge
+    t = time.perf_counter()
+    while True:
+        with doc.getLock():
+            if not doc._pending():
+                break
+        if time.perf_counter()-t > args.timeout:
+            KodeHighlighter.unregister(doc)
+            return {'error': 'The highlight did not converge'}
+        time.sleep(0.05)
+    converge = time.perf_counter()-t
+    KodeHighlighter.unregister(doc)
+
+    # Same text highlighted from scratch
+    final = doc.toPlainText()
+    ref = _newDoc(final, filePath)
+    # Lexed in a single refresh, the result the refreshes must converge to
+    ref._lexWindow = len(ref._dataLines)
+    _highlight(ref)
+    mismatches = [i for i, (a, b) in enumerate(zip(doc._dataLines, ref._dataLines)) if _lineKey(a) != _lineKey(b)]
+    consistent = len(doc._dataLines) == len(doc._states) == len(doc._dirty) == len(ref._dataLines)
+
+    waits.sort()
+    stats = doc.stats().summary()
+    return {
+        'file':        os.path.basename(filePath),
+        'ops':         ops,
+        'lines':       len(doc._dataLines),
+        'converge':    converge,
+        'keyWait':     {'median': statistics.median(waits), 'p99': waits[int(len(waits)*0.99)], 'max': waits[-1]},
+        'keyHoldMax':  stats['locks']['key']['maxHold'],
+        'spliceHoldMax': stats['locks'].get('splice',{}).get('maxHold',0),
+        'refreshes':   stats['refreshes'],
+        'rebased':     stats['rebased'],
+        'discarded':   stats['discarded'],
+        'consistent':  consistent,
+        'mismatches':  len(mismatches),
+        'firstMismatch': mismatches[0] if mismatches else None }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--duration', help='seconds of edits of each file (default: 10)', type=float, default=10)
+    parser.add_argument('--pause', help='seconds between the edits (default: 0)', type=float, default=0)
+    parser.add_argument('--seed', help='random seed (default: 1)', type=int, default=1)
+    parser.add_argument('--lines', help='lines of the generated file (default: 5000)', type=int, default=5000)
+    parser.add_argument('--timeout', help='max seconds to converge (default: 120)', type=float, default=120)
+    parser.add_argument('--langs', help='languages of the generated files (default: py,md,rb,c)', type=str, default='py,md,rb,c')
+    parser.add_argument('--json', help='save the results to this file')
+    parser.add_argument('file', type=str, nargs='?', help='file edited (default: generated files)')
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix='ttkode-stress-') as tmpPath:
+        TTKodeCfg.pathCfg = os.path.join(tmpPath,'cfg')
+        if args.file:
+            filePaths = [args.file]
+        else:
+            os.makedirs(corpus := os.path.join(tmpPath,'corpus'))
+            files = dict(generateCorpus(corpus, [args.lines]))
+            filePaths = [files[f"{lang}-{args.lines}.{lang}"] for lang in args.langs.split(',')]
+        for filePath in filePaths:
+            results.append(res := stress(args, filePath))
+            for k, v in res.items():
+                print(f"{k:14} {v}")
+            print()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    TTkTimer.quitAll()
+    sys.exit(0 if all(res.get('consistent') and not res.get('mismatches') for res in results) else 1)
+
+if __name__ == '__main__':
+    main()
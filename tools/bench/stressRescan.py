@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Relex bound regression suite of KodeTextDocument
+#
+# Errors and multiline tokens must not make the document lex more lines
+# than the ones whose highlight changes.
+# Each pathological input (and a plain python file where a docstring is
+# opened and closed near the top) is highlighted (full) and edited typing
+# an opener near the top of the file (edit):
+#
+#   full:  the lines lexed must be the lines of the file
+#   edit:  the lines lexed must be at most --max-ratio times the changed
+#          range plus a refresh (_linesRefreshed), the windows double
+#          until the highlight converges.
+#          The range starts at the closest line with a known state before
+#          the edit, and ends at the last line whose colors or state changed
+#          or at the end of the token including the edit.
+#          The lexers that cannot be resumed (C) are lexed again from the top,
+#          the bound is the lines of the file
+#
+# After each step no line may differ from the single pass highlight.
+#
+# Usage:
+#    tools/bench/stressRescan.py [--sizes 1000,10000] [--max-ratio R] [--json OUT]
+
+import os
+import sys
+import json
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# benchHighlight sets up the paths and the pseudo terminal
+from benchHighlight import _generate, _newDoc, _highlight, _edit
+
+from TermTk import TTkTimer
+
+from ttkode.app.cfg import TTKodeCfg
+from ttkode.app.kodetextdocument import KodeTextDocument
+from ttkode.app.kodehighlighter import KodeHighlighter
+
+# {name:(file name, function(rnd, lines)->text, [(line, text typed)])}
+_cases = {
+    'unterminated-string':  ('x.py',   lambda rnd, n: '"""\n' + _generate(rnd, 'py', n),         [(2, '"""'), (4, "'''")]),
+    'unterminated-comment': ('x.c',    lambda rnd, n: '/*\n' + _generate(rnd, 'c', n),           [(2, '/*'), (4, '*/')]),
+    'huge-comment':         ('x.c',    lambda rnd, n: '/*\n' + ' * comment\n'*n + ' */\n',     [(1, '*/'), (3, '/*')]),
+    'errors-everywhere':    ('x.py',   lambda rnd, n: '$ ? !\n'*n,                               [(2, '$'), (4, '"""')]),
+    'error-typed':          ('x.py',   lambda rnd, n: _generate(rnd, 'py', n),                   [(5, '$'), (5, '?'), (5, '$ ?')]),
+    'unterminated-html':    ('x.html', lambda rnd, n: '<!--\n' + _generate(rnd, 'html', n),      [(2, '<!--'), (3, '-->')]),
+    'unterminated-js':      ('x.js',   lambda rnd, n: '/*\n' + _generate(rnd, 'js', n),          [(2, '`'), (3, '*/')]),
+    'unterminated-heredoc': ('x.sh',   lambda rnd, n: 'cat <<EOF\n' + _generate(rnd, 'sh', n),   [(2, '"'), (3, "'")]),
+    'docstring-typed':      ('x.py',   lambda rnd, n: _generate(rnd, 'py', n),                   [(3, '"""'), (3, '"""')]),
+}
+
+def _run(doc):
+    '''Highlight until completion, return the lines lexed'''
+    stats = doc.stats()
+    stats.reset()
+    _highlight(doc)
+    return stats.lines
+
+def _lineKeys(doc):
+    # Each token type has its own color object (KodeStyle)
+    return [(l._text, [id(c) for c in l._colors], s) for l, s in zip(doc._dataLines, doc._states)]
+
+def stress(tmpPath, name, size, maxRatio):
+    fileName, generate, edits = _cases[name]
+    filePath = os.path.join(tmpPath, fileName)
+    doc = _newDoc(generate(random.Random(0x2e17), size), filePath)
+    doc.setStatsEnabled()
+    res = []
+    def _check(kind, lexed, bound, changed):
+        ref = _newDoc(doc.toPlainText(), filePath)
+        _highlight(ref)
+        mismatches = sum(a[:2] != b[:2] for a, b in zip(_lineKeys(doc), _lineKeys(ref)))
+        res.append({'case': name, 'size': size, 'kind': kind, 'lexed': lexed, 'changed': changed,
+                    'bound': bound, 'mismatches': mismatches,
+                    'ok': lexed <= bound and not mismatches and not doc._pending()})
+    lines = len(doc._dataLines)
+    _check('full', _run(doc), lines, lines)
+    for line, text in edits:
+        old = _lineKeys(doc)
+        _edit(doc, line, 0, text)
+        lexed = _run(doc)
+        new = _lineKeys(doc)
+        # The edit does not add lines, the range to lex starts at the closest line
+        # with a known state and ends at the last line changed or inside
+        # the token including the edit (the first following line with a known state)
+        fr = max(i for i in range(line+1) if old[i][2] >= 0)
+        to = max([line]+[i for i, (a, b) in enumerate(zip(old, new)) if a != b])
+        to = max(to, next((i for i in range(line+1, len(new)) if new[i][2] >= 0), len(new)-1))
+        changed = to-fr+1
+        if doc._lexer.isResumable():
+            bound = int(maxRatio*changed) + KodeTextDocument._linesRefreshed
+        else:
+            bound = len(new)
+        _check(f"edit {text!r}", lexed, bound, changed)
+    return res
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', help='lines of the generated files (default: 1000,10000)', default='1000,10000')
+    parser.add_argument('--max-ratio', help='max lines lexed per changed line (default: 2)', type=float, default=2)
+    parser.add_argument('--json', help='save the results to this file')
+    args = parser.parse_args()
+
+    # The document is driven calling _refreshEvent directly
+    KodeHighlighter.setEnabled(False)
+    res = []
+    with tempfile.TemporaryDirectory(prefix='ttkode-stress-') as tmpPath:
+        TTKodeCfg.pathCfg = os.path.join(tmpPath,'cfg')
+        for size in map(int, args.sizes.split(',')):
+            for name in _cases:
+                res += stress(tmpPath, name, size, args.max_ratio)
+
+    print(f"{'case':22} {'size':>6} {'kind':12} {'lexed':>8} {'changed':>8} {'bound':>8} {'mism':>6}")
+    for r in res:
+        print(f"{r['case']:22} {r['size']:6} {r['kind']:12} {r['lexed']:8} {r['changed']:8} "
+              f"{r['bound']:8} {r['mismatches']:6}{'' if r['ok'] else '  FAIL'}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(res, f, indent=2)
+
+    TTkTimer.quitAll()
+    sys.exit(0 if all(r['ok'] for r in res) else 1)
+
+if __name__ == '__main__':
+    main()
@@ -22,7 +22,27 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from .app import *
+import os
+import sys
+import importlib
+
+def main():
+    # TermTk reads the terminal attributes at import time, the headless
+    # "ttkode highlight" (see KodeBatch) may run without a terminal,
+    # a pseudo terminal is used as the stdin of this command only,
+    # it is inherited by its worker processes importing TermTk as well
+    if sys.argv[1:2] == ['highlight'] and os.name == 'posix' and not os.isatty(0):
+        import pty
+        _, slave = pty.openpty()
+        os.dup2(slave, 0)
+        os.close(slave)
+    from .app import main
+    main()
+
+def __getattr__(name):
+    # The user interface (TermTk) is imported on first use
+    app = importlib.import_module('.app', __name__)
+    return getattr(app, name)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -23,7 +23,6 @@
 # SOFTWARE.
 
 import os
-import yaml
 
 class TTKodeCfg:
     version="__VERSION__"
@@ -31,12 +30,26 @@ class TTKodeCfg:
     cfgVersion = '1.0'
     pathCfg="."
     options={}
+    # Recent "Find in Files" queries, most recent first
+    searches=[]
     maxsearches=200
+    # Files bigger than this are memory mapped (overridden by options['largeFileSize'])
+    largeFileSize=16*1024*1024
+    # Lines kept by the followed files, the oldest are dropped (overridden by options['followMaxLines'])
+    followMaxLines=100000
+    # Bytes of highlighted documents kept in memory, the least recently displayed
+    # ones beyond it keep only their raw text (overridden by options['highlightMemory'])
+    highlightMemory=256*1024*1024
+    # Files/folders hidden in the file tree and skipped by the indexes,
+    # .gitignore syntax (overridden by options['ignore'])
+    ignore=['.git', '.hg', '.svn', 'CVS', '.DS_Store', '__pycache__', 'node_modules']
 
     @staticmethod
     def save(searches=True, filters=True, colors=True, options=True):
+        import yaml
         os.makedirs(TTKodeCfg.pathCfg, exist_ok=True)
         optionsPath  = os.path.join(TTKodeCfg.pathCfg,'options.yaml')
+        searchesPath = os.path.join(TTKodeCfg.pathCfg,'searches.yaml')
 
         def writeCfg(path, cfg):
             fullCfg = {
@@ -46,11 +59,18 @@ class TTKodeCfg:
                 yaml.dump(fullCfg, f, sort_keys=False, default_flow_style=False)
 
         if options:  writeCfg(optionsPath,  TTKodeCfg.options)
+        if searches: writeCfg(searchesPath, TTKodeCfg.searches[:TTKodeCfg.maxsearches])
 
     @staticmethod
     def load():
         optionsPath  = os.path.join(TTKodeCfg.pathCfg,'options.yaml')
+        searchesPath = os.path.join(TTKodeCfg.pathCfg,'searches.yaml')
 
         if os.path.exists(optionsPath):
+            import yaml
             with open(optionsPath) as f:
                 TTKodeCfg.options = yaml.load(f, Loader=yaml.SafeLoader)['cfg']
+        if os.path.exists(searchesPath):
+            import yaml
+            with open(searchesPath) as f:
+                TTKodeCfg.searches = yaml.load(f, Loader=yaml.SafeLoader)['cfg']
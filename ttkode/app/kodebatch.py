@@ -0,0 +1,234 @@
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import sys
+import json
+import argparse
+import multiprocessing
+from functools import partial
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .cfg import TTKodeCfg
+from .kodelexer import KodeLexer
+from .kodeformatter import KodeStyle
+from .kodeignore import KodeIgnore
+
+# The functions below run in the worker processes
+
+def _initWorker(pathCfg):
+    # The lexers index is shared with the main process
+    TTKodeCfg.pathCfg = pathCfg
+
+def _ansi(tokens, kodeStyle):
+    '''ANSI text of the tokens, the color is reset at the end of each line'''
+    codes = {}
+    out = []
+    last = None
+    for ttype, value in tokens:
+        if (code := codes.get(ttype)) is None:
+            code = str(kodeStyle.color(ttype))
+            # The style colors begin with a reset, the others are completed with it
+            code = codes[ttype] = code if code.startswith('\033[0;') else '\033[0m'+code
+        if '\n' not in value:
+            if code != last:
+                out.append(code)
+                last = code
+            out.append(value)
+            continue
+        for i, part in enumerate(value.split('\n')):
+            if i:
+                out.append('\033[0m\n')
+                last = None
+            if part:
+                if code != last:
+                    out.append(code)
+                    last = code
+                out.append(part)
+    out.append('\033[0m')
+    return ''.join(out)
+
+def _tokenRuns(tokens, count):
+    '''Return the token types and the runs [length, token type index, ...] of the first count lines'''
+    types, ids = [], {}
+    lines, line = [], []
+    for ttype, value in tokens:
+        if (tid := ids.get(ttype)) is None:
+            tid = ids[ttype] = len(types)
+            types.append(str(ttype))
+        for i, part in enumerate(value.split('\n')):
+            if i:
+                lines.append(line)
+                line = []
+            if not part:
+                continue
+            if line and line[-1] == tid:
+                line[-2] += len(part)
+            else:
+                line += [len(part), tid]
+    lines.append(line)
+    return types, lines[:count]
+
+def _highlightFile(path, style, output, maxSize):
+    '''Return (path, lexer name, size, lines, output, error) of the file'''
+    try:
+        with open(path, 'rb') as f:
+            data = f.read(maxSize+1)
+    except OSError as e:
+        return path, '', 0, 0, '', str(e)
+    if len(data) > maxSize:
+        return path, '', len(data), 0, '', f"Bigger than {maxSize} bytes"
+    if b'\0' in data[:8192]:
+        return path, '', len(data), 0, '', "Binary file"
+    # Same newlines of the documents read in text mode
+    text = data.decode('utf-8', errors='replace').replace('\r\n', '\n').replace('\r', '\n')
+    lexer = KodeLexer.forFile(path, text)
+    count = text.count('\n')+1
+    # The lexers expect the text ending with a newline
+    tokens = lexer.tokens(text if text.endswith('\n') else text+'\n', KodeLexer.ROOT, [])
+    if output == 'ansi':
+        out = _ansi(tokens, KodeStyle.get(style))
+    else:
+        types, lines = _tokenRuns(tokens, count)
+        out = json.dumps({'path': path, 'lexer': lexer.name(), 'tokens': types, 'lines': lines})
+    return path, lexer.name(), len(data), count, out, None
+
+class KodeBatch():
+    '''Headless highlight of many files, without any widget
+
+    The files are highlighted with the same lexers (KodeLexer) and styles (KodeStyle)
+    of the editor by a pool of worker processes, each file is rendered as:
+        'ansi':   the text colored with ANSI escape sequences
+        'tokens': a json object {path, lexer, tokens, lines} where tokens are the
+                  token types and each line is a list of [length, token index, ...] runs
+
+    Used by the "ttkode highlight" command (see :meth:`main`).
+    '''
+    outputs = ('ansi', 'tokens')
+    workers = max(1, (os.cpu_count() or 2)-1)
+    # Files bigger than this are skipped
+    maxFileSize = 16*1024*1024
+    # Max files sent to a worker at once
+    chunkFiles = 16
+
+    @staticmethod
+    def files(paths):
+        '''Generate (path, relative path) of the files, the folders are walked skipping the ignored files.
+
+        The relative paths start from the folder common to all the paths
+        (i.e. "a/x.py b/x.py" are "a/x.py" and "b/x.py"), a file listed twice is generated once'''
+        if not paths:
+            return
+        folders = [os.path.abspath(p) if os.path.isdir(p) else os.path.dirname(os.path.abspath(p)) for p in paths]
+        common = os.path.commonpath(folders)
+        seen = set()
+        for path in paths:
+            if os.path.isdir(path):
+                root = os.path.realpath(path)
+                base = os.path.relpath(os.path.abspath(path), common)
+                files = ((filePath, os.path.join(base, os.path.relpath(filePath, root)))
+                         for filePath, _ in KodeIgnore.forRoot(root).walk(stats=False))
+            else:
+                files = [(path, os.path.relpath(os.path.abspath(path), common))]
+            for filePath, relPath in files:
+                if (relPath := os.path.normpath(relPath)) not in seen:
+                    seen.add(relPath)
+                    yield filePath, relPath
+
+    @staticmethod
+    def highlight(paths, style='gruvbox-dark', output='ansi', workers=None, ordered=True):
+        '''Generate (path, lexer name, size, lines, output, error) of each file,
+        error is None if the file is highlighted.
+
+        The results are streamed as soon as available, in the order of the paths if ordered,
+        workers=0 highlights the files in the calling process'''
+        if output not in KodeBatch.outputs:
+            raise ValueError(f"Unknown output {output}, expected one of {KodeBatch.outputs}")
+        work = partial(_highlightFile, style=style, output=output, maxSize=KodeBatch.maxFileSize)
+        workers = KodeBatch.workers if workers is None else workers
+        if workers < 1 or len(paths) < 2:
+            yield from map(work, paths)
+            return
+        ctx = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(workers, mp_context=ctx, initializer=_initWorker, initargs=(TTKodeCfg.pathCfg,)) as pool:
+            if ordered:
+                chunk = max(1, min(KodeBatch.chunkFiles, len(paths)//(workers*4)))
+                yield from pool.map(work, paths, chunksize=chunk)
+            else:
+                for future in as_completed([pool.submit(work, path) for path in paths]):
+                    yield future.result()
+
+    @staticmethod
+    def main(argv):
+        '''ttkode highlight [-o ansi|tokens] [--style STYLE] [-j JOBS] [--dir OUT] [-q] path ...'''
+        parser = argparse.ArgumentParser(prog='ttkode highlight', description='Highlight the files without the user interface')
+        parser.add_argument('-o', '--output', help='output format (default: ansi)', choices=KodeBatch.outputs, default='ansi')
+        parser.add_argument('--style', help='pygments style (default: the one of the editor)')
+        parser.add_argument('-j', '--jobs', help=f'worker processes, 0 = no workers (default: {KodeBatch.workers})', type=int, default=KodeBatch.workers)
+        parser.add_argument('--dir', help='write the output of each file in this folder instead of stdout')
+        parser.add_argument('-q', '--quiet', help='do not report the throughput', action='store_true')
+        parser.add_argument('-c', help=f'config folder (default: "{TTKodeCfg.pathCfg}")', default=TTKodeCfg.pathCfg)
+        parser.add_argument('paths', type=str, nargs='+', help='files or folders highlighted')
+        args = parser.parse_args(argv)
+
+        TTKodeCfg.pathCfg = args.c
+        TTKodeCfg.load()
+        style = args.style or TTKodeCfg.options.get('style','gruvbox-dark')
+        ext = '.ansi' if args.output == 'ansi' else '.json'
+        files = list(KodeBatch.files(args.paths))
+        relPaths = dict(files)
+
+        t = perf_counter()
+        count, size, lines, errors = 0, 0, 0, 0
+        try:
+            for path, _, fileSize, fileLines, out, error in KodeBatch.highlight(
+                    [p for p, _ in files], style=style, output=args.output, workers=args.jobs):
+                if error:
+                    errors += 1
+                    print(f"ttkode: {path}: {error}", file=sys.stderr)
+                    continue
+                count += 1
+                size  += fileSize
+                lines += fileLines
+                if args.dir:
+                    outPath = os.path.join(args.dir, relPaths[path]+ext)
+                    os.makedirs(os.path.dirname(outPath), exist_ok=True)
+                    with open(outPath, 'w') as f:
+                        f.write(out)
+                elif args.output == 'ansi':
+                    if len(files) > 1:
+                        sys.stdout.write(f"==> {path} <==\n")
+                    sys.stdout.write(out)
+                else:
+                    sys.stdout.write(out+'\n')
+            sys.stdout.flush()
+        except BrokenPipeError:
+            # The reader is gone (i.e. | head), the pending output is discarded
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            return 1
+        elapsed = max(perf_counter()-t, 1e-6)
+        if not args.quiet:
+            print(f"{count} files, {lines} lines, {size/1e6:.2f} MB in {elapsed:.2f}s: "
+                  f"{count/elapsed:.1f} files/s, {size/1e6/elapsed:.2f} MB/s" +
+                  (f", {errors} skipped" if errors else ''), file=sys.stderr)
+        return 1 if errors and not count else 0
@@ -0,0 +1,267 @@
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import stat
+import datetime
+from collections import deque
+from threading import Lock
+
+from TermTk import TTkK, TTkLog, TTkColor, TTkString, TTkCfg, TTkTimer
+from TermTk import pyTTkSlot
+from TermTk import TTkTree, TTkFileTreeWidget, TTkFileTreeWidgetItem
+
+from .kodeignore import KodeIgnore
+
+class KodeFileTreeWidget(TTkFileTreeWidget):
+    '''TTkFileTreeWidget listing the folders in background
+
+    A folder is listed (os.scandir) by a worker timer when expanded,
+    skipping the files ignored by KodeIgnore; the listings are cached
+    and every refreshInterval seconds the expanded folders are checked,
+    only the ones with a changed mtime (or .gitignore) are listed again.
+    '''
+    # Seconds between two checks of the expanded folders
+    refreshInterval = 2.0
+    # {(id(color), icon):(color, TTkString)}
+    _icons = {}
+    __slots__ = ('_ignore', '_listings', '_applied', '_folders', '_requests', '_requestsLock', '_worker')
+    def __init__(self, *args, **kwargs):
+        # {path:(stamp, entries)}
+        self._listings = {}
+        # {path:{childPath:entry}} entries displayed in each folder
+        self._applied = {}
+        # {path:item} of the listed folders, the root is the tree itself
+        self._folders = {}
+        self._requests = deque()
+        self._requestsLock = Lock()
+        self._ignore = None
+        self._worker = TTkTimer()
+        self._worker.timeout.connect(self._work)
+        super().__init__(*args, **kwargs)
+
+    def openPath(self, path):
+        self._path = os.path.realpath(path)
+        self._ignore = KodeIgnore.forRoot(self._path)
+        self._folders = {self._path:self}
+        self._applied = {}
+        self.clear()
+        self._request(self._path)
+
+    @pyTTkSlot(TTkFileTreeWidgetItem)
+    def _updateChildren(self, item):
+        if item.getType() != TTkFileTreeWidgetItem.DIR:
+            return
+        self._folders[item.path()] = item
+        if not item.children() and item.path() not in self._listings:
+            # Displayed until the folder is listed
+            item.addChild(TTkFileTreeWidgetItem(
+                [TTkString('…', TTkCfg.theme.failNameColor), '', '', ''], raw=['', -1, '', 0], path=''))
+        self._request(item.path())
+
+    def _request(self, path):
+        with self._requestsLock:
+            if path not in self._requests:
+                self._requests.append(path)
+        self._worker.start(0)
+
+    @pyTTkSlot()
+    def _work(self):
+        with self._requestsLock:
+            path = self._requests.popleft() if self._requests else None
+        if path is None:
+            self._check()
+        elif (item := self._folders.get(path)) is not None:
+            self._setEntries(item, self._list(path))
+        with self._requestsLock:
+            pending = bool(self._requests)
+        self._worker.start(0 if pending else KodeFileTreeWidget.refreshInterval)
+
+    def _check(self):
+        # Only the displayed folders are checked, the collapsed ones are
+        # checked when expanded again
+        for path, item in list(self._folders.items()):
+            if item is not self and not item.isExpanded():
+                continue
+            self._ignore.changed(path)
+            if (cached := self._listings.get(path)) is None or cached[0] != self._stamp(path):
+                self._request(path)
+
+    def _stamp(self, path):
+        try:
+            return os.stat(path).st_mtime_ns, self._ignore.version()
+        except OSError:
+            return None
+
+    def _list(self, path):
+        '''Return the (cached) entries of the folder, folders first'''
+        stamp = self._stamp(path)
+        if (cached := self._listings.get(path)) is not None and cached[0] == stamp:
+            return cached[1]
+        entries = []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    entries.append(self._entry(entry))
+        except OSError as e:
+            TTkLog.error(f"Unable to list {path}: {e}")
+        entries = sorted((e for e in entries if e), key=lambda e: (not e[2], e[0].lower(), e[0]))
+        self._listings[path] = (stamp, entries)
+        return entries
+
+    def _entry(self, entry):
+        # (name, path, isDir, linkTarget, size, ctime, isExec), ctime is None if broken
+        try:
+            isDir = entry.is_dir()
+        except OSError:
+            isDir = False
+        if self._ignore.isIgnored(entry.path, isDir):
+            return None
+        try:
+            target = os.readlink(entry.path) if entry.is_symlink() else None
+        except OSError:
+            target = None
+        try:
+            st = entry.stat()
+            return (entry.name, entry.path, isDir, target, st.st_size, st.st_ctime,
+                    not isDir and bool(st.st_mode & (stat.S_IXUSR|stat.S_IXGRP|stat.S_IXOTH)))
+        except OSError:
+            return (entry.name, entry.path, isDir, target, 0, None, False)
+
+    @staticmethod
+    def _icon(color, icon):
+        # The same few icons are shared by all the items,
+        # the color is kept in the value to keep its id() valid
+        if (ret := KodeFileTreeWidget._icons.get((id(color), icon))) is None:
+            ret = KodeFileTreeWidget._icons[(id(color), icon)] = (color, TTkString() + color + icon + TTkColor.RST)
+        return ret[1]
+
+    @staticmethod
+    def _newItem(entry):
+        name, path, isDir, target, size, ctime, isExec = entry
+        time = datetime.datetime.fromtimestamp(ctime).strftime('%Y-%m-%d %H:%M:%S') if ctime is not None else ""
+        if isDir:
+            color = TTkCfg.theme.folderNameColor if ctime is not None else TTkCfg.theme.failNameColor
+            if target is not None:
+                text = TTkString()+TTkCfg.theme.linkNameColor+name+'/'+TTkColor.RST+' -> '+TTkCfg.theme.folderNameColor+target
+                typef = "Folder Link"
+            else:
+                text = TTkString(name+'/', color)
+                typef = "Folder"
+            return TTkFileTreeWidgetItem(
+                        [text, "", typef, time],
+                        raw = [name, -1, typef, ctime or 0],
+                        path=path,
+                        type=TTkFileTreeWidgetItem.DIR,
+                        icon=KodeFileTreeWidget._icon(TTkCfg.theme.folderIconColor, TTkCfg.theme.fileIcon.folderClose),
+                        childIndicatorPolicy=TTkK.ShowIndicator)
+        if ctime is None:
+            color, typef, sizeStr = TTkCfg.theme.failNameColor, "Broken", ""
+        else:
+            color, typef = (TTkCfg.theme.executableColor, "Exec") if isExec else (TTkCfg.theme.fileNameColor, "File")
+            if size > 1024*1024*1024:
+                sizeStr = f"{size/(1024*1024*1024):.2f} GB"
+            elif size > 1024*1024:
+                sizeStr = f"{size/(1024*1024):.2f} MB"
+            elif size > 1024:
+                sizeStr = f"{size/1024:.2f} KB"
+            else:
+                sizeStr = f"{size} bytes"
+        if target is not None:
+            text = TTkString()+TTkCfg.theme.linkNameColor+name+TTkColor.RST+' -> '+color+target
+            typef += " Link"
+        else:
+            text = TTkString(name, color)
+        return TTkFileTreeWidgetItem(
+                    [text, sizeStr, typef, time],
+                    raw = [name, size, typef, ctime or 0],
+                    path=path,
+                    type=TTkFileTreeWidgetItem.FILE,
+                    icon=KodeFileTreeWidget._icon(TTkCfg.theme.fileIconColor, TTkCfg.theme.fileIcon.getIcon(name)),
+                    childIndicatorPolicy=TTkK.DontShowIndicator)
+
+    def _setEntries(self, item, entries):
+        # The items of the unchanged entries are reused, the folders
+        # are always reused to keep their expanded state and children
+        path = self._path if item is self else item.path()
+        parent = self._rootItem if item is self else item
+        applied = self._applied.get(path, {})
+        old = {c.path():c for c in parent._children}
+        children, added = [], []
+        for entry in entries:
+            c = old.pop(entry[1], None)
+            if c is None or (applied.get(entry[1]) != entry and not (entry[2] and c.getType() == TTkFileTreeWidgetItem.DIR)):
+                if c is not None:
+                    self._forget(c)
+                c = KodeFileTreeWidget._newItem(entry)
+                added.append(c)
+            children.append(c)
+        if not added and not old:
+            self._applied[path] = {entry[1]:entry for entry in entries}
+            return
+        for c in old.values():
+            self._forget(c)
+        parent.takeChildren()
+        for c in added:
+            c._processFilter(self._filter)
+        parent.addChildren(children)
+        if item is self:
+            for c in children:
+                c.setParent(self)
+        self._applied[path] = {entry[1]:entry for entry in entries}
+
+    def _forget(self, item):
+        if (path := item.path()) in self._folders:
+            del self._folders[path]
+            self._listings.pop(path, None)
+            self._applied.pop(path, None)
+        for c in item._children:
+            self._forget(c)
+
+class KodeFileTree(TTkTree):
+    '''TTkFileTree based on KodeFileTreeWidget'''
+    __slots__ = ('_fileTreeWidget',
+                 # Forwarded Methods
+                 'openPath', 'getOpenPath',
+                 'setFilter',
+                 # Forwarded Signals
+                 'fileClicked', 'folderClicked', 'fileDoubleClicked', 'folderDoubleClicked', 'fileActivated', 'folderActivated')
+
+    def __init__(self, *args, **kwargs):
+        wkwargs = kwargs.copy()
+        wkwargs.pop('parent', None)
+        self._fileTreeWidget = KodeFileTreeWidget(*args, **wkwargs)
+
+        super().__init__(*args, **kwargs, treeWidget=self._fileTreeWidget)
+
+        # Forward Signals
+        self.fileClicked         = self._fileTreeWidget.fileClicked
+        self.folderClicked       = self._fileTreeWidget.folderClicked
+        self.fileDoubleClicked   = self._fileTreeWidget.fileDoubleClicked
+        self.folderDoubleClicked = self._fileTreeWidget.folderDoubleClicked
+        self.fileActivated       = self._fileTreeWidget.fileActivated
+        self.folderActivated     = self._fileTreeWidget.folderActivated
+
+        # Forward Methods
+        self.openPath            = self._fileTreeWidget.openPath
+        self.getOpenPath         = self._fileTreeWidget.getOpenPath
+        self.setFilter           = self._fileTreeWidget.setFilter
@@ -0,0 +1,105 @@
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import os
+import codecs
+
+from TermTk import TTkLog, TTkTimer
+
+class KodeFileFollower():
+    '''Read the bytes appended to a file (i.e. a log) like "tail -F"
+
+    The file is checked every interval seconds, the new bytes are decoded
+    (a partial utf-8 sequence is kept for the next read) and passed to callback(text)
+    in the timer thread. At most maxRead bytes are read each time, the rest
+    is read immediately after, a burst does not hold the document lock for long.
+
+    A truncated or replaced (rotated) file is read again from the beginning,
+    a removed one is read as soon as it is created again.
+    '''
+    interval = 0.1
+    maxRead = 1024*1024
+    __slots__ = ('_path', '_callback', '_offset', '_ino', '_decoder', '_timer', '_running')
+    def __init__(self, path, callback, offset=None):
+        '''Follow the file from offset (the end of the file if None)'''
+        self._path = path
+        self._callback = callback
+        try:
+            st = os.stat(path)
+            self._ino = st.st_ino
+            self._offset = st.st_size if offset is None else offset
+        except OSError:
+            self._ino, self._offset = None, 0
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._running = False
+        self._timer = TTkTimer()
+        self._timer.timeout.connect(self._refresh)
+
+    def offset(self):
+        '''Position of the next byte to be read'''
+        return self._offset
+
+    def start(self):
+        self._running = True
+        self._timer.start(0)
+
+    def stop(self):
+        '''Pause the follow, start() resumes it from the same offset'''
+        self._running = False
+
+    def running(self):
+        return self._running
+
+    def close(self):
+        self._running = False
+        self._timer.quit()
+
+    def _refresh(self):
+        if not self._running:
+            return
+        try:
+            st = os.stat(self._path)
+        except OSError:
+            st = None
+        interval = KodeFileFollower.interval
+        if st:
+            if st.st_ino != self._ino or st.st_size < self._offset:
+                if self._ino is not None:
+                    TTkLog.info(f"Follow {self._path}: {'truncated' if st.st_ino == self._ino else 'replaced'}, read from the beginning")
+                self._ino, self._offset = st.st_ino, 0
+                self._decoder.reset()
+            if st.st_size > self._offset:
+                try:
+                    with open(self._path, 'rb') as f:
+                        f.seek(self._offset)
+                        data = f.read(min(st.st_size-self._offset, KodeFileFollower.maxRead))
+                except OSError as e:
+                    TTkLog.error(f"Unable to follow {self._path}: {e}")
+                    data = b''
+                self._offset += len(data)
+                if text := self._decoder.decode(data):
+                    self._callback(text)
+                if data and self._offset < st.st_size:
+                    interval = 0
+        if self._running:
+            self._timer.start(interval)
@@ -20,12 +20,18 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from pygments.formatter import Formatter
+import os
+import importlib.util
+from threading import Lock
+
+import pygments
 from pygments.token import Keyword, Name, Comment, String, Error, \
     Number, Operator, Generic, Token, Whitespace
 
 from TermTk import TTkString, TTkColor, TTkLog
 
+from .kodesymbols import KodeSymbolIndex
+
 #: Map token types to a tuple of color values for light and dark
 #: backgrounds.
 TTKODE_COLORS = {
@@ -60,21 +66,37 @@ TTKODE_COLORS = {
     Error:              TTkColor.fg('#FF0000') , # ('_brightred_',      '_brightred_'),
 }
 
-class KodeFormatter(Formatter):
-    class Data():
-        __slots__=('lines', 'block', 'error', 'multiline')
-        def __init__(self, lines, block):
-            self.lines = lines
-            self.block = block
-            self.error = None
-            self.multiline = False
+class KodeStyle():
+    '''Process wide registry of the compiled styles
 
-    __slots__ = ('_dl', '_blockNum', '_kodeStyles')
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self._kodeStyles = {}
-        self._blockNum = 1
-        for token, style in self.style:
+    A style is compiled once in a table of token type -> TTkColor
+    shared by all the formatters.
+
+    Each token type has its own color object, this allows to find
+    the token type of an already highlighted char and recolor
+    the documents without lexing them again.
+    '''
+    _styles = {}
+    _stylesLock = Lock()
+    # Names of the pygments builtin styles (names)
+    _names = None
+    __slots__ = ('_name', '_colors', '_tokens', '_lock')
+    def __init__(self, name):
+        self._name = name
+        # The token types missing are added by the highlighter threads
+        # while the UI thread may read the tables (recolorMap)
+        self._lock = Lock()
+        self._colors = {}
+        # id(color) -> token type
+        self._tokens = {}
+        if name == 'ttkode':
+            for ttype, color in TTKODE_COLORS.items():
+                self._addColor(ttype, color.copy())
+            return
+        # pygments.styles scans the style plugins (importlib.metadata),
+        # imported only when the first pygments style is compiled
+        from pygments.styles import get_style_by_name
+        for ttype, style in get_style_by_name(name):
             # Token = Token.Comment.PreprocFile
             # style = {
             #   'color': '6272a4',
@@ -84,7 +106,7 @@ class KodeFormatter(Formatter):
             #   'roman': None, 'sans': None, 'mono': None,
             #   'ansicolor': None, 'bgansicolor': None}
 
-            # TTkLog.debug(f"{token=} {style=}")
+            # TTkLog.debug(f"{ttype=} {style=}")
             color = TTkColor.RST
             if style['color']:
                 color += TTkColor.fg(f"#{style['color']}")
@@ -96,47 +118,154 @@ class KodeFormatter(Formatter):
                 color += TTkColor.ITALIC
             if style['underline']:
                 color += TTkColor.UNDERLINE
-            self._kodeStyles[token] = color
+            self._addColor(ttype, color.copy())
 
-        super().__init__()
+    @staticmethod
+    def names():
+        '''Names of the pygments builtin styles, read from pygments.styles._mapping
+        without importing pygments.styles and its plugins lookup'''
+        if KodeStyle._names is None:
+            path = os.path.join(os.path.dirname(pygments.__file__), 'styles', '_mapping.py')
+            spec = importlib.util.spec_from_file_location('_kodeStylesMapping', path)
+            mapping = importlib.util.module_from_spec(spec)
+            try:
+                spec.loader.exec_module(mapping)
+                KodeStyle._names = frozenset(name for _, name, _ in mapping.STYLES.values())
+            except (OSError, AttributeError, ValueError) as e:
+                TTkLog.error(f"Unable to read the pygments styles: {e}")
+                KodeStyle._names = frozenset()
+        return KodeStyle._names
 
-    def setDl(self,dl):
-        self._dl = dl
+    @staticmethod
+    def get(name):
+        with KodeStyle._stylesLock:
+            if name not in KodeStyle._styles:
+                KodeStyle._styles[name] = KodeStyle(name)
+            return KodeStyle._styles[name]
 
-    def format(self, tokensource, _):
-        multiline = False
-        multilineId = 0
-        for ttype, value in tokensource:
-            if ttype == Error and self._dl.error is None:
-                self._dl.error = len(self._dl.lines)-1
-            # self._dl.multiline = ttype == Comment.Multiline
-            multiline = ttype == Comment.Multiline
+    def _addColor(self, ttype, color):
+        self._colors[ttype] = color
+        self._tokens[id(color)] = ttype
 
-            while ttype not in self._kodeStyles:
-                ttype = ttype.parent
-            # TTkLog.debug (f"{ttype=}")
-            # TTkLog.debug (f"{value=}")
-            color = self._kodeStyles[ttype]
+    def name(self):
+        return self._name
 
-            values = value.split('\n')
+    def color(self, ttype):
+        '''Return the color of the token type,
+        the token types not defined in the style are resolved
+        through their parents and memoized'''
+        if (color := self._colors.get(ttype)) is None:
+            with self._lock:
+                # Added by another thread in the meantime
+                if (color := self._colors.get(ttype)) is None:
+                    base = ttype
+                    while base not in self._colors:
+                        base = base.parent
+                    color = self._colors[base].copy()
+                    self._addColor(ttype, color)
+        return color
 
-            self._dl.lines[-1] += TTkString(values[0],color)
-            self._dl.lines += [TTkString(t,color) for t in values[1:]]
-            self._dl.block[-1] = self._blockNum
-            self._dl.block += [self._blockNum]*(len(values)-1)
+    def recolorMap(self, other):
+        '''Return the {id(color):color} map to convert the colors of this style in the other one'''
+        with self._lock:
+            tokens = list(self._tokens.items())
+        return {cid:other.color(ttype) for cid,ttype in tokens}
 
-            # self._dl.lines += [TTkString(t) for t in value.split('\n')]
+# Not derived from the pygments Formatter, whose constructor compiles a
+# pygments style importing pygments.styles, only format() is used
+class KodeFormatter():
+    class Data():
+        __slots__=('lines', 'states', 'symbols', 'texts', 'colors')
+        def __init__(self, lines, states):
+            self.lines = lines
+            # Lexer state at the beginning of each line (filled by KodeLexer)
+            self.states = states
+            # (line, name, kind) of the symbols found (KodeSymbolIndex)
+            self.symbols = []
+            # Text runs and colors of the line not ended yet (format stopped at maxLines)
+            self.texts = []
+            self.colors = []
 
-            # multiline = len(values)>1 if self._dl.lines[-1]._text == values[-1] else self._dl.multiline
-            # if self._dl.lines[-1]._text == '' or not multiline:
-            #     self._blockNum += 1
-            #     multilineId = len(self._dl.lines)
+        def drop(self, count):
+            '''Remove the first count lines, the following ones are numbered from 0'''
+            del self.lines[:count]
+            del self.states[:count]
+            self.symbols = [(l-count, name, kind) for l, name, kind in self.symbols if l >= count]
 
-            if multiline:
-                multilineId += len(values)
-            else:
-                multilineId = 0
-                self._blockNum += 1
+    __slots__ = ('_dl', '_kodeStyle')
+    def __init__(self, *args, **kwargs):
+        self._kodeStyle = KodeStyle.get(kwargs.get('style','gruvbox-dark'))
 
-        if multiline:
-            self._dl.multiline = multilineId
+    def kodeStyle(self):
+        return self._kodeStyle
+
+    def setKodeStyle(self, kodeStyle):
+        self._kodeStyle = kodeStyle
+
+    def setDl(self,dl):
+        self._dl = dl
+
+    @staticmethod
+    def _makeLine(texts, colors):
+        ret = TTkString()
+        ret._text = ''.join(texts)
+        ret._colors = colors
+        ret._hasTab = '\t' in ret._text
+        ret._checkWidth()
+        return ret
+
+    @staticmethod
+    def _colorLine(line, colors):
+        '''Copy of the TTkString line with new colors, the width of the text is not checked again'''
+        ret = TTkString.__new__(TTkString)
+        ret._text = line._text
+        ret._colors = colors
+        ret._baseColor = line._baseColor
+        ret._hasTab = line._hasTab
+        ret._hasSpecialWidth = line._hasSpecialWidth
+        return ret
+
+    def format(self, tokensource, _=None, maxLines=None):
+        '''Append the lines of the tokens to the Data (setDl).
+
+        If maxLines is set it stops as soon as there are maxLines lines and returns True,
+        the line not ended yet is kept in the Data and continued by the next call.
+        Return False when the tokens are exhausted, the last line is appended'''
+        # Each line is collected as a list of text runs and their colors
+        # and the TTkString is built only once at the end of the line
+        dl = self._dl
+        lines = dl.lines
+        kodeStyle = self._kodeStyle
+        kodeColors = kodeStyle._colors
+        makeLine = KodeFormatter._makeLine
+        symbols = dl.symbols
+        symbolKinds = KodeSymbolIndex._kinds
+        texts, colors = dl.texts, dl.colors
+        for ttype, value in tokensource:
+            if (color := kodeColors.get(ttype)) is None:
+                color = kodeStyle.color(ttype)
+            if (kind := symbolKinds.get(ttype)) is None:
+                kind = KodeSymbolIndex.kind(ttype)
+            if kind and (name := value.strip()):
+                symbols.append((len(lines), name, kind))
+
+            if '\n' not in value:
+                texts.append(value)
+                colors += [color]*len(value)
+                continue
+
+            values = value.split('\n')
+            for v in values[:-1]:
+                texts.append(v)
+                colors += [color]*len(v)
+                lines.append(makeLine(texts, colors))
+                texts, colors = [], []
+            v = values[-1]
+            texts.append(v)
+            colors += [color]*len(v)
+            if maxLines is not None and len(lines) >= maxLines:
+                dl.texts, dl.colors = texts, colors
+                return True
+        lines.append(makeLine(texts, colors))
+        dl.texts, dl.colors = [], []
+        return False
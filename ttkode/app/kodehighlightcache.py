@@ -0,0 +1,244 @@
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import json
+import struct
+import hashlib
+from array import array
+from bisect import bisect_right
+from itertools import groupby, compress
+from threading import Lock
+
+import pygments
+from pygments.token import string_to_tokentype
+
+from TermTk import TTkLog
+
+from .cfg import TTKodeCfg
+from .kodelexer import KodeLexer
+from .kodeformatter import KodeFormatter
+from .kodesymbols import KodeSymbolIndex
+
+# Entry file: header, meta (json), runs offset of each line, length and token of each run, state of each line
+_ENTRY_HEADER = struct.Struct('=4sI')
+_ENTRY_MAGIC  = b'KHC1'
+
+class KodeHighlightCache():
+    '''On disk cache of the highlight of the files
+
+    Once a document is fully highlighted its lines are saved as runs of
+    (length, token type) with the lexer state at the beginning of each line,
+    reopening the same file (real path, size, mtime) with the same lexer
+    and style restores the colors and the states without lexing it.
+
+    Each file has an entry in the config folder, the least recently
+    used ones are removed when the entries exceed maxSize
+    (overridden by options['highlightCacheSize']).
+    A corrupted entry is removed and the file is highlighted again.
+    '''
+    maxSize = 64*1024*1024
+    # Bumped when the entry layout changes
+    _cacheFormat = 2
+    _lock = Lock()
+
+    @staticmethod
+    def _folder():
+        return os.path.join(TTKodeCfg.pathCfg, 'highlight')
+
+    @staticmethod
+    def _entryPath(path):
+        return os.path.join(KodeHighlightCache._folder(), hashlib.sha1(path.encode()).hexdigest()+'.khc')
+
+    @staticmethod
+    def stamp(path):
+        '''Return the (size, mtime_ns) of the file, None if not readable'''
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    @staticmethod
+    def _meta(path, stamp, lexer, style):
+        return {
+            'version': pygments.__version__, 'format': KodeHighlightCache._cacheFormat,
+            'path': os.path.realpath(path), 'size': stamp[0], 'mtime': stamp[1],
+            'lexer': lexer, 'style': style }
+
+    @staticmethod
+    def save(path, stamp, lexer, kodeStyle, lines, states):
+        '''Save the highlighted lines (TTkString) and the lexer state id of each line,
+        stamp is the (size, mtime_ns) of the file when its text was read'''
+        tokens, typeIds = [], {}
+        offsets = array('I', [0])
+        lengths = array('I')
+        types   = array('H')
+        colorTypes = kodeStyle._tokens
+        for line in lines:
+            for cid, run in groupby(map(id, line._colors)):
+                # Not a color of the style (i.e. recolored in the meantime)
+                if (ttype := colorTypes.get(cid)) is None:
+                    return False
+                if (tid := typeIds.get(ttype)) is None:
+                    tid = typeIds[ttype] = len(tokens)
+                    tokens.append(str(ttype))
+                lengths.append(sum(1 for _ in run))
+                types.append(tid)
+            offsets.append(len(lengths))
+        # The state ids are local to the process, the entry has its own table
+        stateTable, stateIds = [], {}
+        lineStates = array('i')
+        for sid in states:
+            if sid >= 0:
+                if (lid := stateIds.get(sid)) is None:
+                    lid = stateIds[sid] = len(stateTable)
+                    stateTable.append(KodeLexer.state(sid))
+                sid = lid
+            lineStates.append(sid)
+        meta = KodeHighlightCache._meta(path, stamp, lexer, kodeStyle.name())
+        meta.update({'lines': len(lines), 'runs': len(lengths), 'tokens': tokens, 'states': stateTable})
+        meta = json.dumps(meta).encode()
+        entryPath = KodeHighlightCache._entryPath(os.path.realpath(path))
+        with KodeHighlightCache._lock:
+            try:
+                os.makedirs(os.path.dirname(entryPath), exist_ok=True)
+                with open(entryPath+'.tmp', 'wb') as f:
+                    f.write(_ENTRY_HEADER.pack(_ENTRY_MAGIC, len(meta)))
+                    f.write(meta)
+                    offsets.tofile(f)
+                    lengths.tofile(f)
+                    types.tofile(f)
+                    lineStates.tofile(f)
+                os.replace(entryPath+'.tmp', entryPath)
+            except OSError as e:
+                TTkLog.error(f"Unable to save the highlight cache: {e}")
+                return False
+            KodeHighlightCache._evict()
+        return True
+
+    @staticmethod
+    def load(path, stamp, lexer, kodeStyle, lines):
+        '''Return the (lines, states, symbols) of the file highlighted with the lexer and the style,
+        None if not cached or the entry does not match the stamp and the text of the lines (TTkString)'''
+        entryPath = KodeHighlightCache._entryPath(os.path.realpath(path))
+        try:
+            with open(entryPath, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        meta = KodeHighlightCache._meta(path, stamp, lexer, kodeStyle.name())
+        try:
+            ret = KodeHighlightCache._decode(data, meta, kodeStyle, lines)
+        except (ValueError, KeyError, IndexError, TypeError, AttributeError, struct.error) as e:
+            TTkLog.error(f"Corrupted highlight cache {entryPath}: {e}")
+            with KodeHighlightCache._lock:
+                try:
+                    os.remove(entryPath)
+                except OSError:
+                    pass
+            return None
+        if ret:
+            # The modification time is the last use of the entry
+            try:
+                os.utime(entryPath)
+            except OSError:
+                pass
+        return ret
+
+    @staticmethod
+    def _decode(data, expected, kodeStyle, lines):
+        magic, size = _ENTRY_HEADER.unpack_from(data)
+        if magic != _ENTRY_MAGIC:
+            raise ValueError("Wrong magic")
+        pos = _ENTRY_HEADER.size
+        meta = json.loads(data[pos:pos+size])
+        pos += size
+        # Outdated, the file, the lexer or the style changed
+        if any(meta.get(k) != v for k, v in expected.items()) or meta['lines'] != len(lines):
+            return None
+
+        def _array(code, count):
+            nonlocal pos
+            ret = array(code)
+            end = pos+count*ret.itemsize
+            if end > len(data):
+                raise ValueError("Truncated entry")
+            ret.frombytes(data[pos:end])
+            pos = end
+            return ret
+
+        runs = meta['runs']
+        offsets    = _array('I', len(lines)+1)
+        lengths    = _array('I', runs)
+        types      = _array('H', runs)
+        lineStates = _array('i', len(lines))
+        if pos != len(data):
+            raise ValueError("Wrong entry size")
+
+        ttypes   = [string_to_tokentype(t) for t in meta['tokens']]
+        palette  = [kodeStyle.color(t) for t in ttypes]
+        stateIds = [KodeLexer.stateId(tuple(s)) for s in meta['states']]
+        colorLine = KodeFormatter._colorLine
+        ret = []
+        for i, line in enumerate(lines):
+            fr, to = offsets[i], offsets[i+1]
+            if sum(lengths[fr:to]) != len(line._text):
+                raise ValueError(f"Wrong length of the line {i}")
+            colors = []
+            for n, t in zip(lengths[fr:to], types[fr:to]):
+                colors += [palette[t]]*n
+            ret.append(colorLine(line, colors))
+
+        # The symbols are the runs of the symbol token types
+        symbols = []
+        kinds = [KodeSymbolIndex.kind(t) for t in ttypes]
+        symbolTypes = {t for t, kind in enumerate(kinds) if kind}
+        for j in compress(range(runs), map(symbolTypes.__contains__, types)):
+            i = bisect_right(offsets, j)-1
+            col = sum(lengths[offsets[i]:j])
+            if name := lines[i]._text[col:col+lengths[j]].strip():
+                symbols.append((i, name, kinds[types[j]]))
+        states = array('i', [stateIds[s] if s >= 0 else KodeLexer.NOSTATE for s in lineStates])
+        return ret, states, symbols
+
+    @staticmethod
+    def _evict():
+        '''Remove the least recently used entries exceeding the max size'''
+        maxSize = TTKodeCfg.options.get('highlightCacheSize', KodeHighlightCache.maxSize)
+        try:
+            entries = []
+            for entry in os.scandir(KodeHighlightCache._folder()):
+                if entry.name.endswith('.khc'):
+                    st = entry.stat()
+                    entries.append((st.st_mtime_ns, st.st_size, entry.path))
+        except OSError:
+            return
+        total = sum(size for _, size, _ in entries)
+        for _, size, entryPath in sorted(entries):
+            if total <= maxSize:
+                break
+            try:
+                os.remove(entryPath)
+            except OSError:
+                pass
+            total -= size
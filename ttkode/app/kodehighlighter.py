@@ -0,0 +1,159 @@
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from time import perf_counter
+from threading import Lock
+
+from TermTk import TTkTimer
+
+class KodeHighlighter():
+    '''Single worker highlighting all the open documents
+
+    The documents are kept in most recently used order, the active one
+    (the current tab) is always highlighted first, the others only
+    when there was no input for :attr:`idleTime` seconds.
+    Inside each document the lines displayed in the views come first.
+    '''
+    # Seconds without edits or scrolls before the background documents are highlighted
+    idleTime = 1.0
+    # Fraction of the time spent highlighting, the rest is left to the input loop
+    refreshDuty = 0.8
+    # Most recently used first
+    _documents = []
+    # Documents with highlight work {doc:serial}, the serial is bumped at each request
+    _queued = {}
+    _serial = 0
+    _lastActivity = 0.0
+    _enabled = True
+    _timer = None
+    _lock = Lock()
+
+    @staticmethod
+    def register(doc):
+        with KodeHighlighter._lock:
+            if doc not in KodeHighlighter._documents:
+                KodeHighlighter._documents.append(doc)
+        KodeHighlighter.schedule(doc)
+
+    @staticmethod
+    def unregister(doc):
+        '''Stop highlighting the document'''
+        with KodeHighlighter._lock:
+            if doc in KodeHighlighter._documents:
+                KodeHighlighter._documents.remove(doc)
+            KodeHighlighter._queued.pop(doc, None)
+
+    @staticmethod
+    def setActive(doc):
+        '''Move the document on top of the queue (i.e. its tab is now the current one)'''
+        with KodeHighlighter._lock:
+            if doc not in KodeHighlighter._documents:
+                return
+            KodeHighlighter._documents.remove(doc)
+            KodeHighlighter._documents.insert(0, doc)
+        KodeHighlighter._wake()
+
+    @staticmethod
+    def trim(maxMemory):
+        '''Evict the least recently used documents exceeding maxMemory bytes,
+        they keep only their raw text until displayed again (KodeTextDocument.evict),
+        the active one is always kept.
+
+        Return the bytes used by the documents'''
+        with KodeHighlighter._lock:
+            documents = KodeHighlighter._documents[:]
+        total = 0
+        for i, doc in enumerate(documents):
+            size = doc.memorySize()
+            if i and total+size > maxMemory and doc.evict():
+                size = doc.memorySize()
+            total += size
+        return total
+
+    @staticmethod
+    def setEnabled(enabled):
+        '''Start/Stop the worker (i.e. the benchmarks drive the documents directly)'''
+        KodeHighlighter._enabled = enabled
+        if enabled:
+            KodeHighlighter._wake()
+
+    @staticmethod
+    def touch():
+        '''Record an user activity, it postpones the background highlight'''
+        KodeHighlighter._lastActivity = perf_counter()
+
+    @staticmethod
+    def idle():
+        '''Seconds since the last user activity'''
+        return perf_counter() - KodeHighlighter._lastActivity
+
+    @staticmethod
+    def schedule(doc):
+        '''The document has (or may have) lines to be highlighted'''
+        with KodeHighlighter._lock:
+            if doc not in KodeHighlighter._documents:
+                return
+            KodeHighlighter._serial += 1
+            KodeHighlighter._queued[doc] = KodeHighlighter._serial
+        KodeHighlighter._wake()
+
+    @staticmethod
+    def _wake():
+        if not KodeHighlighter._enabled:
+            return
+        with KodeHighlighter._lock:
+            if not KodeHighlighter._timer:
+                KodeHighlighter._timer = TTkTimer()
+                KodeHighlighter._timer.timeout.connect(KodeHighlighter._refresh)
+        KodeHighlighter._timer.start(0)
+
+    @staticmethod
+    def _next():
+        '''Return (doc, serial, wait) of the next document to be highlighted,
+        doc is None if there is nothing to do or the background ones have to wait'''
+        with KodeHighlighter._lock:
+            idle = KodeHighlighter.idle()
+            for i, doc in enumerate(KodeHighlighter._documents):
+                if doc not in KodeHighlighter._queued:
+                    continue
+                if i and idle < KodeHighlighter.idleTime:
+                    return None, 0, KodeHighlighter.idleTime - idle
+                return doc, KodeHighlighter._queued[doc], 0
+        return None, 0, None
+
+    @staticmethod
+    def _refresh():
+        if not KodeHighlighter._enabled:
+            return
+        doc, serial, wait = KodeHighlighter._next()
+        if not doc:
+            if wait is not None:
+                KodeHighlighter._timer.start(wait)
+            return
+        t = perf_counter()
+        if not doc._refreshEvent():
+            with KodeHighlighter._lock:
+                # Not rescheduled in the meantime
+                if KodeHighlighter._queued.get(doc) == serial:
+                    del KodeHighlighter._queued[doc]
+        duty = KodeHighlighter.refreshDuty
+        KodeHighlighter._timer.start((perf_counter()-t)*(1-duty)/duty)
@@ -0,0 +1,236 @@
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import re
+from threading import Lock
+
+from .cfg import TTKodeCfg
+
+class _KodeIgnoreRules():
+    '''Patterns of a .gitignore file, matched against the paths relative to its folder'''
+    __slots__ = ('_any', '_rules')
+    def __init__(self, lines):
+        rules = []
+        for line in lines:
+            line = line.rstrip('\n')
+            if not line.endswith('\\ '):
+                line = line.rstrip()
+            if not line or line.startswith('#'):
+                continue
+            negate = line.startswith('!')
+            if negate:
+                line = line[1:]
+            elif line.startswith('\\'):
+                # "\#" and "\!"
+                line = line[1:]
+            dirOnly = line.endswith('/')
+            line = line.rstrip('/')
+            if not line:
+                continue
+            # A pattern with a "/" is anchored to the folder of the .gitignore
+            if '/' in line:
+                regex = _KodeIgnoreRules._translate(line.lstrip('/'))
+            else:
+                regex = '(?:.*/)?' + _KodeIgnoreRules._translate(line)
+            rules.append((negate, dirOnly, re.compile(regex+r'\Z', re.DOTALL)))
+        self._rules = rules
+        # Most of the paths don't match any pattern, a single regex discards them
+        self._any = re.compile('|'.join(f"(?:{r.pattern})" for _, _, r in rules), re.DOTALL) if rules else None
+
+    @staticmethod
+    def _translate(pattern):
+        ret, i, n = [], 0, len(pattern)
+        while i < n:
+            c = pattern[i]
+            if pattern.startswith('**/', i):
+                ret.append('(?:.*/)?')
+                i += 3
+                continue
+            if pattern.startswith('**', i):
+                ret.append('.*')
+                i += 2
+                continue
+            if c == '*':
+                ret.append('[^/]*')
+            elif c == '?':
+                ret.append('[^/]')
+            elif c == '\\' and i+1 < n:
+                i += 1
+                ret.append(re.escape(pattern[i]))
+            elif c == '[' and (j := pattern.find(']', i+2)) > 0:
+                cls = pattern[i+1:j]
+                if cls[0] == '!':
+                    cls = '^' + cls[1:]
+                ret.append('[' + cls.replace('\\', '\\\\') + ']')
+                i = j
+            else:
+                ret.append(re.escape(c))
+            i += 1
+        return ''.join(ret)
+
+    def match(self, relPath, isDir):
+        '''Return True (ignored), False (negated) or None if no pattern matches'''
+        if not self._any or not self._any.match(relPath):
+            return None
+        for negate, dirOnly, regex in reversed(self._rules):
+            if (isDir or not dirOnly) and regex.match(relPath):
+                return not negate
+        return None
+
+class KodeIgnore():
+    '''Files and folders to be skipped below a root folder
+
+    The rules are the .gitignore files of the folders (starting from the
+    top of the git repository containing the root) and the patterns
+    configured in TTKodeCfg.options['ignore'].
+
+    The folders are supposed to be checked while descending the tree,
+    isIgnored(path) does not check the parents of path.
+    '''
+    # {root:KodeIgnore} shared by the file tree and the indexes
+    _instances = {}
+    _instancesLock = Lock()
+    __slots__ = ('_root', '_top', '_global', '_rules', '_matchers', '_version')
+    def __init__(self, root):
+        self._root = os.path.realpath(root)
+        self._top = KodeIgnore._gitTop(self._root) or self._root
+        self._global = _KodeIgnoreRules(TTKodeCfg.options.get('ignore', TTKodeCfg.ignore))
+        # {folder:(mtime_ns of the .gitignore, _KodeIgnoreRules or None)}
+        self._rules = {}
+        # {folder:[(prefix length, rules)]} rules of the entries of folder, closest first
+        self._matchers = {}
+        # Bumped when a .gitignore changes
+        self._version = 0
+
+    @staticmethod
+    def forRoot(root):
+        root = os.path.realpath(root)
+        with KodeIgnore._instancesLock:
+            if (ignore := KodeIgnore._instances.get(root)) is None:
+                ignore = KodeIgnore._instances[root] = KodeIgnore(root)
+        return ignore
+
+    @staticmethod
+    def _gitTop(path):
+        while True:
+            if os.path.exists(os.path.join(path, '.git')):
+                return path
+            if (parent := os.path.dirname(path)) == path:
+                return None
+            path = parent
+
+    def root(self):
+        return self._root
+
+    def version(self):
+        return self._version
+
+    def _load(self, folder):
+        try:
+            mtime = os.stat(gitignore := os.path.join(folder, '.gitignore')).st_mtime_ns
+        except OSError:
+            return None, None
+        try:
+            with open(gitignore, 'r', errors='replace') as f:
+                return mtime, _KodeIgnoreRules(f)
+        except OSError:
+            return None, None
+
+    def _folderRules(self, folder):
+        if (cached := self._rules.get(folder)) is None:
+            cached = self._rules[folder] = self._load(folder)
+        return cached[1]
+
+    def changed(self, folder):
+        '''Reload the .gitignore of folder if modified, return True if it changed'''
+        mtime, rules = self._load(folder)
+        if (cached := self._rules.get(folder)) is not None and cached[0] == mtime:
+            return False
+        self._rules[folder] = (mtime, rules)
+        if cached is None:
+            return False
+        self._matchers = {}
+        self._version += 1
+        return True
+
+    @staticmethod
+    def _inside(path, folder):
+        return path == folder or path.startswith(folder.rstrip('/')+'/')
+
+    def _folderMatchers(self, folder):
+        if (matchers := self._matchers.get(folder)) is not None:
+            return matchers
+        matchers = []
+        if KodeIgnore._inside(folder, self._top):
+            # The closest .gitignore wins
+            parent = folder
+            while True:
+                if rules := self._folderRules(parent):
+                    matchers.append((len(parent.rstrip('/'))+1, rules))
+                if parent == self._top:
+                    break
+                parent = os.path.dirname(parent)
+        # The configured patterns are relative to the root, or match the
+        # name of the files outside the root
+        if KodeIgnore._inside(folder, self._root):
+            matchers.append((len(self._root.rstrip('/'))+1, self._global))
+        else:
+            matchers.append((len(folder.rstrip('/'))+1, self._global))
+        self._matchers[folder] = matchers
+        return matchers
+
+    def isIgnored(self, path, isDir):
+        for prefix, rules in self._folderMatchers(os.path.dirname(path)):
+            if (ret := rules.match(path[prefix:], isDir)) is not None:
+                return ret
+        return False
+
+    def walk(self, root=None, stats=True):
+        '''Generate (path, stat) of the files not ignored below root, stat is None if not stats'''
+        dirs = [os.path.realpath(root) if root else self._root]
+        while dirs:
+            folder = dirs.pop()
+            try:
+                with os.scandir(folder) as it:
+                    entries = list(it)
+            except OSError:
+                continue
+            matchers = self._folderMatchers(folder)
+            for entry in entries:
+                try:
+                    isDir = entry.is_dir(follow_symlinks=False)
+                    if not isDir and not entry.is_file():
+                        continue
+                    for prefix, rules in matchers:
+                        if (ignored := rules.match(entry.path[prefix:], isDir)) is not None:
+                            break
+                    else:
+                        ignored = False
+                    if ignored:
+                        continue
+                    if isDir:
+                        dirs.append(entry.path)
+                    else:
+                        yield entry.path, entry.stat() if stats else None
+                except OSError:
+                    continue
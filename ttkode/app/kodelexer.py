@@ -0,0 +1,289 @@
+# MIT License
+#
+# Copyright (c) 2022 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import os
+import re
+import json
+import fnmatch
+import importlib
+from threading import Lock
+
+import pygments
+from pygments.token import _TokenType, Error, Whitespace
+
+from TermTk import TTkLog
+
+from .cfg import TTKodeCfg
+
+class KodeLexer():
+    '''Resumable wrapper around a pygments lexer
+
+    While producing the tokens it records the lexer state at the
+    beginning of each line, this allows the highlighter to restart
+    from any line with a known state instead of the top of the block.
+
+    The state is the pygments state stack (a tuple) or None if the
+    line begins in the middle of a token (i.e. a multiline regex match)
+    '''
+    ROOT = ('root',)
+    # Id of the unknown (None) state
+    NOSTATE = -1
+    # Interned states, the documents store the state of each line as
+    # an int (index in _stateList) instead of a tuple per line
+    _stateIds  = {ROOT:0}
+    _stateList = [ROOT]
+    _stateLock = Lock()
+    # Bumped when the index layout changes
+    _indexFormat = 2
+    # Extension/Filename/Shebang -> Lexer class name index
+    _index = None
+    # Interpreters not matching any lexer alias
+    _interpreters = {'node':'JavascriptLexer', 'nodejs':'JavascriptLexer'}
+    __slots__ = ('_lexer', '_lexerRef', '_resumable')
+    def __init__(self, lexer=None, lexerRef=None):
+        '''lexer is a pygments lexer instance, alternatively lexerRef (module, class name)
+        defers the import of the lexer module to the first tokenization'''
+        self._lexer = None
+        self._lexerRef = lexerRef
+        self._resumable = False
+        if lexer:
+            self._setLexer(lexer)
+
+    @staticmethod
+    def stateId(state):
+        '''Return the int identifying the state (NOSTATE if None)'''
+        if state is None:
+            return KodeLexer.NOSTATE
+        if (sid := KodeLexer._stateIds.get(state)) is None:
+            with KodeLexer._stateLock:
+                if (sid := KodeLexer._stateIds.get(state)) is None:
+                    KodeLexer._stateList.append(state)
+                    sid = KodeLexer._stateIds[state] = len(KodeLexer._stateList)-1
+        return sid
+
+    @staticmethod
+    def state(sid):
+        '''Return the state identified by sid (None if NOSTATE)'''
+        return None if sid < 0 else KodeLexer._stateList[sid]
+
+    def _setLexer(self, lexer):
+        from pygments.lexer import RegexLexer
+        self._lexer = lexer
+        # Only the plain RegexLexer loop can be resumed from an arbitrary state,
+        # lexers overriding it (C/C++ stdlib types, ExtendedRegexLexer, ...)
+        # are lexed from the top of the document
+        self._resumable = (
+            isinstance(lexer, RegexLexer) and
+            type(lexer).get_tokens_unprocessed is RegexLexer.get_tokens_unprocessed )
+
+    @staticmethod
+    def _buildIndex():
+        from pygments.lexers import find_lexer_class_for_filename
+        from pygments.lexers._mapping import LEXERS
+        index = {
+            'version': pygments.__version__, 'format': KodeLexer._indexFormat,
+            'suffixes':{}, 'filenames':{}, 'patterns':[], 'interpreters':{},
+            'modules': {cls:module for cls, (module, *_) in LEXERS.items()} }
+        for cls, (_, _, aliases, filenames, _) in LEXERS.items():
+            for alias in aliases:
+                index['interpreters'].setdefault(alias, cls)
+            for pattern in filenames:
+                if pattern.startswith('*.') and not re.search(r'[*?\[]', pattern[1:]):
+                    index['suffixes'].setdefault(pattern[1:], []).append(cls)
+                elif not re.search(r'[*?\[]', pattern):
+                    index['filenames'].setdefault(pattern, []).append(cls)
+                else:
+                    index['patterns'].append((pattern, cls))
+        index['interpreters'].update(KodeLexer._interpreters)
+        # Multiple lexers for the same extension are solved once
+        # in the same way pygments does without analysing the content
+        for key, fakeName in (('suffixes', 'x{}'), ('filenames', '{}')):
+            for name, classes in index[key].items():
+                if len(classes) > 1:
+                    try:
+                        classes = [find_lexer_class_for_filename(fakeName.format(name)).__name__]
+                    except Exception:
+                        pass
+                index[key][name] = classes[0]
+        return index
+
+    @staticmethod
+    def _loadIndex():
+        if KodeLexer._index:
+            return KodeLexer._index
+        indexPath = os.path.join(TTKodeCfg.pathCfg, 'lexers.json')
+        try:
+            with open(indexPath) as f:
+                index = json.load(f)
+            if (index.get('version') != pygments.__version__ or
+                index.get('format')  != KodeLexer._indexFormat):
+                index = None
+        except (OSError, ValueError):
+            index = None
+        if not index:
+            TTkLog.debug(f"Building the lexers index: {indexPath}")
+            index = KodeLexer._buildIndex()
+            try:
+                os.makedirs(TTKodeCfg.pathCfg, exist_ok=True)
+                with open(indexPath, 'w') as f:
+                    json.dump(index, f)
+            except OSError as e:
+                TTkLog.error(f"Unable to save the lexers index: {e}")
+        KodeLexer._index = index
+        return index
+
+    @staticmethod
+    def _lexerClassForFile(filePath, text):
+        index = KodeLexer._loadIndex()
+        baseName = os.path.basename(filePath)
+        if cls := index['filenames'].get(baseName):
+            return cls
+        # Longest suffix first, i.e. ".html.erb" before ".erb"
+        pos = baseName.find('.')
+        while pos != -1:
+            if cls := index['suffixes'].get(baseName[pos:]):
+                return cls
+            pos = baseName.find('.', pos+1)
+        for pattern, cls in index['patterns']:
+            if fnmatch.fnmatch(baseName, pattern):
+                return cls
+        # Shebang: "#!/usr/bin/python3", "#!/usr/bin/env -S python3 -u"
+        if text.startswith('#!'):
+            args = text[2:].split('\n',1)[0].split()
+            if args and os.path.basename(args[0]) == 'env':
+                args = [a for a in args[1:] if not a.startswith('-')]
+            if args:
+                interpreter = os.path.basename(args[0])
+                for name in (interpreter, re.sub(r'[\d.]+$', '', interpreter)):
+                    if cls := index['interpreters'].get(name):
+                        return cls
+        return None
+
+    @staticmethod
+    def forFile(filePath, text='', guess=True):
+        '''Return the KodeLexer of the file resolved through the
+        extension/filename/shebang index.
+
+        The content is analysed only for the unknown files if guess is True,
+        return None if no lexer is found and guess is False
+        '''
+        if cls := KodeLexer._lexerClassForFile(filePath, text):
+            return KodeLexer(lexerRef=(KodeLexer._index['modules'][cls], cls))
+        if not guess:
+            return None
+        from pygments.lexers import guess_lexer, special
+        from pygments.util import ClassNotFound
+        try:
+            return KodeLexer(guess_lexer(text))
+        except ClassNotFound:
+            return KodeLexer(special.TextLexer())
+
+    def lexer(self):
+        if not self._lexer:
+            module, cls = self._lexerRef
+            self._setLexer(getattr(importlib.import_module(module), cls)())
+        return self._lexer
+
+    def name(self):
+        return self.lexer().name
+
+    def className(self):
+        '''Name of the pygments lexer class, the lexer module is not imported'''
+        return self._lexerRef[1] if self._lexerRef else type(self._lexer).__name__
+
+    def isResumable(self):
+        self.lexer()
+        return self._resumable
+
+    def tokens(self, text, state, states):
+        '''Generate the (ttype, value) tokens of text starting from state,
+        the state at the beginning of each following line is appended to states'''
+        if self.isResumable():
+            return self._regexTokens(text, state, states)
+        return self._fallbackTokens(text, states)
+
+    def _fallbackTokens(self, text, states):
+        # The state of the lexer is hidden, a 'root' restart at the end of a line
+        # is wrong inside any multiline construct (a statement, a heredoc, ...),
+        # the lines have no known state and the highlight never converges early
+        for _, ttype, value in self._lexer.get_tokens_unprocessed(text):
+            if n := value.count('\n'):
+                states += [None]*n
+            yield ttype, value
+
+    # Same loop used in pygments.lexer.RegexLexer.get_tokens_unprocessed
+    # exposing the state stack at each line boundary
+    def _regexTokens(self, text, state, states):
+        lexer = self._lexer
+        pos = 0
+        tokendefs = lexer._tokens
+        statestack = list(state)
+        statetokens = tokendefs[statestack[-1]]
+        while True:
+            for rexmatch, action, newState in statetokens:
+                m = rexmatch(text, pos)
+                if m:
+                    end = m.end()
+                    # The states of the lines ended by the match are recorded before its tokens,
+                    # a consumer stopping at any token has the states of all the lines received
+                    if newState is not None:
+                        if isinstance(newState, tuple):
+                            for s in newState:
+                                if s == '#pop':
+                                    if len(statestack) > 1:
+                                        statestack.pop()
+                                elif s == '#push':
+                                    statestack.append(statestack[-1])
+                                else:
+                                    statestack.append(s)
+                        elif isinstance(newState, int):
+                            if abs(newState) >= len(statestack):
+                                del statestack[1:]
+                            else:
+                                del statestack[newState:]
+                        elif newState == '#push':
+                            statestack.append(statestack[-1])
+                        statetokens = tokendefs[statestack[-1]]
+                    if n := text.count('\n', pos, end):
+                        # The state is known only if the match ends exactly at the end of the line
+                        states += [None]*(n-1)
+                        states.append(tuple(statestack) if text[end-1] == '\n' else None)
+                    if action is not None:
+                        if type(action) is _TokenType:
+                            yield action, m.group()
+                        else:
+                            for _, ttype, value in action(lexer, m):
+                                yield ttype, value
+                    pos = end
+                    break
+            else:
+                if pos >= len(text):
+                    break
+                if text[pos] == '\n':
+                    statestack = ['root']
+                    statetokens = tokendefs['root']
+                    states.append(KodeLexer.ROOT)
+                    yield Whitespace, '\n'
+                else:
+                    yield Error, text[pos]
+                pos += 1
@@ -0,0 +1,248 @@
+# MIT License
+#
+# Copyright (c) 2022 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import os
+import re
+import mmap
+import bisect
+import itertools
+from array import array
+from threading import Lock
+from collections import OrderedDict
+
+from TermTk import TTkString
+
+class KodeMappedFile():
+    '''Read only memory map of a file with the offsets of its lines
+
+    The offsets are collected in a single pass over the map,
+    the lines are decoded on request and the most recent
+    ones are kept in a small LRU cache.
+
+    The file must not be truncated while it is mapped: reading the
+    pages past the new end raises SIGBUS and kills the process,
+    the mapped documents are never followed for this reason
+    (KodeTextDocument.setFollow). An appended file is still safe,
+    the new bytes are not indexed.
+
+    :meth:`fromText` returns the same structure on an in memory
+    utf-8 copy of a text (i.e. the raw text of an evicted document).
+    '''
+    __slots__ = ('_file', '_mmap', '_offsets', '_size', '_maxWidth', '_cache', '_cacheSize', '_lock')
+    def __init__(self, filePath, cacheSize=4096):
+        self._file = open(filePath, 'rb')
+        self._size = os.fstat(self._file.fileno()).st_size
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self._size else b''
+        self._index(cacheSize)
+
+    @staticmethod
+    def fromText(text, cacheSize=256):
+        ret = KodeMappedFile.__new__(KodeMappedFile)
+        ret._file = None
+        ret._mmap = text.encode('utf-8', errors='surrogatepass')
+        ret._size = len(ret._mmap)
+        ret._index(cacheSize)
+        return ret
+
+    def _index(self, cacheSize):
+        # _offsets[i] = position of the first byte of the line i
+        self._offsets = array('Q', [0])
+        self._offsets.extend(m.end() for m in re.finditer(b'\n', self._mmap))
+        # Width in bytes of the longest line, an upper bound of the chars
+        self._maxWidth = max(map(int.__sub__, itertools.chain(self._offsets[1:],[self._size+1]), self._offsets))-1
+        self._cache = OrderedDict()
+        self._cacheSize = cacheSize
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def size(self):
+        return self._size
+
+    def maxWidth(self):
+        return self._maxWidth
+
+    def close(self):
+        if self._file:
+            if self._size:
+                self._mmap.close()
+            self._file.close()
+
+    def line(self, i, cache=True):
+        with self._lock:
+            if (ret := self._cache.get(i)) is not None:
+                self._cache.move_to_end(i)
+                return ret
+        fr = self._offsets[i]
+        to = self._offsets[i+1]-1 if i+1 < len(self._offsets) else self._size
+        if to > fr and self._mmap[to-1] == 0x0d: # '\r'
+            to -= 1
+        ret = TTkString(self._mmap[fr:to].decode('utf-8', errors='replace'))
+        if cache:
+            with self._lock:
+                self._cache[i] = ret
+                if len(self._cache) > self._cacheSize:
+                    self._cache.popitem(last=False)
+        return ret
+
+class KodeMappedLines():
+    '''List like container of the lines of a KodeMappedFile
+
+    Used as _dataLines of the documents too big to be loaded,
+    it is a sequence of segments, each one is either a range of lines
+    of the mapped file or a list of TTkString (the edited or highlighted lines).
+
+    Slices return a new KodeMappedLines sharing the same map, this keeps
+    the document operations (edits, undo snapshots, cursor selections)
+    proportional to the number of segments instead of the number of lines.
+
+    The segments are replaced atomically and the lists are only
+    modified in place or extended, the lines can be read
+    while another thread is updating them.
+    '''
+    __slots__ = ('_map', '_data')
+    def __init__(self, mappedFile, segments=None):
+        self._map = mappedFile
+        if segments is None:
+            segments = [range(len(mappedFile))]
+        self._setSegments(segments)
+
+    @staticmethod
+    def fromFile(filePath):
+        return KodeMappedLines(KodeMappedFile(filePath))
+
+    def mappedFile(self):
+        return self._map
+
+    def _setSegments(self, segments):
+        segs = []
+        for seg in segments:
+            if not len(seg):
+                continue
+            if type(seg) is list and segs and type(segs[-1]) is list:
+                segs[-1].extend(seg)
+            else:
+                segs.append(seg)
+        self._data = (segs, list(itertools.accumulate(len(s) for s in segs)))
+
+    def _slice(self, fr, to):
+        '''Return the segments of the lines [fr,to), the lists are copied'''
+        ret = []
+        start = 0
+        for seg, end in zip(*self._data):
+            if start >= to:
+                break
+            if end > fr:
+                ret.append(seg[max(fr-start,0):min(to,end)-start])
+            start = end
+        return ret
+
+    def _segments(self, other):
+        if isinstance(other, KodeMappedLines):
+            return other._slice(0, len(other))
+        return [list(other)]
+
+    def __len__(self):
+        ends = self._data[1]
+        return ends[-1] if ends else 0
+
+    def __iter__(self):
+        line = self._map.line
+        for seg in self._data[0]:
+            if type(seg) is range:
+                for i in seg:
+                    yield line(i, cache=False)
+            else:
+                yield from seg
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            fr, to, _ = i.indices(len(self))
+            return KodeMappedLines(self._map, self._slice(fr, max(fr,to)))
+        segs, ends = self._data
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('line index out of range')
+        s = bisect.bisect_right(ends, i)
+        seg = segs[s]
+        o = i - (ends[s-1] if s else 0)
+        if type(seg) is range:
+            return self._map.line(seg[o])
+        return seg[o]
+
+    def __setitem__(self, i, value):
+        if isinstance(i, slice):
+            fr, to, _ = i.indices(len(self))
+            to = max(fr,to)
+            self._setSegments(self._slice(0,fr) + self._segments(value) + self._slice(to,len(self)))
+            return
+        segs, ends = self._data
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('line assignment index out of range')
+        s = bisect.bisect_right(ends, i)
+        seg = segs[s]
+        o = i - (ends[s-1] if s else 0)
+        if type(seg) is list:
+            seg[o] = value
+        else:
+            self._setSegments(segs[:s] + [seg[:o], [value], seg[o+1:]] + segs[s+1:])
+
+    def insert(self, i, value):
+        self[i:i] = [value]
+
+    def extend(self, other):
+        self[len(self):] = other
+
+    def __iadd__(self, other):
+        self.extend(other)
+        return self
+
+    def __add__(self, other):
+        return KodeMappedLines(self._map, self._slice(0,len(self)) + self._segments(other))
+
+    def __radd__(self, other):
+        return KodeMappedLines(self._map, [list(other)] + self._slice(0,len(self)))
+
+    def copy(self):
+        return KodeMappedLines(self._map, self._slice(0,len(self)))
+
+    def materialized(self):
+        '''Return the [(index, line)] of the lines not read from the map'''
+        ret = []
+        start = 0
+        for seg, end in zip(*self._data):
+            if type(seg) is list:
+                ret += zip(range(start,end), seg)
+            start = end
+        return ret
+
+    def materializedCount(self):
+        '''Return the number of lines not read from the map'''
+        return sum(len(seg) for seg in self._data[0] if type(seg) is list)
+
+    def maxWidth(self):
+        return max([self._map.maxWidth()]+[len(l) for _,l in self.materialized()])
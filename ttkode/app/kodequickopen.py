@@ -0,0 +1,383 @@
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import re
+import sys
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+from time import perf_counter
+from threading import Lock
+
+from TermTk import TTkLog, TTkColor, TTkString, TTkTimer
+from TermTk import pyTTkSlot, pyTTkSignal
+from TermTk import TTkWindow, TTkGridLayout, TTkLineEdit, TTkList
+
+from .kodehighlighter import KodeHighlighter
+from .kodeignore import KodeIgnore
+
+class _KodePathTable():
+    '''Immutable snapshot of the paths searched by KodePathIndex
+
+    The paths are sorted by length, the lowercase paths (and names) are joined
+    by '\\n' in a single string searched with str.find for the literal matches.
+    Each char has a bitmap (int) of the paths (and names) containing it, the AND
+    of the bitmaps of the query chars selects the only paths checked by the fuzzy match.
+    '''
+    # Bits set in each byte value
+    _byteBits = tuple(tuple(b for b in range(8) if v>>b&1) for v in range(256))
+    # Max candidates ranked in a single pass instead of searching the blobs
+    directLimit = 8000
+    __slots__ = ('_paths', '_lower', '_names', '_pblob', '_poffs', '_nblob', '_noffs', '_bits', '_nbits')
+    def __init__(self):
+        self._paths = []
+        self._lower = []
+        self._names = []
+        self._pblob = self._nblob = '\n'
+        self._poffs = self._noffs = array('I')
+        self._bits = {}
+        self._nbits = {}
+
+    # Generator building the tables, it yields after each char bitmap
+    def _build(self, paths):
+        self._paths = paths = sorted(paths, key=lambda p: (len(p), p))
+        self._lower = lower = [p.lower() for p in paths]
+        self._names = names = [p[p.rfind('/')+1:] for p in lower]
+        self._pblob, self._poffs = _KodePathTable._join(lower)
+        self._nblob, self._noffs = _KodePathTable._join(names)
+        yield
+        bits, nbits = {}, {}
+        for c in set(self._pblob)-{'\n'}:
+            # The bit i is the path i
+            bits[c] = int(''.join('1' if c in p else '0' for p in reversed(lower)), 2)
+            yield
+        for c in set(self._nblob)-{'\n'}:
+            nbits[c] = int(''.join('1' if c in p else '0' for p in reversed(names)), 2)
+            yield
+        self._bits, self._nbits = bits, nbits
+
+    @staticmethod
+    def _join(strings):
+        # '\n' before each string, the offsets are the beginning of each one
+        offsets = array('I', accumulate((len(s)+1 for s in strings), initial=1))
+        return '\n'+'\n'.join(strings)+'\n', offsets[:-1]
+
+    def __len__(self):
+        return len(self._paths)
+
+    def paths(self):
+        return self._paths
+
+    def _mask(self, query, bits=None):
+        '''Bitmap of the paths (or names using the names bitmaps) containing all the chars of the query'''
+        bits = self._bits if bits is None else bits
+        mask = -1
+        for c in set(query):
+            mask &= bits.get(c, 0)
+        return max(mask, 0)
+
+    def _candidates(self, mask):
+        '''Generate the ids of the paths in the mask'''
+        data = mask.to_bytes((len(self._paths)+7)//8, 'little')
+        byteBits = _KodePathTable._byteBits
+        for m in re.finditer(b'[^\x00]', data):
+            base = m.start()*8
+            for b in byteBits[data[base//8]]:
+                yield base+b
+
+    @staticmethod
+    def _fuzzy(query):
+        '''Regex matching the query chars in order, each one matched at its
+        first occurrence (possessive/atomic to avoid the backtracking)'''
+        if sys.version_info >= (3, 11):
+            return re.compile(''.join(f"[^{re.escape(c)}]*+{re.escape(c)}" for c in query))
+        return re.compile(''.join(f"(?=(?P<g{i}>[^{re.escape(c)}]*))(?P=g{i}){re.escape(c)}" for i, c in enumerate(query)))
+
+    def find(self, query, limit, within=None):
+        '''Return up to limit (path, kind) matching the lowercase query, ranked by kind:
+            'name':       name beginning with the query
+            'inname':     name containing the query
+            'inpath':     path containing the query
+            'fuzzyname':  name containing the query chars in order
+            'fuzzypath':  path containing the query chars in order
+        and by length within the same kind.
+
+        Few candidates (within, the ids matched by a shorter query, or the
+        paths containing all the query chars) are ranked in a single pass and
+        the ids of all the matches are returned as second value, otherwise
+        the first matches are searched in the blobs and the ids are None'''
+        if within is None:
+            if not (mask := self._mask(query)):
+                return [], []
+            if bin(mask).count('1') <= _KodePathTable.directLimit:
+                within = self._candidates(mask)
+        elif len(within) > _KodePathTable.directLimit:
+            mask = self._mask(query)
+            within = None
+        if within is not None:
+            return self._rank(query, limit, within)
+        return self._search(query, limit, mask), None
+
+    def _rank(self, query, limit, ids):
+        inName = '/' not in query
+        fuzzy = _KodePathTable._fuzzy(query).match
+        names, lower = self._names, self._lower
+        kinds = ('name', 'inname', 'inpath', 'fuzzyname', 'fuzzypath')
+        tiers = ([], [], [], [], [])
+        matched = []
+        for i in ids:
+            name = names[i]
+            if inName and name.startswith(query):
+                tiers[0].append(i)
+            elif inName and query in name:
+                tiers[1].append(i)
+            elif query in lower[i]:
+                tiers[2].append(i)
+            elif inName and fuzzy(name):
+                tiers[3].append(i)
+            elif fuzzy(lower[i]):
+                tiers[4].append(i)
+            else:
+                continue
+            matched.append(i)
+        ret = [(self._paths[i], kind) for kind, tier in zip(kinds, tiers) for i in tier[:limit]]
+        return ret[:limit], matched
+
+    def _search(self, query, limit, mask):
+        ret = []
+        seen = set()
+        # The query matches in the name only if it does not contain '/'
+        inName = '/' not in query
+
+        def _literal(blob, offsets, needle, kind, skip=0):
+            pos = 0
+            while len(ret) < limit and (pos := blob.find(needle, pos)) >= 0:
+                i = bisect_right(offsets, pos+skip)-1
+                if i not in seen:
+                    seen.add(i)
+                    ret.append((self._paths[i], kind))
+                pos += 1
+
+        if inName:
+            _literal(self._nblob, self._noffs, '\n'+query, 'name', skip=1)
+            _literal(self._nblob, self._noffs, query, 'inname')
+        _literal(self._pblob, self._poffs, query, 'inpath')
+        if len(ret) >= limit:
+            return ret
+
+        # The names are checked first, only the candidates of the names
+        # bitmaps, the paths are checked until the limit is reached
+        fuzzy = _KodePathTable._fuzzy(query).match
+        for kind, strings, fmask in (
+                ('fuzzyname', self._names, self._mask(query, self._nbits) if inName else 0),
+                ('fuzzypath', self._lower, mask)):
+            for i in self._candidates(fmask):
+                if len(ret) >= limit:
+                    return ret
+                if i not in seen and fuzzy(strings[i]):
+                    seen.add(i)
+                    ret.append((self._paths[i], kind))
+        return ret
+
+    @staticmethod
+    def positions(path, query, kind):
+        '''Return the positions in path of the chars matching the (lowercase) query'''
+        lower = path.lower()
+        start = lower.rfind('/')+1 if kind in ('name', 'inname', 'fuzzyname') else 0
+        if not kind.startswith('fuzzy'):
+            pos = lower.find(query, start)
+            return list(range(pos, pos+len(query)))
+        ret = []
+        pos = start
+        for c in query:
+            pos = lower.find(c, pos)
+            ret.append(pos)
+            pos += 1
+        return ret
+
+class KodePathIndex():
+    '''Relative paths of the workspace files, used by Quick Open
+
+    The paths are collected by a background worker (only when KodeHighlighter
+    reports no user activity) walking the files not ignored by KodeIgnore,
+    the folder is scanned again every rescanInterval seconds
+    and the search tables are rebuilt if the paths changed.
+    '''
+    # Seconds of scan in a tick and fraction of the time spent scanning
+    scanBudget = 0.02
+    scanDuty = 0.5
+    # Min seconds between two scans, the scans taking longer are
+    # repeated after rescanFactor times their duration
+    rescanInterval = 10.0
+    rescanFactor = 20
+    _table = _KodePathTable()
+    # (table, query, ids) of the last find
+    _last = (None, '', None)
+    _root = None
+    _walker = None
+    _nextScan = 0.0
+    _timer = None
+    _lock = Lock()
+
+    @staticmethod
+    def start(root='.'):
+        '''Start the background scans of the root folder'''
+        with KodePathIndex._lock:
+            KodePathIndex._root = os.path.realpath(root)
+            KodePathIndex._walker = None
+            KodePathIndex._nextScan = 0.0
+            if not KodePathIndex._timer:
+                KodePathIndex._timer = TTkTimer()
+                KodePathIndex._timer.timeout.connect(KodePathIndex._refresh)
+        KodePathIndex._timer.start(0)
+
+    @staticmethod
+    def refresh():
+        '''Scan the root folder again as soon as possible'''
+        if KodePathIndex._timer and not KodePathIndex._walker:
+            KodePathIndex._nextScan = 0.0
+            KodePathIndex._timer.start(0)
+
+    @staticmethod
+    def scan(root='.'):
+        '''Scan the root folder in the calling thread'''
+        KodePathIndex._root = os.path.realpath(root)
+        for _ in KodePathIndex._scan(KodePathIndex._root):
+            pass
+
+    @staticmethod
+    def scanning():
+        return KodePathIndex._walker is not None
+
+    @staticmethod
+    def count():
+        return len(KodePathIndex._table)
+
+    @staticmethod
+    def find(query, limit=50):
+        '''Return up to limit (path, positions) matching the query (case insensitive,
+        the spaces are ignored), positions are the indexes of the matching chars'''
+        if not (q := ''.join(query.lower().split())):
+            return []
+        table = KodePathIndex._table
+        # While typing each query narrows the matches of the previous one
+        lastTable, lastQuery, lastIds = KodePathIndex._last
+        within = lastIds if lastTable is table and lastIds is not None and q.startswith(lastQuery) else None
+        found, ids = table.find(q, limit, within)
+        KodePathIndex._last = (table, q, ids)
+        return [(path, _KodePathTable.positions(path, q, kind)) for path, kind in found]
+
+    @staticmethod
+    def root():
+        return KodePathIndex._root
+
+    @staticmethod
+    def _refresh():
+        if (walker := KodePathIndex._walker) is None:
+            if (wait := KodePathIndex._nextScan-perf_counter()) > 0:
+                return KodePathIndex._timer.start(wait)
+            walker = KodePathIndex._walker = KodePathIndex._scan(KodePathIndex._root)
+        if (idle := KodeHighlighter.idle()) < KodeHighlighter.idleTime:
+            return KodePathIndex._timer.start(KodeHighlighter.idleTime-idle)
+        t = perf_counter()
+        for _ in walker:
+            if perf_counter()-t > KodePathIndex.scanBudget:
+                break
+        else:
+            KodePathIndex._walker = None
+            return KodePathIndex._timer.start(KodePathIndex._nextScan-perf_counter())
+        duty = KodePathIndex.scanDuty
+        KodePathIndex._timer.start((perf_counter()-t)*(1-duty)/duty)
+
+    # Generator scanning the root folder, it yields after each file
+    # to allow the worker to split the scan in time slices
+    @staticmethod
+    def _scan(root):
+        t = perf_counter()
+        prefix = len(root.rstrip('/'))+1
+        paths = []
+        for path, _ in KodeIgnore.forRoot(root).walk(stats=False):
+            paths.append(path[prefix:])
+            yield
+        if len(paths) != len(KodePathIndex._table) or set(paths) != set(KodePathIndex._table.paths()):
+            table = _KodePathTable()
+            yield from table._build(paths)
+            KodePathIndex._table = table
+            TTkLog.debug(f"Paths {root}: {len(paths)} files in {perf_counter()-t:.1f}s")
+        elapsed = perf_counter()-t
+        KodePathIndex._nextScan = perf_counter() + max(KodePathIndex.rescanInterval, elapsed*KodePathIndex.rescanFactor)
+
+class KodeQuickOpenWindow(TTkWindow):
+    '''Go to File, the workspace paths are filtered while typing'''
+    _matchColor = TTkColor.fg('#FFFF00') + TTkColor.BOLD
+    _folderColor = TTkColor.fg('#888888')
+    maxResults = 50
+    __slots__ = ('fileActivated', '_search', '_results')
+    def __init__(self, *args, **kwargs):
+        # Signals
+        self.fileActivated = pyTTkSignal(str)
+        super().__init__(*args, **kwargs)
+        self.resize(80,20)
+        self.setLayout(TTkGridLayout())
+        self._search  = TTkLineEdit()
+        self._results = TTkList()
+        self.layout().addWidget(self._search,  0, 0)
+        self.layout().addWidget(self._results, 1, 0)
+        self._search.textEdited.connect(self._query)
+        self._search.returnPressed.connect(self._activateFirst)
+        self._results.itemClicked.connect(self._activate)
+        KodePathIndex.refresh()
+        self._setTitle()
+
+    def _setTitle(self, info=''):
+        scanning = ', scanning' if KodePathIndex.scanning() else ''
+        self.setTitle(f"Go to File ({KodePathIndex.count()} files{scanning}) {info}")
+
+    def focusInEvent(self):
+        self._search.setFocus()
+
+    @pyTTkSlot(str)
+    def _query(self, text):
+        t = perf_counter()
+        results = KodePathIndex.find(str(text), self.maxResults)
+        elapsed = perf_counter()-t
+        for item in list(self._results.items()):
+            self._results.removeItem(item)
+        for path, positions in results:
+            name = path.rfind('/')+1
+            label = TTkString(path[name:]) + TTkString(f"  {path[:name]}", KodeQuickOpenWindow._folderColor)
+            for pos in positions:
+                # The name is displayed before its folder
+                label.setColorAt(pos-name if pos >= name else len(path)-name+2+pos, KodeQuickOpenWindow._matchColor)
+            self._results.addItem(label, data=path)
+        self._setTitle(f"{len(results)} in {elapsed*1000:.1f}ms")
+
+    @pyTTkSlot()
+    def _activateFirst(self):
+        if items := self._results.items():
+            self._activate(items[0])
+
+    def _activate(self, item):
+        path = os.path.join(KodePathIndex.root(), item.data())
+        self.close()
+        self.fileActivated.emit(path)
@@ -0,0 +1,622 @@
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import json
+import mmap
+import shutil
+import struct
+import hashlib
+from array import array
+from bisect import bisect_left
+from time import perf_counter, sleep
+from threading import Lock
+
+from TermTk import TTkK, TTkLog, TTkColor, TTkString, TTkTimer
+from TermTk import pyTTkSlot, pyTTkSignal
+from TermTk import TTkFrame, TTkGridLayout, TTkLabel, TTkComboBox, TTkCheckbox
+from TermTk import TTkAbstractScrollArea, TTkAbstractScrollView
+
+from .cfg import TTKodeCfg
+from .kodeignore import KodeIgnore
+
+# Segment file: header, sorted trigram keys, postings offsets, postings (file ids)
+_SEGMENT_HEADER = struct.Struct('=4sII')
+_SEGMENT_MAGIC  = b'KSG1'
+
+# The functions below run in the worker processes
+
+def _initWorker():
+    # Referenced by the pool to import this module in the workers
+    # while they are started (before the stdin is closed)
+    pass
+
+def _readData(path, maxSize):
+    '''Return the bytes of the file, None if binary, too big or not readable'''
+    try:
+        with open(path, 'rb') as f:
+            data = f.read(maxSize+1)
+    except OSError:
+        return None
+    if len(data) > maxSize or b'\0' in data[:8192]:
+        return None
+    return data
+
+def _trigrams(data):
+    return {data[i:i+3] for i in range(len(data)-2)}
+
+def _writeSegment(segPath, keys, postings):
+    '''Write the segment with the sorted int keys and their postings (lists of file ids)'''
+    offsets = array('I', [0])
+    ids = array('I')
+    for p in postings:
+        ids.extend(p)
+        offsets.append(len(ids))
+    with open(segPath+'.tmp', 'wb') as f:
+        f.write(_SEGMENT_HEADER.pack(_SEGMENT_MAGIC, len(keys), len(ids)))
+        array('I', keys).tofile(f)
+        offsets.tofile(f)
+        ids.tofile(f)
+    os.replace(segPath+'.tmp', segPath)
+
+def _indexFiles(segPath, files, maxSize):
+    '''Index the [(id, path)] files in a new segment, return the ids of the text files'''
+    grams = {}
+    texts = []
+    for fid, path in files:
+        if (data := _readData(path, maxSize)) is None:
+            continue
+        texts.append(fid)
+        for gram in _trigrams(data.lower()):
+            if (p := grams.get(gram)) is None:
+                grams[gram] = [fid]
+            else:
+                p.append(fid)
+    # bytes and big endian ints have the same order
+    keys = sorted(grams)
+    _writeSegment(segPath, [int.from_bytes(k, 'big') for k in keys], [grams[k] for k in keys])
+    return texts
+
+def _mergeSegments(segPath, segPaths, dead):
+    '''Merge the segments in a new one dropping the dead file ids'''
+    dead = set(dead)
+    grams = {}
+    for path in segPaths:
+        keys, offsets, ids = _KodeSearchSegment._read(path)
+        for i, key in enumerate(keys):
+            p = ids[offsets[i]:offsets[i+1]]
+            if dead:
+                p = [fid for fid in p if fid not in dead]
+            if (q := grams.get(key)) is None:
+                grams[key] = q = array('I')
+            q.extend(p)
+    keys = sorted(k for k, p in grams.items() if p)
+    _writeSegment(segPath, keys, [grams[k] for k in keys])
+
+class _KodeSearchSegment():
+    '''Memory mapped segment of the trigram index'''
+    __slots__ = ('_path', '_mm', '_keys', '_offsets', '_ids')
+    def __init__(self, path):
+        self._path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._keys, self._offsets, self._ids = _KodeSearchSegment._split(memoryview(self._mm))
+
+    @staticmethod
+    def _split(buf):
+        if len(buf) < _SEGMENT_HEADER.size:
+            raise ValueError('Corrupted segment')
+        magic, nkeys, nids = _SEGMENT_HEADER.unpack_from(buf, 0)
+        if magic != _SEGMENT_MAGIC or len(buf) != _SEGMENT_HEADER.size + 4*(2*nkeys+1+nids):
+            raise ValueError('Corrupted segment')
+        pos = _SEGMENT_HEADER.size
+        keys    = buf[pos:pos+4*nkeys].cast('I')
+        pos += 4*nkeys
+        offsets = buf[pos:pos+4*(nkeys+1)].cast('I')
+        pos += 4*(nkeys+1)
+        ids     = buf[pos:].cast('I')
+        return keys, offsets, ids
+
+    @staticmethod
+    def _read(path):
+        with open(path, 'rb') as f:
+            return _KodeSearchSegment._split(memoryview(f.read()))
+
+    def name(self):
+        return os.path.basename(self._path)
+
+    def postings(self, key):
+        '''Return the ids of the files containing the trigram key'''
+        i = bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            return self._ids[self._offsets[i]:self._offsets[i+1]]
+        return ()
+
+class KodeSearchIndex():
+    '''Workspace trigram index used by "Find in Files"
+
+    Each file is split in its (lowercase) trigrams, the index maps
+    each trigram to the ids of the files containing it, a query
+    reads only the files containing all its trigrams.
+
+    The index is stored under TTKodeCfg.pathCfg in immutable segments
+    built by a pool of worker processes, the files table keeps
+    the mtime/size of each file; an update reindexes in new segments
+    only the new/changed files and the segments are merged
+    when they are too many.
+
+    Nothing is read or spawned until the first search (refresh()).
+    '''
+    # Files bigger than this are not indexed (nor searched)
+    maxFileSize = 1024*1024
+    # Files indexed by a worker in a segment (and max bytes read)
+    batchFiles = 512
+    batchBytes = 8*1024*1024
+    # The segments are merged when they are more than this
+    maxSegments = 8
+    workers = max(1, min(4, (os.cpu_count() or 2)-1))
+    _tableFormat = 1
+    _root = None
+    _path = None
+    # {path:[id, mtime, size, text]}
+    _files = {}
+    # {id:path} of the indexed text files
+    _paths = {}
+    # Paths waiting to be indexed, always read by the search
+    _pending = set()
+    # Ids of the files removed/changed still in the segments
+    _dead = set()
+    _segments = []
+    _nextId = 0
+    _nextSegment = 0
+    _loaded = False
+    # The files of the root folder were walked at least once
+    _ready = False
+    _timer = None
+    _lock = Lock()
+
+    @staticmethod
+    def setRoot(root):
+        '''Folder indexed, the index is loaded/updated by update()'''
+        with KodeSearchIndex._lock:
+            KodeSearchIndex._reset()
+            KodeSearchIndex._root = os.path.realpath(root)
+            KodeSearchIndex._path = os.path.join(TTKodeCfg.pathCfg, 'search',
+                hashlib.sha1(KodeSearchIndex._root.encode()).hexdigest())
+            KodeSearchIndex._loaded = False
+            KodeSearchIndex._ready = False
+
+    @staticmethod
+    def start(root='.'):
+        '''Index the root folder in background, loaded and updated from the first search'''
+        if not KodeSearchIndex._timer:
+            KodeSearchIndex.setRoot(root)
+            with KodeSearchIndex._lock:
+                KodeSearchIndex._timer = TTkTimer()
+                KodeSearchIndex._timer.timeout.connect(KodeSearchIndex.update)
+
+    @staticmethod
+    def refresh():
+        '''Check the files changed since the last update in background'''
+        if KodeSearchIndex._timer:
+            KodeSearchIndex._timer.start(0)
+
+    @staticmethod
+    def indexing():
+        '''Return the number of files waiting to be indexed'''
+        return len(KodeSearchIndex._pending)
+
+    @staticmethod
+    def _reset():
+        KodeSearchIndex._files = {}
+        KodeSearchIndex._paths = {}
+        KodeSearchIndex._pending = set()
+        KodeSearchIndex._dead = set()
+        KodeSearchIndex._segments = []
+        KodeSearchIndex._nextId = 0
+        KodeSearchIndex._nextSegment = 0
+
+    @staticmethod
+    def _load():
+        # A missing or corrupted index is rebuilt from scratch
+        path = KodeSearchIndex._path
+        try:
+            with open(os.path.join(path, 'files.json')) as f:
+                table = json.load(f)
+            if table.get('format') != KodeSearchIndex._tableFormat or table.get('root') != KodeSearchIndex._root:
+                raise ValueError('Outdated index')
+            segments = [_KodeSearchSegment(os.path.join(path, name)) for name in table['segments']]
+            with KodeSearchIndex._lock:
+                KodeSearchIndex._files = table['files']
+                KodeSearchIndex._paths = {fid:p for p, (fid, _, _, text) in table['files'].items() if text}
+                KodeSearchIndex._dead = set(table['dead'])
+                KodeSearchIndex._segments = segments
+                KodeSearchIndex._nextId = table['nextId']
+                KodeSearchIndex._nextSegment = table['nextSegment']
+            names = set(table['segments']) | {'files.json'}
+            for name in os.listdir(path):
+                if name not in names:
+                    os.remove(os.path.join(path, name))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            TTkLog.error(f"Search index {path} rebuilt: {e}")
+            with KodeSearchIndex._lock:
+                KodeSearchIndex._reset()
+            shutil.rmtree(path, ignore_errors=True)
+
+    @staticmethod
+    def _save():
+        with KodeSearchIndex._lock:
+            table = json.dumps({
+                'format': KodeSearchIndex._tableFormat, 'root': KodeSearchIndex._root,
+                'nextId': KodeSearchIndex._nextId, 'nextSegment': KodeSearchIndex._nextSegment,
+                'segments': [s.name() for s in KodeSearchIndex._segments],
+                'dead': sorted(KodeSearchIndex._dead),
+                'files': KodeSearchIndex._files })
+        tablePath = os.path.join(KodeSearchIndex._path, 'files.json')
+        try:
+            with open(tablePath+'.tmp', 'w') as f:
+                f.write(table)
+            os.replace(tablePath+'.tmp', tablePath)
+        except OSError as e:
+            TTkLog.error(f"Unable to save the search index: {e}")
+
+    @staticmethod
+    def _newSegment():
+        with KodeSearchIndex._lock:
+            KodeSearchIndex._nextSegment += 1
+            return os.path.join(KodeSearchIndex._path, f"seg-{KodeSearchIndex._nextSegment}.bin")
+
+    @staticmethod
+    def update():
+        '''Index the new/changed files of the root folder, the heavy work is done by the worker processes'''
+        t = perf_counter()
+        if not KodeSearchIndex._loaded:
+            KodeSearchIndex._load()
+            KodeSearchIndex._loaded = True
+        seen = {path:(st.st_mtime, st.st_size) for path, st in KodeIgnore.forRoot(KodeSearchIndex._root).walk()}
+        with KodeSearchIndex._lock:
+            files = KodeSearchIndex._files
+            removed = [path for path, (_, mtime, size, _) in files.items() if seen.get(path) != (mtime, size)]
+            for path in removed:
+                fid = files.pop(path)[0]
+                KodeSearchIndex._paths.pop(fid, None)
+                KodeSearchIndex._dead.add(fid)
+            todo = [path for path in seen if path not in files and seen[path][1] <= KodeSearchIndex.maxFileSize]
+            KodeSearchIndex._pending = set(todo)
+            KodeSearchIndex._ready = True
+        if not (todo or removed):
+            return
+        os.makedirs(KodeSearchIndex._path, exist_ok=True)
+
+        # Batches of files with consecutive ids
+        batches, batch, size = [], [], 0
+        for path in todo:
+            batch.append((KodeSearchIndex._nextId, path))
+            KodeSearchIndex._nextId += 1
+            size += seen[path][1]
+            if len(batch) >= KodeSearchIndex.batchFiles or size >= KodeSearchIndex.batchBytes:
+                batches.append(batch)
+                batch, size = [], 0
+        if batch:
+            batches.append(batch)
+
+        if batches or KodeSearchIndex._mergeNeeded():
+            # Only imported by the updates, not at startup
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor, as_completed
+            ctx = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(KodeSearchIndex.workers, mp_context=ctx, initializer=_initWorker) as pool:
+                futures = {
+                    pool.submit(_indexFiles, segPath := KodeSearchIndex._newSegment(), batch, KodeSearchIndex.maxFileSize):(segPath, batch)
+                    for batch in batches }
+                for future in as_completed(futures):
+                    segPath, batch = futures[future]
+                    try:
+                        texts = set(future.result())
+                        segment = _KodeSearchSegment(segPath)
+                    except Exception as e:
+                        # Left to the next update
+                        TTkLog.error(f"Unable to index {len(batch)} files: {e}")
+                        continue
+                    with KodeSearchIndex._lock:
+                        for fid, path in batch:
+                            KodeSearchIndex._files[path] = [fid, *seen[path], fid in texts]
+                            if fid in texts:
+                                KodeSearchIndex._paths[fid] = path
+                            KodeSearchIndex._pending.discard(path)
+                        KodeSearchIndex._segments.append(segment)
+                    KodeSearchIndex._save()
+                KodeSearchIndex._merge(pool)
+        KodeSearchIndex._pending = set()
+        KodeSearchIndex._save()
+        TTkLog.debug(f"Search index {KodeSearchIndex._root}: {len(todo)} indexed, {len(removed)} removed in {perf_counter()-t:.1f}s")
+
+    @staticmethod
+    def _mergeNeeded():
+        return (len(KodeSearchIndex._segments) > KodeSearchIndex.maxSegments or
+                len(KodeSearchIndex._dead) > len(KodeSearchIndex._paths))
+
+    @staticmethod
+    def _merge(pool):
+        if not KodeSearchIndex._mergeNeeded():
+            return
+        with KodeSearchIndex._lock:
+            segments = list(KodeSearchIndex._segments)
+            dead = sorted(KodeSearchIndex._dead)
+        segPath = KodeSearchIndex._newSegment()
+        try:
+            pool.submit(_mergeSegments, segPath, [s._path for s in segments], dead).result()
+            merged = _KodeSearchSegment(segPath)
+        except Exception as e:
+            TTkLog.error(f"Unable to merge the search index: {e}")
+            return
+        with KodeSearchIndex._lock:
+            KodeSearchIndex._segments = [merged]
+            KodeSearchIndex._dead -= set(dead)
+        KodeSearchIndex._save()
+        # Still mapped by the searches in progress
+        for segment in segments:
+            try:
+                os.remove(segment._path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def candidates(query):
+        '''Return the sorted paths of the files that may contain the query'''
+        # Only the ascii trigrams, the index is lowercased as bytes
+        grams = [int.from_bytes(g, 'big') for g in _trigrams(query.encode().lower()) if max(g) < 0x80]
+        with KodeSearchIndex._lock:
+            segments = list(KodeSearchIndex._segments)
+            paths = dict(KodeSearchIndex._paths)
+            ret = set(KodeSearchIndex._pending)
+        if not grams:
+            return sorted(ret.union(paths.values()))
+        for segment in segments:
+            # Intersection starting from the rarest trigram
+            postings = sorted((segment.postings(g) for g in grams), key=len)
+            ids = set(postings[0])
+            for p in postings[1:]:
+                if not ids:
+                    break
+                ids.intersection_update(p)
+            ret.update(paths[fid] for fid in ids if fid in paths)
+        return sorted(ret)
+
+    @staticmethod
+    def search(query, caseSensitive=False):
+        '''Generate the (path, line, pos, text) of the lines matching the query'''
+        needle = query if caseSensitive else query.lower()
+        # The first search waits for the files of the root folder
+        while not KodeSearchIndex._ready and KodeSearchIndex._timer:
+            sleep(0.005)
+            yield None, None, None, None
+        for path in KodeSearchIndex.candidates(query):
+            try:
+                with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                    text = f.read()
+            except OSError:
+                continue
+            hay = text if caseSensitive else text.lower()
+            line = prev = 0
+            pos = hay.find(needle)
+            while pos >= 0:
+                line += hay.count('\n', prev, pos)
+                start = hay.rfind('\n', 0, pos)+1
+                if (end := hay.find('\n', pos)) < 0:
+                    end = len(hay)
+                yield path, line, pos-start, text[start:end]
+                # A result for each line
+                prev = pos
+                pos = hay.find(needle, end)
+            # Let the caller know the file is done
+            yield path, None, None, None
+
+class _KodeSearchResultsView(TTkAbstractScrollView):
+    _fileColor   = TTkColor.fg('#88FFFF')
+    _lineColor   = TTkColor.fg('#888888')
+    _matchColor  = TTkColor.fg('#FFFF00') + TTkColor.BOLD
+    _selectColor = TTkColor.bg('#444488')
+    __slots__ = ('resultActivated', '_rows', '_selected', '_width')
+    def __init__(self, *args, **kwargs):
+        # Signals
+        self.resultActivated = pyTTkSignal(str, int)
+        super().__init__(*args, **kwargs)
+        # (path, line, TTkString), line is None in the file rows
+        self._rows = []
+        self._selected = -1
+        self._width = 0
+        self.setFocusPolicy(TTkK.ClickFocus + TTkK.TabFocus)
+
+    def clear(self):
+        self._rows = []
+        self._selected = -1
+        self._width = 0
+        self.viewMoveTo(0, 0)
+        self.viewChanged.emit()
+        self.update()
+
+    def addFile(self, path):
+        self._addRow(path, None, TTkString(os.path.relpath(path), _KodeSearchResultsView._fileColor))
+
+    def addMatch(self, path, line, pos, text, size):
+        text = text[:pos+200].replace('\t', ' ')
+        label = ( TTkString(f"{line+1:6} ", _KodeSearchResultsView._lineColor) +
+                  TTkString(text[:pos]) +
+                  TTkString(text[pos:pos+size], _KodeSearchResultsView._matchColor) +
+                  TTkString(text[pos+size:]) )
+        self._addRow(path, line, label)
+
+    def _addRow(self, path, line, label):
+        self._rows.append((path, line, label))
+        self._width = max(self._width, label.termWidth())
+
+    def rowsAdded(self):
+        self.viewChanged.emit()
+        self.update()
+
+    def viewFullAreaSize(self) -> (int, int):
+        return self._width, len(self._rows)
+
+    def viewDisplayedSize(self) -> (int, int):
+        return self.size()
+
+    def _activate(self, row):
+        if 0 <= row < len(self._rows):
+            self._selected = row
+            path, line, _ = self._rows[row]
+            self.update()
+            self.resultActivated.emit(path, line or 0)
+
+    def mousePressEvent(self, evt):
+        _, oy = self.getViewOffsets()
+        self._activate(oy+evt.y)
+        return True
+
+    def keyEvent(self, evt):
+        if evt.type != TTkK.SpecialKey or not self._rows:
+            return False
+        row = self._selected
+        if evt.key == TTkK.Key_Enter:
+            self._activate(row)
+            return True
+        if evt.key == TTkK.Key_Up:
+            row = max(0, row-1)
+        elif evt.key == TTkK.Key_Down:
+            row = min(len(self._rows)-1, row+1)
+        else:
+            return False
+        self._selected = row
+        ox, oy = self.getViewOffsets()
+        if row < oy:
+            self.viewMoveTo(ox, row)
+        elif row >= oy+self.height():
+            self.viewMoveTo(ox, row-self.height()+1)
+        self.update()
+        return True
+
+    def paintEvent(self, canvas):
+        ox, oy = self.getViewOffsets()
+        w, h = self.size()
+        for y, (_, _, label) in enumerate(self._rows[oy:oy+h]):
+            if oy+y == self._selected:
+                canvas.fill(pos=(0,y), size=(w,1), color=_KodeSearchResultsView._selectColor)
+                label = label.completeColor(_KodeSearchResultsView._selectColor)
+            canvas.drawText(pos=(-ox,y), text=label)
+
+class _KodeSearchResults(TTkAbstractScrollArea):
+    __slots__ = ('_view')
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._view = _KodeSearchResultsView()
+        self.setViewport(self._view)
+
+    def view(self):
+        return self._view
+
+class KodeSearchPanel(TTkFrame):
+    '''Find in Files, the results are displayed while the files are read'''
+    # Max results displayed
+    maxResults = 10000
+    # Seconds of search in a refresh
+    _searchBudget = 0.02
+    __slots__ = ('resultActivated', '_query', '_case', '_results', '_status',
+                 '_search', '_searchQuery', '_searchTime', '_found', '_foundFiles', '_timer', '_searchLock')
+    def __init__(self, *args, **kwargs):
+        # Signals
+        self.resultActivated = pyTTkSignal(str, int)
+        super().__init__(*args, **kwargs)
+        self.setLayout(layout := TTkGridLayout())
+        # The recent queries are the combobox list itself
+        self._query   = TTkComboBox(editable=True, list=TTKodeCfg.searches, insertPolicy=TTkK.NoInsert)
+        self._case    = TTkCheckbox(text='Aa', maxWidth=6)
+        self._results = _KodeSearchResults()
+        self._status  = TTkLabel(maxHeight=1)
+        layout.addWidget(self._query,   0, 0)
+        layout.addWidget(self._case,    0, 1)
+        layout.addWidget(self._results, 1, 0, 1, 2)
+        layout.addWidget(self._status,  2, 0, 1, 2)
+        self._search = None
+        self._searchLock = Lock()
+        self._timer = TTkTimer()
+        self._timer.timeout.connect(self._refresh)
+        self._query.currentTextChanged.connect(self.find)
+        self._results.view().resultActivated.connect(self.resultActivated.emit)
+
+    def focusQuery(self):
+        self._query.setFocus()
+
+    @pyTTkSlot(str)
+    def find(self, query):
+        '''Start a new search, the previous one is cancelled'''
+        if not (query := str(query)):
+            return
+        # Most recent first
+        searches = TTKodeCfg.searches
+        if query in searches:
+            searches.remove(query)
+        searches.insert(0, query)
+        del searches[TTKodeCfg.maxsearches:]
+        TTKodeCfg.save(searches=True, filters=False, colors=False, options=False)
+        KodeSearchIndex.refresh()
+        with self._searchLock:
+            self._search = KodeSearchIndex.search(query, self._case.isChecked())
+            self._searchQuery = query
+            self._searchTime = perf_counter()
+            self._found = self._foundFiles = 0
+            self._results.view().clear()
+        self._status.setText(f"Searching {query}")
+        self._timer.start(0)
+
+    def _refresh(self):
+        with self._searchLock:
+            if not (search := self._search):
+                return
+            view = self._results.view()
+            size = len(self._searchQuery)
+            t = perf_counter()
+            done = True
+            for path, line, pos, text in search:
+                if line is None:
+                    if perf_counter()-t > KodeSearchPanel._searchBudget:
+                        done = False
+                        break
+                    continue
+                if not view._rows or view._rows[-1][0] != path:
+                    view.addFile(path)
+                    self._foundFiles += 1
+                view.addMatch(path, line, pos, text, size)
+                self._found += 1
+                if self._found >= KodeSearchPanel.maxResults:
+                    break
+            view.rowsAdded()
+            elapsed = perf_counter()-self._searchTime
+            if done:
+                self._search = None
+                self._status.setText(f"{self._found} results in {self._foundFiles} files ({elapsed*1000:.0f}ms)")
+            else:
+                indexing = f", indexing {n} files" if (n := KodeSearchIndex.indexing()) else ''
+                self._status.setText(f"{self._found} results in {self._foundFiles} files{indexing}...")
+        if not done:
+            self._timer.start(0.01)
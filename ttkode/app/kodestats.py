@@ -0,0 +1,229 @@
+# MIT License
+#
+# Copyright (c) 2022 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import os
+from time import perf_counter
+from collections import deque
+
+from TermTk import TTkColor, TTkTimer, TTkWindow, TTkTerm
+
+class KodeDocStats():
+    '''Highlight counters and timers of a KodeTextDocument
+
+    The stats exist only if enabled (KodeTextDocument.setStatsEnabled),
+    otherwise the document does not time anything.
+    All the fields are updated holding the document lock.
+    '''
+    # Refreshes kept in the history
+    historySize = 200
+    __slots__ = (
+        'refreshes', 'lines', 'committed', 'applied', 'guessed', 'resumed', 'rebased', 'discarded',
+        'rangeTime', 'lexTime', 'formatTime', 'spliceTime',
+        'maxRefresh', 'locks', 'history')
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.refreshes  = 0   # Refreshes applied to the document
+        self.lines      = 0   # Lines lexed
+        self.committed  = 0   # Lines highlighted and confirmed
+        self.applied    = 0   # Confirmed lines stored, the splice stops when the highlight converges
+        self.guessed    = 0   # Refreshes started from a guessed state
+        self.resumed    = 0   # Refreshes continuing the lex of the previous one
+        self.rebased    = 0   # Results applied to a document changed in the meantime
+        self.discarded  = 0   # Results dropped because the document changed
+        self.rangeTime  = 0.0 # Range selection (backward walk) and snapshot
+        self.lexTime    = 0.0
+        self.formatTime = 0.0
+        self.spliceTime = 0.0 # Results applied to the document
+        self.maxRefresh = 0.0
+        # {kind: [count, wait, hold, maxWait, maxHold]}
+        self.locks = {}
+        # (line, lines, committed, applied, guess, resumed, range, lex, format, splice)
+        self.history = deque(maxlen=KodeDocStats.historySize)
+
+    def addRefresh(self, ra, rb, commit, applied, guess, resumed, tRange, tLex, tFormat, tSplice):
+        self.refreshes  += 1
+        self.lines      += rb
+        self.committed  += commit
+        self.applied    += applied
+        self.guessed    += guess
+        self.resumed    += resumed
+        self.rangeTime  += tRange
+        self.lexTime    += tLex
+        self.formatTime += tFormat
+        self.spliceTime += tSplice
+        self.maxRefresh = max(self.maxRefresh, tRange+tLex+tFormat+tSplice)
+        self.history.append((ra, rb, commit, applied, guess, resumed, tRange, tLex, tFormat, tSplice))
+
+    def addLock(self, kind, wait, hold):
+        if not (lock := self.locks.get(kind)):
+            lock = self.locks[kind] = [0, 0.0, 0.0, 0.0, 0.0]
+        lock[0] += 1
+        lock[1] += wait
+        lock[2] += hold
+        lock[3] = max(lock[3], wait)
+        lock[4] = max(lock[4], hold)
+
+    def linesSec(self):
+        t = self.lexTime + self.formatTime
+        return self.lines/t if t else 0.0
+
+    def summary(self):
+        '''Return the stats as a dict (times in seconds)'''
+        return {
+            'refreshes':  self.refreshes,
+            'lines':      self.lines,
+            'committed':  self.committed,
+            'applied':    self.applied,
+            'guessed':    self.guessed,
+            'resumed':    self.resumed,
+            'rebased':    self.rebased,
+            'discarded':  self.discarded,
+            'linesSec':   self.linesSec(),
+            'rangeTime':  self.rangeTime,
+            'lexTime':    self.lexTime,
+            'formatTime': self.formatTime,
+            'spliceTime': self.spliceTime,
+            'maxRefresh': self.maxRefresh,
+            'locks': {k:dict(zip(('count','wait','hold','maxWait','maxHold'),v)) for k,v in self.locks.items()} }
+
+class KodeRepaintStats():
+    '''Repaints of the KodeTextEditView and bytes written to the terminal
+
+    The views count the highlight updates received, the ones skipped
+    (the lines are not displayed) and their repaints.
+    The terminal writes are counted only once enabled (KodeStatsWindow).
+    '''
+    updates  = 0
+    skipped  = 0
+    repaints = 0
+    bytes    = 0
+    _push = None
+
+    @staticmethod
+    def enable():
+        '''Count the bytes written to the terminal wrapping TTkTerm.push'''
+        if KodeRepaintStats._push:
+            return
+        push = KodeRepaintStats._push = TTkTerm.push
+        def _push(*args):
+            KodeRepaintStats.bytes += sum(len(str(a).encode()) for a in args)
+            push(*args)
+        TTkTerm.push = staticmethod(_push)
+
+    @staticmethod
+    def counters():
+        '''Return (updates, skipped, repaints, bytes)'''
+        return KodeRepaintStats.updates, KodeRepaintStats.skipped, KodeRepaintStats.repaints, KodeRepaintStats.bytes
+
+class KodeTimedLock():
+    '''Document lock recording the wait and hold time in KodeDocStats'''
+    __slots__ = ('_lock', '_stats', '_kind', '_t0', '_t1')
+    def __init__(self, lock, stats, kind):
+        self._lock  = lock
+        self._stats = stats
+        self._kind  = kind
+
+    def acquire(self):
+        self._t0 = perf_counter()
+        self._lock.acquire()
+        self._t1 = perf_counter()
+        return True
+
+    def release(self):
+        # Recorded before the release, the stats are protected by the lock itself
+        self._stats.addLock(self._kind, self._t1-self._t0, perf_counter()-self._t1)
+        self._lock.release()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *_):
+        self.release()
+
+class KodeStatsWindow(TTkWindow):
+    '''Debug panel with the highlight stats of the open documents'''
+    __slots__ = ('_documents', '_timer', '_repaints')
+    def __init__(self, *args, documents, **kwargs):
+        self._documents = documents
+        KodeRepaintStats.enable()
+        # (time, counters) of the previous refresh, the repaints are shown per second
+        self._repaints = (perf_counter(), KodeRepaintStats.counters(), (0.0,)*4)
+        super().__init__(*args, **kwargs)
+        self.setTitle('Highlight Stats')
+        self.resize(100,20)
+        self._timer = TTkTimer()
+        self._timer.timeout.connect(self._refresh)
+        self._timer.start(0.5)
+
+    def _refresh(self):
+        # Dismissed overlay
+        if not self.parentWidget():
+            return self._timer.quit()
+        t, last, _ = self._repaints
+        now, counters = perf_counter(), KodeRepaintStats.counters()
+        self._repaints = (now, counters, tuple((b-a)/(now-t) for a,b in zip(last, counters)))
+        self.update()
+        self._timer.start(0.5)
+
+    def close(self):
+        self._timer.quit()
+        super().close()
+
+    def paintEvent(self, canvas):
+        hdr  = TTkColor.fg('#FFFF88')
+        name = TTkColor.fg('#88FFFF')
+        y = 2
+        canvas.drawText(pos=(2,y), color=hdr,
+            text=f"{'document':20} {'refr':>6} {'lines':>8} {'lines/s':>8} {'range':>7} {'lex':>7} {'format':>7} {'splice':>7} {'max':>6} {'resm':>5} {'disc':>5}")
+        for document in self._documents.values():
+            doc = document['doc']
+            if not (stats := doc.stats()):
+                continue
+            y += 1
+            canvas.drawText(pos=(2,y), color=name, text=f"{os.path.basename(doc.filePath())[:20]:20}")
+            canvas.drawText(pos=(23,y),
+                text=(f"{stats.refreshes:6} {stats.lines:8} {stats.linesSec():8.0f} "
+                      f"{stats.rangeTime*1000:7.1f} {stats.lexTime*1000:7.1f} {stats.formatTime*1000:7.1f} "
+                      f"{stats.spliceTime*1000:7.1f} {stats.maxRefresh*1000:6.1f} "
+                      f"{stats.resumed:5} {stats.discarded:5}"))
+        y += 2
+        canvas.drawText(pos=(2,y), color=hdr,
+            text=f"{'document':20} {'lock':8} {'count':>7} {'wait':>8} {'hold':>8} {'maxWait':>8} {'maxHold':>8}   (ms)")
+        for document in self._documents.values():
+            doc = document['doc']
+            if not (stats := doc.stats()):
+                continue
+            for kind, (count, wait, hold, maxWait, maxHold) in sorted(stats.locks.items()):
+                y += 1
+                canvas.drawText(pos=(2,y), color=name, text=f"{os.path.basename(doc.filePath())[:20]:20}")
+                canvas.drawText(pos=(23,y),
+                    text=f"{kind:8} {count:7} {wait*1000:8.1f} {hold*1000:8.1f} {maxWait*1000:8.2f} {maxHold*1000:8.2f}")
+        y += 2
+        updates, skipped, repaints, written = self._repaints[2]
+        canvas.drawText(pos=(2,y), color=hdr,
+            text=f"{'views':20} {'updates/s':>10} {'skipped/s':>10} {'repaints/s':>10} {'term KB/s':>10}")
+        canvas.drawText(pos=(23,y+1),
+            text=f"{updates:10.1f} {skipped:10.1f} {repaints:10.1f} {written/1024:10.1f}")
+        super().paintEvent(canvas)
@@ -0,0 +1,464 @@
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import json
+import hashlib
+from bisect import bisect_left
+from time import perf_counter
+from threading import Lock
+
+import pygments
+from pygments.token import Name
+
+from TermTk import TTkLog, TTkColor, TTkString, TTkTimer
+from TermTk import pyTTkSlot, pyTTkSignal
+from TermTk import TTkWindow, TTkGridLayout, TTkLineEdit, TTkList
+
+from .cfg import TTKodeCfg
+from .kodelexer import KodeLexer
+from .kodehighlighter import KodeHighlighter
+from .kodeignore import KodeIgnore
+
+class KodeSymbolIndex():
+    '''Workspace wide index of the symbols (classes, functions, namespaces)
+
+    The files of the workspace are lexed by a background worker with the
+    same lexers used by the highlight, the open documents update
+    their own symbols each time a range of lines is highlighted.
+
+    The symbols are grouped by lowercase name, the exact matches are a dict
+    lookup, the prefix ones a bisect in the sorted names and the substring ones
+    a scan of the names joined in a single string.
+    The scan results are cached in the config folder and only the files
+    changed since the last run are lexed again.
+    '''
+    # Token types indexed and their kind, the subtypes (i.e. Name.Function.Magic) included
+    symbolTypes = ((Name.Class, 'class'), (Name.Function, 'function'), (Name.Namespace, 'namespace'))
+    # Files bigger than this are not scanned
+    maxFileSize = 1024*1024
+    # Seconds of scan in a tick and fraction of the time spent scanning,
+    # the scan runs only when KodeHighlighter reports no user activity
+    scanBudget = 0.02
+    scanDuty = 0.5
+    # Min seconds between two rebuilds of the prefix/substring search tables
+    searchRefresh = 1.0
+    # Bumped when the cache layout changes
+    _cacheFormat = 1
+    # Token type -> kind ('' if not a symbol)
+    _kinds = {}
+    # {path:[(line, name, kind)]} sorted by line
+    _files = {}
+    # {path:(mtime, size)} of the files scanned from the disk
+    _stamps = {}
+    # {lowercase name:{path:count}}
+    _names = {}
+    # Files owned by an open document, skipped by the scan
+    _live = set()
+    # Files of the documents closed, read again from the disk by the scan timer
+    _closed = []
+    # Sorted lowercase names and the same joined by '\n'
+    _sorted = []
+    _blob = ''
+    _searchDirty = False
+    _searchTime = 0.0
+    _root = None
+    _walker = None
+    _lexers = {}
+    _changed = False
+    _timer = None
+    _lock = Lock()
+
+    @staticmethod
+    def kind(ttype):
+        '''Return the kind of symbol of the token type, '' if not indexed'''
+        if (kind := KodeSymbolIndex._kinds.get(ttype)) is None:
+            kind = ''
+            for base, name in KodeSymbolIndex.symbolTypes:
+                if ttype in base:
+                    kind = name
+                    break
+            KodeSymbolIndex._kinds[ttype] = kind
+        return kind
+
+    @staticmethod
+    def symbols(tokens):
+        '''Return the [(line, name, kind)] from the (ttype, value) tokens'''
+        kinds = KodeSymbolIndex._kinds
+        ret = []
+        line = 0
+        for ttype, value in tokens:
+            if (kind := kinds.get(ttype)) is None:
+                kind = KodeSymbolIndex.kind(ttype)
+            if kind and (name := value.strip()):
+                ret.append((line, name, kind))
+            line += value.count('\n')
+        return ret
+
+    @staticmethod
+    def _count(path, symbols, delta):
+        names = KodeSymbolIndex._names
+        for _, name, _ in symbols:
+            lname = name.lower()
+            if delta > 0:
+                if (paths := names.get(lname)) is None:
+                    paths = names[lname] = {}
+                    KodeSymbolIndex._searchDirty = True
+                paths[path] = paths.get(path, 0)+1
+            else:
+                paths = names[lname]
+                if n := paths[path]-1:
+                    paths[path] = n
+                else:
+                    del paths[path]
+                    if not paths:
+                        del names[lname]
+
+    @staticmethod
+    def _setSymbols(path, symbols):
+        if old := KodeSymbolIndex._files.pop(path, None):
+            KodeSymbolIndex._count(path, old, -1)
+        if symbols:
+            KodeSymbolIndex._files[path] = symbols
+            KodeSymbolIndex._count(path, symbols, 1)
+
+    @staticmethod
+    def open(path):
+        '''The file is owned by a document, the scan leaves its symbols to the highlight'''
+        with KodeSymbolIndex._lock:
+            KodeSymbolIndex._live.add(path)
+
+    @staticmethod
+    def close(path):
+        '''The document of the file is closed, its symbols are read again from the disk
+        in the scan timer (not in the calling UI thread)'''
+        with KodeSymbolIndex._lock:
+            KodeSymbolIndex._live.discard(path)
+            KodeSymbolIndex._stamps.pop(path, None)
+            KodeSymbolIndex._closed.append(path)
+            KodeSymbolIndex._initTimer()
+        KodeSymbolIndex._timer.start(0)
+
+    @staticmethod
+    def _rescanFile(path):
+        try:
+            KodeSymbolIndex._scanFile(path, os.stat(path))
+        except OSError:
+            with KodeSymbolIndex._lock:
+                if path not in KodeSymbolIndex._live:
+                    KodeSymbolIndex._setSymbols(path, None)
+                    KodeSymbolIndex._changed = True
+
+    @staticmethod
+    def update(path, fr, to, symbols):
+        '''Replace the symbols of the lines [fr,to) of an open document'''
+        with KodeSymbolIndex._lock:
+            syms = KodeSymbolIndex._files.setdefault(path, [])
+            i = bisect_left(syms, (fr,))
+            j = bisect_left(syms, (to,), i)
+            if (old := syms[i:j]) == symbols:
+                return
+            syms[i:j] = symbols
+            KodeSymbolIndex._count(path, old, -1)
+            KodeSymbolIndex._count(path, symbols, 1)
+
+    @staticmethod
+    def splice(path, a, b, c):
+        '''The lines [a,a+b) of an open document are replaced by c lines'''
+        # The changed lines are dirty and their symbols
+        # are updated as soon as they are highlighted
+        if b == c:
+            return
+        with KodeSymbolIndex._lock:
+            if not (syms := KodeSymbolIndex._files.get(path)):
+                return
+            i = bisect_left(syms, (a,))
+            j = bisect_left(syms, (a+b,), i)
+            KodeSymbolIndex._count(path, syms[i:j], -1)
+            syms[i:] = [(line+c-b, name, kind) for line, name, kind in syms[j:]]
+
+    @staticmethod
+    def find(query, limit=100):
+        '''Return up to limit (path, line, name, kind) matching the query (case insensitive),
+        the exact matches first, then the prefix and the substring ones'''
+        if not (q := query.strip().lower()):
+            return []
+        ret = []
+        seen = set()
+        with KodeSymbolIndex._lock:
+            now = perf_counter()
+            # Rebuilt at most each searchRefresh while the index is updated,
+            # a new name is found only by the exact match until then
+            if KodeSymbolIndex._searchDirty and now-KodeSymbolIndex._searchTime > KodeSymbolIndex.searchRefresh:
+                KodeSymbolIndex._sorted = sorted(KodeSymbolIndex._names)
+                KodeSymbolIndex._blob = '\n'.join(KodeSymbolIndex._sorted)
+                KodeSymbolIndex._searchDirty = False
+                KodeSymbolIndex._searchTime = now
+            files = KodeSymbolIndex._files
+            names = KodeSymbolIndex._names
+
+            def _add(lname):
+                if lname in seen:
+                    return
+                seen.add(lname)
+                for path in names.get(lname, ()):
+                    if len(ret) >= limit:
+                        return
+                    ret.extend((path, line, name, kind) for line, name, kind in files[path] if name.lower() == lname)
+
+            _add(q)
+            sortedNames = KodeSymbolIndex._sorted
+            i = bisect_left(sortedNames, q)
+            while len(ret) < limit and i < len(sortedNames) and sortedNames[i].startswith(q):
+                _add(sortedNames[i])
+                i += 1
+            blob = KodeSymbolIndex._blob
+            pos = 0
+            while len(ret) < limit and (pos := blob.find(q, pos)) >= 0:
+                fr = blob.rfind('\n', 0, pos)+1
+                if (pos := blob.find('\n', pos)) < 0:
+                    pos = len(blob)
+                _add(blob[fr:pos])
+        return ret[:limit]
+
+    @staticmethod
+    def count():
+        '''Return the (files, symbols) indexed'''
+        with KodeSymbolIndex._lock:
+            return len(KodeSymbolIndex._files), sum(len(s) for s in KodeSymbolIndex._files.values())
+
+    @staticmethod
+    def scanning():
+        return KodeSymbolIndex._walker is not None
+
+    @staticmethod
+    def start(root='.'):
+        '''Start the background scan of the root folder'''
+        with KodeSymbolIndex._lock:
+            if KodeSymbolIndex._walker:
+                return
+            KodeSymbolIndex._root = os.path.realpath(root)
+            KodeSymbolIndex._walker = KodeSymbolIndex._scan(KodeSymbolIndex._root)
+            KodeSymbolIndex._initTimer()
+        KodeSymbolIndex._timer.start(0)
+
+    @staticmethod
+    def _initTimer():
+        if not KodeSymbolIndex._timer:
+            KodeSymbolIndex._timer = TTkTimer()
+            KodeSymbolIndex._timer.timeout.connect(KodeSymbolIndex._refresh)
+
+    @staticmethod
+    def scan(root='.'):
+        '''Scan the root folder in the calling thread'''
+        for _ in KodeSymbolIndex._scan(os.path.realpath(root)):
+            pass
+
+    @staticmethod
+    def _refresh():
+        if (walker := KodeSymbolIndex._walker) is None and not KodeSymbolIndex._closed:
+            return
+        if (idle := KodeHighlighter.idle()) < KodeHighlighter.idleTime:
+            return KodeSymbolIndex._timer.start(KodeHighlighter.idleTime-idle)
+        t = perf_counter()
+        # The closed files first, then the walk of the root folder
+        while path := KodeSymbolIndex._nextClosed():
+            KodeSymbolIndex._rescanFile(path)
+            if perf_counter()-t > KodeSymbolIndex.scanBudget:
+                break
+        else:
+            for _ in walker or ():
+                if perf_counter()-t > KodeSymbolIndex.scanBudget:
+                    break
+            else:
+                KodeSymbolIndex._walker = None
+                return
+        duty = KodeSymbolIndex.scanDuty
+        KodeSymbolIndex._timer.start((perf_counter()-t)*(1-duty)/duty)
+
+    @staticmethod
+    def _nextClosed():
+        with KodeSymbolIndex._lock:
+            return KodeSymbolIndex._closed.pop(0) if KodeSymbolIndex._closed else None
+
+    # Generator scanning the files of the root folder, it yields after each
+    # file to allow the worker to split the scan in time slices
+    @staticmethod
+    def _scan(root):
+        t = perf_counter()
+        yield from KodeSymbolIndex._loadCache(root)
+        seen = set()
+        lexed = 0
+        for path, st in KodeIgnore.forRoot(root).walk():
+            seen.add(path)
+            lexed += KodeSymbolIndex._scanFile(path, st)
+            yield
+        with KodeSymbolIndex._lock:
+            for path in [p for p in KodeSymbolIndex._stamps if p not in seen]:
+                del KodeSymbolIndex._stamps[path]
+                if path not in KodeSymbolIndex._live:
+                    KodeSymbolIndex._setSymbols(path, None)
+                KodeSymbolIndex._changed = True
+        files, symbols = KodeSymbolIndex.count()
+        TTkLog.debug(f"Symbols {root}: {files} files, {symbols} symbols, {lexed} lexed in {perf_counter()-t:.1f}s")
+        KodeSymbolIndex._saveCache(root)
+
+    @staticmethod
+    def _lexerForFile(path):
+        if not (lexer := KodeLexer.forFile(path, guess=False)):
+            # Only the shebang is left to be checked
+            try:
+                with open(path, 'rb') as f:
+                    head = f.read(256)
+            except OSError:
+                # Removed or unreadable since the walk
+                return None
+            if not head.startswith(b'#!'):
+                return None
+            if not (lexer := KodeLexer.forFile(path, head.decode('utf-8', 'replace'), guess=False)):
+                return None
+        # The same instance is shared by all the files of the same language
+        return KodeSymbolIndex._lexers.setdefault(lexer._lexerRef, lexer)
+
+    @staticmethod
+    def _scanFile(path, st):
+        '''Index the file if changed since the last scan, return True if lexed'''
+        stamp = (st.st_mtime, st.st_size)
+        if path in KodeSymbolIndex._live or KodeSymbolIndex._stamps.get(path) == stamp:
+            return False
+        symbols = []
+        if st.st_size <= KodeSymbolIndex.maxFileSize and (lexer := KodeSymbolIndex._lexerForFile(path)):
+            try:
+                with open(path, 'r') as f:
+                    text = f.read()
+                symbols = KodeSymbolIndex.symbols(lexer.tokens(text, KodeLexer.ROOT, []))
+            except UnicodeDecodeError:
+                pass
+            except Exception as e:
+                TTkLog.error(f"Unable to index {path}: {e}")
+        with KodeSymbolIndex._lock:
+            if path not in KodeSymbolIndex._live:
+                KodeSymbolIndex._setSymbols(path, symbols)
+                KodeSymbolIndex._stamps[path] = stamp
+                KodeSymbolIndex._changed = True
+        return True
+
+    @staticmethod
+    def _cachePath(root):
+        return os.path.join(TTKodeCfg.pathCfg, 'symbols', hashlib.sha1(root.encode()).hexdigest()+'.json')
+
+    @staticmethod
+    def _loadCache(root):
+        # A missing, corrupted or outdated cache is just a full scan
+        try:
+            with open(KodeSymbolIndex._cachePath(root)) as f:
+                cache = json.load(f)
+            if (cache.get('version') != pygments.__version__ or
+                cache.get('format')  != KodeSymbolIndex._cacheFormat or
+                cache.get('root')    != root):
+                return
+            files = cache['files']
+        except (OSError, ValueError, KeyError, AttributeError):
+            return
+        for path, (mtime, size, symbols) in files.items():
+            with KodeSymbolIndex._lock:
+                if path in KodeSymbolIndex._live or path in KodeSymbolIndex._stamps:
+                    continue
+                KodeSymbolIndex._setSymbols(path, [tuple(s) for s in symbols])
+                KodeSymbolIndex._stamps[path] = (mtime, size)
+            yield
+
+    @staticmethod
+    def _saveCache(root):
+        with KodeSymbolIndex._lock:
+            if not KodeSymbolIndex._changed:
+                return
+            KodeSymbolIndex._changed = False
+            # The open documents may differ from the files
+            files = {
+                path: [*stamp, KodeSymbolIndex._files.get(path, [])]
+                for path, stamp in KodeSymbolIndex._stamps.items() if path not in KodeSymbolIndex._live }
+        cachePath = KodeSymbolIndex._cachePath(root)
+        try:
+            os.makedirs(os.path.dirname(cachePath), exist_ok=True)
+            with open(cachePath+'.tmp', 'w') as f:
+                json.dump({
+                    'version': pygments.__version__, 'format': KodeSymbolIndex._cacheFormat,
+                    'root': root, 'files': files }, f)
+            os.replace(cachePath+'.tmp', cachePath)
+        except OSError as e:
+            TTkLog.error(f"Unable to save the symbols index: {e}")
+
+class KodeSymbolsWindow(TTkWindow):
+    '''Go to Symbol, the results are updated while typing'''
+    _kindColors = {
+        'class':     TTkColor.fg('#00FF00'),
+        'function':  TTkColor.fg('#88FFFF'),
+        'namespace': TTkColor.fg('#FFFF88') }
+    maxResults = 100
+    __slots__ = ('symbolActivated', '_search', '_results')
+    def __init__(self, *args, **kwargs):
+        # Signals
+        self.symbolActivated = pyTTkSignal(str, int)
+        super().__init__(*args, **kwargs)
+        self.resize(80,20)
+        self.setLayout(TTkGridLayout())
+        self._search  = TTkLineEdit()
+        self._results = TTkList()
+        self.layout().addWidget(self._search,  0, 0)
+        self.layout().addWidget(self._results, 1, 0)
+        self._search.textEdited.connect(self._query)
+        self._search.returnPressed.connect(self._activateFirst)
+        self._results.itemClicked.connect(self._activate)
+        self._setTitle()
+
+    def _setTitle(self, info=''):
+        files, symbols = KodeSymbolIndex.count()
+        scanning = ', scanning' if KodeSymbolIndex.scanning() else ''
+        self.setTitle(f"Go to Symbol ({files} files, {symbols} symbols{scanning}) {info}")
+
+    def focusInEvent(self):
+        self._search.setFocus()
+
+    @pyTTkSlot(str)
+    def _query(self, text):
+        t = perf_counter()
+        results = KodeSymbolIndex.find(str(text), self.maxResults)
+        elapsed = perf_counter()-t
+        for item in list(self._results.items()):
+            self._results.removeItem(item)
+        for path, line, name, kind in results:
+            label = ( TTkString(f"{kind[:5]:5} ", KodeSymbolsWindow._kindColors[kind]) +
+                      TTkString(name) +
+                      TTkString(f"  {os.path.relpath(path)}:{line+1}", TTkColor.fg('#888888')) )
+            self._results.addItem(label, data=(path, line))
+        self._setTitle(f"{len(results)} in {elapsed*1000:.1f}ms")
+
+    @pyTTkSlot()
+    def _activateFirst(self):
+        if items := self._results.items():
+            self._activate(items[0])
+
+    def _activate(self, item):
+        path, line = item.data()
+        self.close()
+        self.symbolActivated.emit(path, line)
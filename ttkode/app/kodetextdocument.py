@@ -20,146 +20,713 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import re
+from time import perf_counter
+from array import array
+from difflib import SequenceMatcher
 from threading import Lock
 
-from pygments import highlight
-from pygments.util import ClassNotFound
-from pygments.lexers import guess_lexer, guess_lexer_for_filename, special
-from pygments.formatters import TerminalFormatter, Terminal256Formatter, TerminalTrueColorFormatter
-
 from TermTk import TTk, TTkK, TTkLog, TTkCfg, TTkTheme, TTkTerm, TTkHelper, TTkTimer
 from TermTk import TTkString
 from TermTk import TTkColor, TTkColorGradient
 from TermTk import pyTTkSlot, pyTTkSignal
 
 from TermTk import TTkTextDocument
-from .kodeformatter import KodeFormatter
+from .kodeformatter import KodeFormatter, KodeStyle
+from .kodelexer import KodeLexer
+from .kodemappedlines import KodeMappedLines, KodeMappedFile
+from .kodestats import KodeDocStats, KodeTimedLock
+from .kodehighlighter import KodeHighlighter
+from .kodesymbols import KodeSymbolIndex
+from .kodehighlightcache import KodeHighlightCache
+from .kodefollow import KodeFileFollower
 
 class KodeTextDocument(TTkTextDocument):
+    class _Stream():
+        '''Lex in progress of the lines [line,end) of a revision of the document,
+        the tokens and the lines not committed yet are in data (KodeFormatter.Data)'''
+        __slots__ = ('revision', 'line', 'end', 'data', 'tokens')
+        def __init__(self, revision, line, end, data, tokens):
+            self.revision = revision
+            self.line = line
+            self.end = end
+            self.data = data
+            self.tokens = tokens
+
+    # Min lines highlighted in a refresh, used also
+    # until the speed of the lexer is measured
     _linesRefreshed = 30
+    _maxLinesRefreshed = 4096
+    # Seconds of highlight in a refresh, the lines are sized
+    # from the lines/sec measured for each lexer
+    _refreshBudget = 0.02
+    # Lines/sec measured for each lexer {name:linesSec}
+    _lexerSpeed = {}
+    # Max number of lines walked back from the viewport
+    # looking for a known lexer state before guessing it
+    _syncLines = 200
+    # Per line highlight status
+    _CLEAN   = 0 # Highlighted
+    _GUESSED = 1 # Highlighted starting from a guessed state, still to be confirmed
+    _DIRTY   = 2 # To be highlighted
+    # Max edits logged while a highlight is running,
+    # the result is discarded if they are more
+    _maxChanges = 256
+    # Max changed lines compared by reloadFile,
+    # a bigger change is replaced in a single hunk
+    _maxDiffLines = 20000
+    # Highlight stats enabled in the new documents
+    statsEnabled = False
+    # Chars (escapes and not single width) requiring the TTkString parsing
+    _parsedChars = re.compile('[\033\u0300-\U0010FFFF]')
+    # Rough bytes used by a line of a highlighted document (memorySize),
+    # the TTkString, its color per char and its copy in the undo snapshot
+    _lineBytes = 300
+    _charBytes = 20
     __slots__ = (
-        '_filePath', '_timerRefresh',
+        '_filePath',
         'kodeHighlightUpdate', '_kodeDocMutex',
-        '_blocks', '_changedContent', '_refreshContent',
-        '_lexer', '_formatter')
+        '_states', '_dirty', '_lexWindow', '_stream', '_revision', '_changes', '_views',
+        '_lexer', '_formatter', '_mapped', '_indexed', '_fileStamp', '_cached', '_stats',
+        '_follower', '_followMax', '_evicted', '_lineChars', '_chars')
     def __init__(self, *args, **kwargs):
-        self.kodeHighlightUpdate = pyTTkSignal()
+        # Lines [fr,to) highlighted again
+        self.kodeHighlightUpdate = pyTTkSignal(int,int)
         self._kodeDocMutex = Lock()
-        self._lexer = None
-        self._blocks = []
-        # self._formatter = KodeFormatter(style='dracula')
-        self._formatter = KodeFormatter(style='gruvbox-dark')
+        self._stats = KodeDocStats() if KodeTextDocument.statsEnabled else None
+        self._lexer = kwargs.get('lexer', None)
+        self._formatter = KodeFormatter(style=kwargs.get('style','gruvbox-dark'))
         super().__init__(*args, **kwargs)
+        # The lines of the huge files are read on request from a memory map (KodeMappedLines),
+        # in this case only the lines displayed in the views are highlighted
+        if (lines := kwargs.get('lines', None)) is not None:
+            self._dataLines = lines
+            self._lastSnap = lines.copy()
+        self._mapped = isinstance(self._dataLines, KodeMappedLines)
+        # _states[i] = id (KodeLexer.stateId) of the lexer state at the beginning of the line i
+        # _dirty[i]  = highlight status of the line i (_CLEAN, _GUESSED, _DIRTY)
+        # Typed arrays, 5 bytes per line and the splices are plain memory moves
+        self._states = array('i', [KodeLexer.NOSTATE])*len(self._dataLines)
+        self._states[0] = KodeLexer.stateId(KodeLexer.ROOT)
+        self._dirty  = bytearray([KodeTextDocument._DIRTY])*len(self._dataLines)
+        # _lineChars[i] = chars of the line i, their sum (_chars) is the memorySize estimate
+        # kept up to date by the edits, None for the huge files (see memorySize)
+        if self._mapped:
+            self._lineChars, self._chars = None, 0
+        else:
+            self._lineChars = array('I', [len(l._text) for l in self._dataLines])
+            self._chars = sum(self._lineChars)
+        self._lexWindow = KodeTextDocument._linesRefreshed
+        # Lex in progress until the end of the document (_Stream),
+        # each refresh formats and commits the next _lexWindow lines
+        self._stream = None
+        # Bumped at each change, the highlight results computed
+        # on an older revision are rebased through the edits (line, removed, added)
+        # logged after the snapshot, None if the result is no longer usable
+        self._revision = 0
+        self._changes = []
+        # Lines range displayed by each view {view:(from,to)}
+        self._views = {}
         self._filePath = kwargs.get('filePath',"")
-        self._timerRefresh = TTkTimer()
-        self._timerRefresh.timeout.connect(self._refreshEvent)
-        self._timerRefresh.start(0.3)
-        self._changedContent = (0,0,len(self._dataLines))
-        self._refreshContent = (0,KodeTextDocument._linesRefreshed)
+        # The symbols of the highlighted lines are added to the workspace index,
+        # the huge files are only partially highlighted
+        self._indexed = bool(self._filePath) and not self._mapped
+        if self._indexed:
+            KodeSymbolIndex.open(self._filePath)
+        # (size, mtime_ns) of the file the text was read from, None once edited,
+        # the highlight of the unchanged file is loaded from/saved to KodeHighlightCache (cached=True)
+        self._fileStamp = None
+        if self._filePath and not self._mapped:
+            self._fileStamp = KodeHighlightCache.stamp(self._filePath)
+        self._cached = kwargs.get('cached', False) and bool(self._lexer)
+        # KodeFileFollower streaming the lines appended to the file (follow mode),
+        # at most _followMax lines are kept if set
+        self._follower = None
+        self._followMax = None
+        # The highlight has been dropped (evict), the lines are
+        # read from a KodeMappedFile of the raw text until displayed again
+        self._evicted = False
+        self._loadCache()
         self.contentsChange.connect(lambda a,b,c: TTkLog.debug(f"{a=} {b=} {c=}"))
         self.contentsChange.connect(self._saveChangedContent)
+        KodeHighlighter.register(self)
 
     @pyTTkSlot(int,int,int)
     def _saveChangedContent(self,a,b,c):
-        if self._changedContent:
-            self._changedContent = TTkTextDocument._mergeChangesSlices(self._changedContent,(a,b,c))
+        # The state at the beginning of the first changed line is still valid,
+        # The one of the first line after the change is kept as a reference,
+        # the highlight can stop as soon as the new state matches the cached one
+        head = self._states[a] if a < len(self._states) else KodeLexer.NOSTATE
+        self._states[a:a+b] = array('i', [KodeLexer.NOSTATE])*c
+        self._dirty[a:a+b]  = bytearray([KodeTextDocument._DIRTY])*c
+        if a < len(self._states):
+            self._states[a] = head
+            self._dirty[a]  = KodeTextDocument._DIRTY
+        if self._lineChars is not None:
+            chars = array('I', [len(l._text) for l in self._dataLines[a:a+c]])
+            self._chars += sum(chars) - sum(self._lineChars[a:a+b])
+            self._lineChars[a:a+b] = chars
+        self._revision += 1
+        self._fileStamp = None
+        # An edit usually converges in few lines, the window grows again if not
+        self._lexWindow = KodeTextDocument._linesRefreshed
+        # Lexing the old text
+        self._stream = None
+        if len(self._changes) < KodeTextDocument._maxChanges:
+            self._changes.append((a,b,c))
         else:
-            self._changedContent = (a,b,c)
-        if not self._refreshContent:
-            self._refreshContent = (self._changedContent[0], KodeTextDocument._linesRefreshed)
-        self._timerRefresh.start(0.1)
+            self._changes = [None]
+        if self._indexed:
+            KodeSymbolIndex.splice(self._filePath, a, b, c)
+        # The appended lines are not an user activity
+        if not self.following():
+            KodeHighlighter.touch()
+        KodeHighlighter.schedule(self)
 
-    @pyTTkSlot()
-    def _refreshEvent(self):
-        if not self._refreshContent: return
-        self._kodeDocMutex.acquire()
-
-        ra,rb = self._refreshContent
-
-        if self._changedContent:
-            ca,cb,cc = self._changedContent
-            self._changedContent = None
-            self._blocks[ca:ca+cb] = [0]*cc
-            ra = min(ra,ca)
-
-        # find the beginning of the current block
-        # TTkLog.debug(self._blocks)
-        if ra and self._blocks:
-            blockId = self._blocks[ra]
-            for i,v in enumerate(reversed(self._blocks[:ra])):
-                # TTkLog.debug(f"{i=}:{v=} {blockId=}")
-                if v == blockId or not blockId:
-                    blockId = v
-                    ra -= 1
-                    rb += 1
-                else:
-                    break
-
-        # TTkLog.debug(f"{ra=} {rb=}")
-
-        eof = False
-        if (ra+rb) >= len(self._dataLines):
-            rb  = len(self._dataLines)-ra
-            eof=True
-
-        tsl = self._dataLines[ra:ra+rb]
-        # Find the offset from the first not empty line
-        # because pygments autostrip the heading empty lines
-        offset = 0
-        for i,l in enumerate(tsl):
-            if l != '':
-                offset = i
-                break
+    # Undo/Redo replace the lines without emitting contentsChange
+    def _restoreSnapshotDiff(self, next=True):
+        diff = self._snap and (self._snap._nextDiff if next else self._snap._prevDiff)
+        ret = super()._restoreSnapshotDiff(next)
+        if diff:
+            self._saveChangedContent(diff._i1, diff._i2-diff._i1, len(diff._slice))
+        return ret
+
+    def _loadCache(self):
+        if not self._cached or not self._fileStamp:
+            return
+        if not (cached := KodeHighlightCache.load(
+                self._filePath, self._fileStamp, self._lexer.className(), self._formatter.kodeStyle(), self._dataLines)):
+            return
+        lines, self._states, symbols = cached
+        self._dataLines[:] = lines
+        self._lastSnap = lines.copy()
+        self._dirty = bytearray([KodeTextDocument._CLEAN])*len(lines)
+        if self._indexed:
+            KodeSymbolIndex.update(self._filePath, 0, len(lines), symbols)
+        TTkLog.debug(f"Highlight loaded from the cache: {self._filePath}")
+
+    def _saveCache(self):
+        # Called when the highlight is complete, the lines are copied
+        # with the lock held and saved in the highlighter thread
+        with self.getLock('cache'):
+            if not self._cached or not self._fileStamp or self._pending():
+                return
+            stamp = self._fileStamp
+            lines = self._dataLines.copy()
+            states = self._states[:]
+            kodeStyle = self._formatter.kodeStyle()
+        KodeHighlightCache.save(self._filePath, stamp, self._lexer.className(), kodeStyle, lines, states)
+
+    @staticmethod
+    def _diffLines(old, new):
+        '''Return the (line, removed, added) hunks changing the old lines (str) in the new ones,
+        line is the index in the old lines, added the new lines'''
+        pre, end = 0, min(len(old), len(new))
+        while pre < end and old[pre] == new[pre]:
+            pre += 1
+        post = 0
+        while post < end-pre and old[-1-post] == new[-1-post]:
+            post += 1
+        a, b = old[pre:len(old)-post], new[pre:len(new)-post]
+        if not a and not b:
+            return []
+        if len(a)+len(b) > KodeTextDocument._maxDiffLines:
+            return [(pre, len(a), b)]
+        return [(pre+i1, i2-i1, b[j1:j2])
+                for tag, i1, i2, j1, j2 in SequenceMatcher(None, a, b).get_opcodes() if tag != 'equal']
+
+    def reloadFile(self):
+        '''Apply the changes of the file on the disk (i.e. rewritten by a build or a git checkout),
+        only the changed hunks are replaced and highlighted again, the undo history is cleared.
+
+        Return False if not reloaded, the document has been edited
+        (the local changes are kept) or the file is not readable'''
+        if self._mapped or not self._filePath:
+            return False
+        with self.getLock('reload'):
+            if not (oldStamp := self._fileStamp):
+                return False
+        if (stamp := KodeHighlightCache.stamp(self._filePath)) == oldStamp:
+            return True
+        try:
+            with open(self._filePath, 'r') as f:
+                text = f.read()
+        except (OSError, UnicodeDecodeError) as e:
+            TTkLog.error(f"Unable to reload {self._filePath}: {e}")
+            return False
+        new = text.split('\n')
+        with self.getLock('reload'):
+            # Edited in the meantime
+            if self._fileStamp != oldStamp:
+                return False
+            hunks = KodeTextDocument._diffLines([l._text for l in self._dataLines], new)
+            # From the bottom, the lines of the following hunks are not moved
+            for a, b, lines in reversed(hunks):
+                self._dataLines[a:a+b] = [TTkString(l) for l in lines]
+                self.contentsChange.emit(a, b, len(lines))
+            # Same as setText
+            self._modified = False
+            self._lastSnap = self._dataLines.copy()
+            self._snap = TTkTextDocument._snapshot(self._lastCursor, None, None)
+            self._snapChanged = None
+            self._fileStamp = stamp
+            # The cursors beyond the end of the new text
+            for view in list(self._views):
+                cursor = view.textCursor()
+                if cursor.position().line >= len(self._dataLines):
+                    cursor.setPosition(len(self._dataLines)-1, 0)
+        TTkLog.debug(f"Reloaded {self._filePath}: {len(hunks)} hunks")
+        self.contentsChanged.emit()
+        return True
+
+    def setFollow(self, enabled=True, maxLines=None):
+        '''Start/Stop streaming in the document the lines appended to its file (i.e. a log),
+        only the new lines are highlighted.
+        If maxLines is set the oldest lines are dropped keeping at most maxLines lines.
+
+        Return False if the document can not follow its file, it has been edited
+        or it is memory mapped: a followed log is truncated (i.e. logrotate copytruncate)
+        and the mapped lines would read the missing pages (see KodeMappedFile)'''
+        with self.getLock('follow'):
+            if not enabled:
+                if self._follower:
+                    self._follower.stop()
+                return True
+            if self._mapped:
+                return False
+            self._followMax = maxLines
+            if not self._follower:
+                # The first byte not loaded in the document
+                if not self._fileStamp:
+                    return False
+                offset = self._fileStamp[0]
+                self._follower = KodeFileFollower(self._filePath, self.appendText, offset)
+            self._follower.start()
+        return True
+
+    def following(self):
+        '''True if the document is in follow mode'''
+        return bool(self._follower and self._follower.running())
+
+    def appendText(self, text):
+        '''Append the text at the end of the document (i.e. the new lines of a followed log),
+        only the new lines are highlighted and the undo history is cleared.
+
+        In follow mode the oldest lines exceeding the maxLines of setFollow are dropped'''
+        if not text:
+            return
+        lines = text.split('\n')
+        lines[:-1] = [l[:-1] if l.endswith('\r') else l for l in lines[:-1]]
+        with self.getLock('append'):
+            # The last snapshot is the current text if there are no changes since it
+            synced = self._snapChanged is None
+            # The last line is the partial one, completed by the new text
+            last = len(self._dataLines)-1
+            lines[0] = self._dataLines[last]._text + lines[0]
+            if KodeTextDocument._parsedChars.search(lines[0]) or KodeTextDocument._parsedChars.search(text):
+                lines = [TTkString(l) for l in lines]
+            else:
+                lines = [KodeTextDocument._plainLine(l) for l in lines]
+            self._dataLines[last:] = lines
+            self.contentsChange.emit(last, 1, len(lines))
+            # The undo history is cleared (same as setText), the last snapshot
+            # is updated in place instead of copying all the lines at each append
+            if synced:
+                self._lastSnap[last:] = lines
+            else:
+                self._lastSnap = self._dataLines.copy()
+            if self._followMax and (drop := len(self._dataLines)-self._followMax) > 0:
+                del self._dataLines[:drop]
+                del self._lastSnap[:drop]
+                self.contentsChange.emit(0, drop, 0)
+                for view in list(self._views):
+                    cursor = view.textCursor()
+                    pos = cursor.position()
+                    cursor.setPosition(max(0, pos.line-drop), pos.pos if pos.line >= drop else 0)
+            self._modified = False
+            self._snap = TTkTextDocument._snapshot(self._lastCursor, None, None)
+            self._snapChanged = None
+        self.contentsChanged.emit()
+
+    @staticmethod
+    def _plainLine(text):
+        '''Same as TTkString(text) of a text without escapes and with single width chars only,
+        the text is not parsed and its width is not checked'''
+        ret = TTkString.__new__(TTkString)
+        ret._text = text
+        ret._colors = [TTkColor.RST]*len(text)
+        ret._baseColor = TTkColor.RST
+        ret._hasTab = '\t' in text
+        ret._hasSpecialWidth = None
+        return ret
+
+    def close(self):
+        '''Release the document, its highlight, the follow mode and the views are stopped'''
+        KodeHighlighter.unregister(self)
+        with self.getLock('close'):
+            if self._follower:
+                self._follower.close()
+                self._follower = None
+            self._views = {}
+            # Discard the highlight in progress
+            self._revision += 1
+            self._changes = [None]
+            self._stream = None
+        # pyTTkSignal keeps all the signals alive, the connected slots
+        # (cursors, wraps, views) would keep the document in memory
+        for signal in (self.contentsChange, self.contentsChanged, self.cursorPositionChanged,
+                       self.undoAvailable, self.redoAvailable, self.undoCommandAdded,
+                       self.modificationChanged, self.kodeHighlightUpdate):
+            signal.clear()
+        if self._indexed:
+            self._indexed = False
+            KodeSymbolIndex.close(self._filePath)
+
+    def evicted(self):
+        '''True if the highlight of the document has been dropped (evict)'''
+        return self._evicted
+
+    def evict(self):
+        '''Drop the highlighted lines keeping only the raw text and the lexer states,
+        the document is highlighted again (or loaded from KodeHighlightCache)
+        as soon as one of its views is displayed.
+
+        Return False if not evicted, the document is displayed, edited (the undo
+        history is kept), followed or memory mapped'''
+        with self.getLock('evict'):
+            if ( self._evicted or self._mapped or not self._fileStamp or self.following() or
+                 any(view.isVisibleAndParent() for view in self._views) ):
+                return False
+            text = '\n'.join([l._text for l in self._dataLines])
+            self._dataLines = KodeMappedLines(KodeMappedFile.fromText(text))
+            self._lastSnap = self._dataLines.copy()
+            self._snap = TTkTextDocument._snapshot(self._lastCursor, None, None)
+            self._snapChanged = None
+            # The states are still valid, each line is highlighted again starting from its own
+            self._dirty = bytearray([KodeTextDocument._DIRTY])*len(self._dataLines)
+            self._revision += 1
+            self._changes = [None]
+            self._stream = None
+            self._evicted = True
+        TTkLog.debug(f"Evicted {self._filePath}: {len(text)} chars")
+        return True
+
+    def _rehydrate(self):
+        # Called with the lock held, the lines of the evicted document
+        # are decoded and colored from the cache if available
+        mappedFile = self._dataLines.mappedFile()
+        self._dataLines = list(self._dataLines)
+        self._lastSnap = self._dataLines.copy()
+        self._evicted = False
+        self._loadCache()
+        mappedFile.close()
+
+    def memorySize(self):
+        '''Rough estimate of the bytes used by the lines of the document,
+        the lines are not walked (i.e. by KodeHighlighter.trim at each tab change)'''
+        with self.getLock('memory'):
+            lines = self._dataLines
+            ret = len(lines)*(5 if self._lineChars is None else 9)
+            if isinstance(lines, KodeMappedLines):
+                # The map of the huge files is not in memory, the raw text of the evicted ones is,
+                # the lines read from the map (displayed or edited) have the average size
+                mappedFile = lines.mappedFile()
+                ret += len(mappedFile)*8 + (0 if self._mapped else mappedFile.size())
+                average = mappedFile.size()//len(mappedFile)
+                return ret + lines.materializedCount()*(KodeTextDocument._lineBytes+KodeTextDocument._charBytes*average)
+            return ret + len(lines)*KodeTextDocument._lineBytes + self._chars*KodeTextDocument._charBytes
 
-        rawl = [l._text for l in tsl[offset:]]
-        rawt = '\n'.join(rawl)
-        if not self._lexer:
+    def setVisibleRange(self, view, fr, to):
+        '''Lines [fr,to) displayed by the view, those are highlighted first'''
+        with self.getLock('view'):
+            if (rehydrated := self._evicted):
+                self._rehydrate()
+            elif self._views.get(view) == (fr,to):
+                return
+            self._views[view] = (fr,to)
+            KodeHighlighter.touch()
+            dirty = self._viewDirty(fr, to) is not None
+        if rehydrated:
+            self.kodeHighlightUpdate.emit(0, len(self._dataLines))
+        if dirty:
+            KodeHighlighter.schedule(self)
+
+    def removeView(self, view):
+        '''The view no longer displays the document'''
+        with self.getLock('view'):
+            self._views.pop(view, None)
+
+    def _viewDirty(self, fr, to):
+        try:
+            return self._dirty.index(KodeTextDocument._DIRTY, fr, min(to, len(self._dirty)))
+        except ValueError:
+            return None
+
+    def _refreshLines(self):
+        '''Lines highlighted in the time budget of a refresh'''
+        if not self._lexer or not (speed := KodeTextDocument._lexerSpeed.get(self._lexer.name())):
+            return KodeTextDocument._linesRefreshed
+        return max(KodeTextDocument._linesRefreshed,
+                   min(KodeTextDocument._maxLinesRefreshed, int(speed*KodeTextDocument._refreshBudget)))
+
+    def _updateSpeed(self, lines, elapsed):
+        name = self._lexer.name()
+        speed = lines/max(elapsed, 1e-6)
+        if old := KodeTextDocument._lexerSpeed.get(name):
+            speed = 0.7*old + 0.3*speed
+        KodeTextDocument._lexerSpeed[name] = speed
+
+    def _pending(self):
+        '''True if there are lines still to be highlighted'''
+        if self._evicted:
+            return False
+        if self._mapped:
+            return any(self._viewDirty(fr,to) is not None for fr,to in self._views.values())
+        return self._firstDirty() is not None
+
+    def _firstDirty(self):
+        ret = len(self._dirty)
+        for status in (KodeTextDocument._GUESSED, KodeTextDocument._DIRTY):
             try:
-                self._lexer = guess_lexer_for_filename(self._filePath, rawt)
-            except ClassNotFound:
-                self._lexer = special.TextLexer()
+                ret = self._dirty.index(status, 0, ret)
+            except ValueError:
+                pass
+        return ret if ret < len(self._dirty) else None
 
-        # TTkLog.debug(f"Refresh {self._lexer.name} {ra=} {rb=}")
-        tsl1  = [TTkString()]*(offset+1)
-        block = [0]*(offset+1)
+    def _streamAt(self, line):
+        '''True if the lex in progress continues from line'''
+        return bool((stream := self._stream) and stream.line == line and stream.revision == self._revision)
 
-        kfd = KodeFormatter.Data(tsl1, block)
+    # Return the (start, lines, guess) of the next range to be highlighted
+    # giving priority to the lines displayed in the views
+    def _nextRange(self):
+        if self._evicted:
+            return None
+        for fr,to in self._views.values():
+            if (line := self._viewDirty(fr, to)) is None:
+                continue
+            to = min(to, len(self._dirty))
+            if self._streamAt(line):
+                return line, max(self._lexWindow, to-line), False
+            ra = line
+            while ra > 0 and self._states[ra] < 0 and line-ra < KodeTextDocument._syncLines:
+                ra -= 1
+            if self._states[ra] < 0:
+                # Too far from a known state, guess a 'root' state few lines before
+                ra = max(0, line-KodeTextDocument._linesRefreshed)
+                return ra, to-ra, True
+            return ra, max(self._lexWindow, to-ra), False
+
+        if self._mapped or (ra := self._firstDirty()) is None:
+            return None
+        if self._streamAt(ra):
+            # The state of the line may be unknown (inside a multiline token)
+            return ra, self._lexWindow, False
+        # Restart from the closest line before the first dirty one
+        # with a known lexer state
+        while self._states[ra] < 0:
+            ra -= 1
+        return ra, self._lexWindow, False
+
+    def _refreshEvent(self):
+        # The highlight runs in the KodeHighlighter thread on a snapshot of the lines,
+        # the lock is held only to take the snapshot and to apply the result.
+        # Return True if there are still lines to be highlighted
+        stats = self._stats
+        t0 = perf_counter()
+        with self.getLock('range'):
+            if not (nextRange := self._nextRange()):
+                self._stream = None
+                return False
+            ra, rb, guess = nextRange
+            rb = min(rb, len(self._dataLines)-ra)
+            revision = self._revision
+            self._changes = []
+            if not guess and self._streamAt(ra):
+                stream = self._stream
+                end = stream.end
+                resumed = True
+            else:
+                stream = None
+                resumed = False
+                state = KodeLexer.ROOT if guess else KodeLexer.state(self._states[ra])
+                # The document is lexed until its end and formatted a window at a time,
+                # a multiline token (a fenced block, a docstring, a heredoc) truncated
+                # by the end of a window would be lexed as different tokens.
+                # Only the guessed ranges (colors to be confirmed) and the huge files
+                # (highlighted around the views) are lexed in a window of lines
+                windowed = guess or self._mapped
+                tsl = self._dataLines[ra:ra+rb] if windowed else self._dataLines[ra:]
+                end = ra+len(tsl)
+
+        t1 = perf_counter()
+        if not resumed:
+            rawt = '\n'.join([l._text for l in tsl])+'\n'
+            if not self._lexer:
+                self._lexer = KodeLexer.forFile(self._filePath, rawt)
+            # TTkLog.debug(f"Refresh {self._lexer.name()} {ra=} {rb=} {guess=}")
+            kfd = KodeFormatter.Data([], [state])
+            tokens = self._lexer.tokens(rawt, state, kfd.states)
+            if not windowed:
+                stream = KodeTextDocument._Stream(revision, ra, end, kfd, tokens)
+        if stream:
+            kfd, tokens = stream.data, stream.tokens
         self._formatter.setDl(kfd)
+        if stats:
+            # Lexed upfront to time it apart from the formatter
+            tokens = KodeTextDocument._takeLines(tokens, rb) if stream else list(tokens)
+            t2 = perf_counter()
+        # A stream stops after rb lines, the following tokens are left to the next refresh
+        more = self._formatter.format(tokens, maxLines=rb if stream else None)
+        rb = min(len(kfd.lines), end-ra)
 
-        highlight(rawt, self._lexer, self._formatter)
-
-        # for ll in tsl:
-        #     TTkLog.debug(f"1: -{ll}-")
-        # for ll in tsl1:
-        #     TTkLog.debug(f"2: -{ll}-")
-
-        tsl1 = tsl1[:rb]
-        block = block[:rb]
-        self._dataLines[ra:ra+rb] = tsl1 + tsl[len(tsl1):]
-        self._blocks[ra:ra+rb] = block + [-1]*(rb-len(block))
-        # TTkLog.debug(self._blocks)
-
-        if kfd.error is not None:
-            self._refreshContent = (ra+kfd.error,rb<<1)
-            # TTkLog.debug(f"Error: {self._refreshContent=}")
-        elif kfd.multiline is not None:
-            self._refreshContent = (ra+kfd.multiline,rb<<1)
-        elif (ra+rb) < len(self._dataLines):
-            self._refreshContent = (ra+rb,KodeTextDocument._linesRefreshed)
-        else:
-            self._refreshContent = None
-        # TTkLog.debug(f"{self._refreshContent=}")
+        t3 = perf_counter()
+        self._updateSpeed(rb, t3-t1)
+        with self.getLock('splice'):
+            changes = None
+            prefix = rb
+            if revision != self._revision:
+                # The document changed in the meantime (the edit already rescheduled a refresh),
+                # the lines before the first edit are still valid,
+                # the following ones are used only as colors of the dirty lines
+                changes = self._changes
+                if None in changes:
+                    if stats:
+                        stats.discarded += 1
+                    return True
+                prefix = max(0, min([rb]+[a-ra for a,_,_ in changes]))
+                if stats:
+                    stats.rebased += 1
 
-        if not eof:
-            self._timerRefresh.start(0.03)
-        else:
-            TTkLog.debug(f"Refresh {self._lexer.name} DONE!!!")
+            committed = 0
+            if changes is not None:
+                # The rebased lines may have been moved anywhere
+                fr, to = 0, len(self._dataLines)
+            else:
+                fr, to = ra, ra+rb
+            if guess:
+                # Only the colors are used, the guessed states are not reliable
+                # and the lines are left for the sequential highlight to confirm
+                self._applyColors(ra, kfd.lines, 0, rb, changes)
+            else:
+                if changes is None:
+                    self._lexWindow = min(self._lexWindow<<1, self._refreshLines())
+                else:
+                    self._applyColors(ra, kfd.lines, prefix, rb, changes)
+                for i in range(prefix):
+                    line = ra+i
+                    self._dataLines[line] = kfd.lines[i]
+                    self._dirty[line] = KodeTextDocument._CLEAN
+                    committed = i+1
+                    if line+1 >= len(self._dataLines):
+                        break
+                    state = KodeLexer.stateId(kfd.states[i+1])
+                    if ( state >= 0 and state == self._states[line+1] and
+                         self._dirty[line+1] == KodeTextDocument._CLEAN ):
+                        # The highlight converged with the previous run
+                        break
+                    self._states[line+1] = state
+                    if self._dirty[line+1] == KodeTextDocument._CLEAN:
+                        self._dirty[line+1] = KodeTextDocument._GUESSED
+                if changes is None:
+                    # The following lines converged, unchanged
+                    to = ra+committed
+                if self._indexed and committed:
+                    KodeSymbolIndex.update(self._filePath, ra, ra+committed,
+                        [(ra+l, name, kind) for l, name, kind in kfd.symbols if l < committed])
+                if stream and more and changes is None and committed == rb:
+                    # Not converged yet, the next refresh continues from the following line
+                    kfd.drop(rb)
+                    stream.line = ra+rb
+                    self._stream = stream
+                else:
+                    self._stream = None
+
+            if stats:
+                stats.addRefresh(ra, rb, rb, committed, guess, resumed,
+                                 t1-t0, t2-t1, t3-t2, perf_counter()-t3)
 
-        self._kodeDocMutex.release()
-        self.kodeHighlightUpdate.emit()
+            if not (pending := self._pending()):
+                TTkLog.debug(f"Refresh {self._lexer.name()} DONE!!!")
+
+        if not pending:
+            self._saveCache()
+        if to > fr:
+            self.kodeHighlightUpdate.emit(fr, to)
+        return pending
+
+    @staticmethod
+    def _takeLines(tokens, count):
+        '''Return the list of the next tokens until count lines are ended'''
+        ret = []
+        for token in tokens:
+            ret.append(token)
+            if (count := count-token[1].count('\n')) <= 0:
+                break
+        return ret
 
-    def getLock(self):
+    @staticmethod
+    def _rebaseLine(line, changes):
+        '''Return the index of the line after the changes, None if the line was modified'''
+        for a,b,c in changes:
+            if line >= a+b:
+                line += c-b
+            elif line >= a:
+                return None
+        return line
+
+    def _applyColors(self, ra, lines, fr, to, changes):
+        # The highlighted lines[fr:to] (starting from the line ra) are applied to
+        # the dirty lines, rebased through the changes if the document was edited
+        for i in range(fr, to):
+            line = ra+i
+            if changes:
+                if (line := KodeTextDocument._rebaseLine(line, changes)) is None:
+                    continue
+                if line >= len(self._dataLines) or lines[i]._text != self._dataLines[line]._text:
+                    continue
+            if self._dirty[line] == KodeTextDocument._DIRTY:
+                self._dataLines[line] = lines[i]
+                self._dirty[line] = KodeTextDocument._GUESSED
+
+    def setKodeStyle(self, style):
+        '''Recolor the document with the new style without lexing it again'''
+        with self.getLock('style'):
+            oldStyle = self._formatter.kodeStyle()
+            newStyle = KodeStyle.get(style)
+            if oldStyle is newStyle:
+                return
+            self._formatter.setKodeStyle(newStyle)
+            recolor = oldStyle.recolorMap(newStyle)
+            lines = self._dataLines.materialized() if self._mapped or self._evicted else enumerate(self._dataLines)
+            for i,l in lines:
+                self._dataLines[i] = KodeFormatter._makeLine(
+                    [l._text], [recolor.get(id(c),c) for c in l._colors])
+            # Discard the highlight in progress computed with the old style
+            self._revision += 1
+            self._changes = [None]
+            self._stream = None
+            dirty = self._pending()
+        if dirty:
+            KodeHighlighter.schedule(self)
+        self.kodeHighlightUpdate.emit(0, len(self._dataLines))
+
+    def getLock(self, kind='api'):
+        '''Return the document lock, timed as "kind" if the stats are enabled'''
+        if self._stats:
+            return KodeTimedLock(self._kodeDocMutex, self._stats, kind)
         return self._kodeDocMutex
 
+    def setStatsEnabled(self, enabled=True):
+        with self._kodeDocMutex:
+            if not enabled:
+                self._stats = None
+            elif not self._stats:
+                self._stats = KodeDocStats()
+
+    def stats(self):
+        '''Return the KodeDocStats of the document, None if not enabled'''
+        return self._stats
+
     def filePath(self):
-        return self._filePath
\ No newline at end of file
+        return self._filePath
@@ -20,12 +20,118 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from TermTk import TTkLog
-from TermTk import TTkTextEditView
+from TermTk import pyTTkSlot
+from TermTk import TTkTextEditView, TTkTextWrap, TTkTextCursor, TTkTextDocument
+
+from .kodemappedlines import KodeMappedLines
+from .kodetextdocument import KodeTextDocument
+from .kodestats import KodeRepaintStats
+
+class _KodeNoWrapLines():
+    '''Virtual TTkTextWrap._lines of an unwrapped document,
+    an entry is computed only when it is accessed'''
+    __slots__ = ('_document')
+    def __init__(self, document):
+        self._document = document
+
+    def __len__(self):
+        return len(self._document._dataLines)
+
+    def __getitem__(self, i):
+        dataLines = self._document._dataLines
+        if isinstance(i, slice):
+            return [(l, (0, len(dataLines[l])+1)) for l in range(*i.indices(len(dataLines)))]
+        if i < 0:
+            i += len(dataLines)
+        return (i, (0, len(dataLines[i])+1))
+
+class KodeTextWrap(TTkTextWrap):
+    '''TTkTextWrap avoiding to walk all the lines of the memory mapped documents'''
+    __slots__ = ()
+    def _isVirtual(self):
+        return not self._enable and isinstance(self._textDocument._dataLines, KodeMappedLines)
+
+    def rewrap(self):
+        if not self._isVirtual():
+            return super().rewrap()
+        self._lines = _KodeNoWrapLines(self._textDocument)
+        self.wrapChanged.emit()
+
+    def dataToScreenPosition(self, line, pos):
+        if not self._isVirtual():
+            return super().dataToScreenPosition(line, pos)
+        l = self._textDocument._dataLines[line].substring(0,pos).tab2spaces(self._tabSpaces)
+        return l.termWidth(), line
 
 class KodeTextEditView(TTkTextEditView):
+    # Same as TTkTextEditView.setDocument using KodeTextWrap,
+    # the default wrap would walk all the lines of the document
+    def setDocument(self, document):
+        if isinstance(self._textDocument, KodeTextDocument):
+            self._textDocument.removeView(self)
+        if self._textDocument:
+            self._textDocument.contentsChanged.disconnect(self._documentChanged)
+            self._textDocument.cursorPositionChanged.disconnect(self._cursorPositionChanged)
+            self._textDocument.undoAvailable.disconnect(self._undoAvailable)
+            self._textDocument.redoAvailable.disconnect(self._redoAvailable)
+            self._textWrap.wrapChanged.disconnect(self.update)
+        if not document:
+            document = TTkTextDocument()
+        self._textDocument = document
+        self._textCursor = TTkTextCursor(document=self._textDocument)
+        self._textWrap = KodeTextWrap(document=self._textDocument)
+        self._textDocument.contentsChanged.connect(self._documentChanged)
+        self._textDocument.cursorPositionChanged.connect(self._cursorPositionChanged)
+        self._textDocument.undoAvailable.connect(self._undoAvailable)
+        self._textDocument.redoAvailable.connect(self._redoAvailable)
+        self._textWrap.wrapChanged.connect(self.update)
+
+    def _documentChanged(self):
+        # A view showing the end of a followed document stays pinned to the end
+        doc = self._textDocument
+        pinned = False
+        if isinstance(doc, KodeTextDocument) and doc.following():
+            _, oy = self.getViewOffsets()
+            _, h = self.viewFullAreaSize()
+            pinned = oy + self.height() >= h
+        super()._documentChanged()
+        if pinned:
+            ox, _ = self.getViewOffsets()
+            _, h = self.viewFullAreaSize()
+            self.viewMoveTo(ox, max(0, h-self.height()))
+
+    def _updateSize(self):
+        if isinstance(lines := self._textDocument._dataLines, KodeMappedLines):
+            self._hsize = lines.maxWidth() + 1
+        else:
+            super()._updateSize()
+
+    def goToLine(self, line):
+        '''Move the cursor at the beginning of the line and scroll the view to it'''
+        line = max(0, min(line, len(self._textDocument._dataLines)-1))
+        self._textCursor.setPosition(line, 0)
+        _, y = self._textWrap.dataToScreenPosition(line, 0)
+        self.viewMoveTo(0, max(0, y-self.height()//3))
+        self._pushCursor()
+
     def keyEvent(self, evt) -> bool:
-        self.document().getLock().acquire()
-        ret = super().keyEvent(evt)
-        self.document().getLock().release()
-        return ret
\ No newline at end of file
+        with self.document().getLock('key'):
+            return super().keyEvent(evt)
+
+    @pyTTkSlot(int,int)
+    def highlightUpdate(self, fr, to):
+        '''The lines [fr,to) have been highlighted, the view is repainted only if it displays them'''
+        KodeRepaintStats.updates += 1
+        _, oy = self.getViewOffsets()
+        subLines = self._textWrap._lines[oy:oy+self.height()]
+        if not subLines or to <= subLines[0][0] or fr > subLines[-1][0]:
+            KodeRepaintStats.skipped += 1
+            return
+        self.update()
+
+    def paintEvent(self, canvas):
+        KodeRepaintStats.repaints += 1
+        _, oy = self.getViewOffsets()
+        if subLines := self._textWrap._lines[oy:oy+self.height()]:
+            self.document().setVisibleRange(self, subLines[0][0], subLines[-1][0]+1)
+        super().paintEvent(canvas)
\ No newline at end of file
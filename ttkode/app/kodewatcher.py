@@ -0,0 +1,234 @@
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import sys
+import struct
+from time import perf_counter
+from threading import Lock
+
+from TermTk import TTkLog, TTkTimer
+
+# inotify events and the header of each event (wd, mask, cookie, len) followed by the name
+_IN_MODIFY      = 0x00000002
+_IN_ATTRIB      = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM  = 0x00000040
+_IN_MOVED_TO    = 0x00000080
+_IN_CREATE      = 0x00000100
+_IN_DELETE      = 0x00000200
+_IN_Q_OVERFLOW  = 0x00004000
+_IN_MASK = (_IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE |
+            _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE)
+_IN_EVENT = struct.Struct('iIII')
+
+class KodeFileWatcher():
+    '''Watch the files changed on the disk (i.e. by a build or a git checkout)
+
+    The folders of the watched files are watched with inotify (Linux),
+    the files are replaced by renames and a watch on the file itself would be lost.
+    The events are read by a worker every checkInterval seconds and a file is
+    checked once no event arrived for settleTime seconds (the end of a write).
+    Without inotify (or if the watch fails) the files are polled every pollInterval seconds.
+
+    A file is changed if its (size, mtime) changed, the callbacks are called
+    in the worker thread with the path of the file.
+    '''
+    checkInterval = 0.25
+    settleTime = 0.1
+    pollInterval = 2.0
+    # {path:[callback]}
+    _watched = {}
+    # {path:(size, mtime_ns)} last seen, None if missing
+    _stamps = {}
+    # {path:time} of the last event of the files to be checked
+    _pending = {}
+    # {folder:wd} and {wd:folder} of the inotify watches, wd -1 if polled
+    _folders = {}
+    _wds = {}
+    _inotify = None
+    _lastPoll = 0.0
+    _timer = None
+    _lock = Lock()
+
+    @staticmethod
+    def stamp(path):
+        '''Return the (size, mtime_ns) of the file, None if missing'''
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    @staticmethod
+    def watch(path, callback):
+        '''Call callback(path) each time the file changes'''
+        path = os.path.realpath(path)
+        with KodeFileWatcher._lock:
+            if path not in KodeFileWatcher._watched:
+                KodeFileWatcher._watched[path] = []
+                KodeFileWatcher._stamps[path] = KodeFileWatcher.stamp(path)
+                KodeFileWatcher._addFolder(os.path.dirname(path))
+            if callback not in KodeFileWatcher._watched[path]:
+                KodeFileWatcher._watched[path].append(callback)
+            if not KodeFileWatcher._timer:
+                KodeFileWatcher._timer = TTkTimer()
+                KodeFileWatcher._timer.timeout.connect(KodeFileWatcher._refresh)
+        KodeFileWatcher._timer.start(KodeFileWatcher._interval())
+
+    @staticmethod
+    def unwatch(path, callback=None):
+        '''Stop calling callback (all the callbacks if None) when the file changes'''
+        path = os.path.realpath(path)
+        with KodeFileWatcher._lock:
+            if (callbacks := KodeFileWatcher._watched.get(path)) is None:
+                return
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if callback is None or not callbacks:
+                del KodeFileWatcher._watched[path]
+                KodeFileWatcher._stamps.pop(path, None)
+                KodeFileWatcher._pending.pop(path, None)
+                folder = os.path.dirname(path)
+                if not any(os.path.dirname(p) == folder for p in KodeFileWatcher._watched):
+                    KodeFileWatcher._removeFolder(folder)
+
+    @staticmethod
+    def check(path=None):
+        '''Check the file (all the watched files if None) as soon as possible'''
+        with KodeFileWatcher._lock:
+            now = perf_counter()-KodeFileWatcher.settleTime
+            for p in ([os.path.realpath(path)] if path else KodeFileWatcher._watched):
+                if p in KodeFileWatcher._watched:
+                    KodeFileWatcher._pending[p] = now
+        if KodeFileWatcher._timer:
+            KodeFileWatcher._timer.start(0)
+
+    @staticmethod
+    def isInotify():
+        '''True if the changes are notified by inotify instead of polling the files'''
+        return KodeFileWatcher._initInotify() is not None
+
+    @staticmethod
+    def _initInotify():
+        # (libc, fd), False if not available
+        if KodeFileWatcher._inotify is None:
+            KodeFileWatcher._inotify = False
+            if sys.platform.startswith('linux'):
+                # ctypes is imported only when the first file is watched
+                import ctypes, ctypes.util
+                try:
+                    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+                    if (fd := libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)) >= 0:
+                        KodeFileWatcher._inotify = (libc, fd)
+                except (OSError, AttributeError) as e:
+                    TTkLog.debug(f"inotify not available: {e}")
+        return KodeFileWatcher._inotify or None
+
+    @staticmethod
+    def _interval():
+        if KodeFileWatcher._initInotify() and all(wd >= 0 for wd in KodeFileWatcher._folders.values()):
+            return KodeFileWatcher.checkInterval
+        return min(KodeFileWatcher.checkInterval*4, KodeFileWatcher.pollInterval)
+
+    @staticmethod
+    def _addFolder(folder):
+        if folder in KodeFileWatcher._folders:
+            return
+        wd = -1
+        if inotify := KodeFileWatcher._initInotify():
+            libc, fd = inotify
+            if (wd := libc.inotify_add_watch(fd, os.fsencode(folder), _IN_MASK)) < 0:
+                import ctypes
+                TTkLog.debug(f"Polling {folder}: {os.strerror(ctypes.get_errno())}")
+        KodeFileWatcher._folders[folder] = wd
+        if wd >= 0:
+            KodeFileWatcher._wds[wd] = folder
+
+    @staticmethod
+    def _removeFolder(folder):
+        if (wd := KodeFileWatcher._folders.pop(folder, -1)) >= 0:
+            libc, fd = KodeFileWatcher._inotify
+            libc.inotify_rm_watch(fd, wd)
+            KodeFileWatcher._wds.pop(wd, None)
+
+    @staticmethod
+    def _readEvents():
+        '''Mark as pending the watched files with an inotify event'''
+        if not (inotify := KodeFileWatcher._inotify):
+            return
+        _, fd = inotify
+        now = perf_counter()
+        while True:
+            try:
+                data = os.read(fd, 65536)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                TTkLog.error(f"inotify read failed: {e}")
+                return
+            pos = 0
+            while pos+_IN_EVENT.size <= len(data):
+                wd, mask, _, size = _IN_EVENT.unpack_from(data, pos)
+                name = data[pos+_IN_EVENT.size:pos+_IN_EVENT.size+size].rstrip(b'\0')
+                pos += _IN_EVENT.size+size
+                if mask & _IN_Q_OVERFLOW:
+                    # Events lost, all the files are checked
+                    KodeFileWatcher._pending.update(dict.fromkeys(KodeFileWatcher._watched, now))
+                elif (folder := KodeFileWatcher._wds.get(wd)) is not None:
+                    path = os.path.join(folder, os.fsdecode(name))
+                    if path in KodeFileWatcher._watched:
+                        KodeFileWatcher._pending[path] = now
+
+    @staticmethod
+    def _refresh():
+        changed = []
+        with KodeFileWatcher._lock:
+            if not KodeFileWatcher._watched:
+                return
+            KodeFileWatcher._readEvents()
+            now = perf_counter()
+            if now-KodeFileWatcher._lastPoll >= KodeFileWatcher.pollInterval:
+                KodeFileWatcher._lastPoll = now
+                # The files in the folders not watched by inotify
+                for path in KodeFileWatcher._watched:
+                    if KodeFileWatcher._folders.get(os.path.dirname(path), -1) < 0:
+                        KodeFileWatcher._pending.setdefault(path, now-KodeFileWatcher.settleTime)
+            for path, t in list(KodeFileWatcher._pending.items()):
+                if now-t < KodeFileWatcher.settleTime:
+                    continue
+                del KodeFileWatcher._pending[path]
+                stamp = KodeFileWatcher.stamp(path)
+                if stamp == KodeFileWatcher._stamps.get(path):
+                    continue
+                KodeFileWatcher._stamps[path] = stamp
+                # A removed file is notified when it is created again
+                if stamp is not None:
+                    changed.append((path, list(KodeFileWatcher._watched[path])))
+            interval = KodeFileWatcher._interval()
+            if KodeFileWatcher._pending:
+                interval = min(interval, KodeFileWatcher.settleTime)
+        for path, callbacks in changed:
+            TTkLog.debug(f"Changed on disk: {path}")
+            for callback in callbacks:
+                callback(path)
+        KodeFileWatcher._timer.start(interval)
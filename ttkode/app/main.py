@@ -29,20 +29,16 @@ import argparse
 
 import appdirs
 
-from pygments import highlight
-from pygments.lexers import PythonLexer
-from pygments.formatters import TerminalFormatter, Terminal256Formatter, TerminalTrueColorFormatter
-
 from TermTk import TTk, TTkK, TTkLog, TTkCfg, TTkColor, TTkTheme, TTkTerm, TTkHelper
 from TermTk import TTkString
 from TermTk import TTkColorGradient
 from TermTk import pyTTkSlot, pyTTkSignal
 
-from TermTk import TTkFrame, TTkButton
+from TermTk import TTkWidget, TTkFrame, TTkButton, TTkMenuButton
 from TermTk import TTkTabWidget, TTkKodeTab
 from TermTk import TTkAbstractScrollArea, TTkAbstractScrollView
 from TermTk import TTkFileDialogPicker
-from TermTk import TTkFileTree, TTkTextEdit
+from TermTk import TTkTextEdit
 
 from TermTk import TTkGridLayout
 from TermTk import TTkSplitter
@@ -52,11 +48,21 @@ from .about import *
 # from .options import optionsFormLayout, optionsLoadTheme
 from .kodetextedit import KodeTextEditView
 from .kodetextdocument import KodeTextDocument
+from .kodelexer import KodeLexer
+from .kodeformatter import KodeStyle
+from .kodemappedlines import KodeMappedLines
+from .kodestats import KodeStatsWindow
+from .kodehighlighter import KodeHighlighter
 
 class TTKode(TTkGridLayout):
-    __slots__ = ('_kodeTab', '_documents')
-    def __init__(self, *, files, **kwargs):
+    _kodeStyles = ('ttkode', 'gruvbox-dark', 'dracula', 'monokai', 'native', 'one-dark', 'solarized-dark', 'zenburn')
+    __slots__ = ('_kodeTab', '_documents', '_activeDoc', '_activeTab', '_leftSplitter', '_searchPanel')
+    def __init__(self, *, files, follow=False, **kwargs):
         self._documents = {}
+        self._activeDoc = None
+        self._activeTab = None
+        # Created by the first "Find in Files"
+        self._searchPanel = None
 
         super().__init__(**kwargs)
 
@@ -70,12 +76,28 @@ class TTKode(TTkGridLayout):
         menuFrame = TTkFrame(border=False, maxHeight=1)
 
         self._kodeTab = TTkKodeTab(parent=hSplitter, border=False, closable=True)
+        self._kodeTab.currentChanged.connect(self._tabChanged)
+        self._kodeTab.tabCloseRequested.connect(self._tabClosed)
 
         fileMenu = menuFrame.newMenubarTop().addMenu("&File")
         fileMenu.addMenu("Open").menuButtonClicked.connect(self._showFileDialog)
-        fileMenu.addMenu("Close") # .menuButtonClicked.connect(self._closeFile)
+        fileMenu.addMenu("Close").menuButtonClicked.connect(self._closeFile)
         fileMenu.addMenu("Exit").menuButtonClicked.connect(lambda _:TTkHelper.quit())
 
+        viewMenu = menuFrame.newMenubarTop().addMenu("&View")
+        styleMenu = viewMenu.addMenu("Style")
+        # The names are read without importing pygments.styles (plugins lookup)
+        for style in TTKode._kodeStyles:
+            if style in KodeStyle.names() or style == 'ttkode':
+                styleMenu.addMenu(style, data=style).menuButtonClicked.connect(self._setKodeStyle)
+        viewMenu.addMenu("Follow").menuButtonClicked.connect(self._toggleFollow)
+        viewMenu.addMenu("Highlight Stats").menuButtonClicked.connect(self._showStats)
+
+        goMenu = menuFrame.newMenubarTop().addMenu("&Go")
+        goMenu.addMenu("Go to File").menuButtonClicked.connect(self._showQuickOpen)
+        goMenu.addMenu("Go to Symbol").menuButtonClicked.connect(self._showSymbols)
+        goMenu.addMenu("Find in Files").menuButtonClicked.connect(self._showSearch)
+
         def _showAbout(btn):
             TTkHelper.overlay(None, About(), 30,10)
         def _showAboutTTk(btn):
@@ -85,16 +107,25 @@ class TTKode(TTkGridLayout):
         helpMenu.addMenu("About ...").menuButtonClicked.connect(_showAbout)
         helpMenu.addMenu("About ttk").menuButtonClicked.connect(_showAboutTTk)
 
-        fileTree = TTkFileTree(path='.')
+        # The file tree is displayed in the first frame, the modules of
+        # "Go to File", "Go to Symbol" and "Find in Files" (and their indexes
+        # of the same tree of files) are imported and started on first use
+        from .kodefiletree import KodeFileTree
+        fileTree = KodeFileTree(path='.')
+
+        self._leftSplitter = TTkSplitter(orientation=TTkK.VERTICAL)
+        self._leftSplitter.addWidget(fileTree)
 
         layoutLeft.addWidget(menuFrame, 0,0)
-        layoutLeft.addWidget(fileTree, 1,0)
+        layoutLeft.addWidget(self._leftSplitter, 1,0)
         layoutLeft.addWidget(quitbtn := TTkButton(border=True, text="Quit", maxHeight=3), 2,0)
 
         quitbtn.clicked.connect(TTkHelper.quit)
 
         for file in files:
             self._openFile(file)
+            if follow:
+                self._setFollow(self._documents[os.path.realpath(file)], True)
 
         fileTree.fileActivated.connect(lambda x: self._openFile(x.path()))
 
@@ -104,33 +135,153 @@ class TTKode(TTkGridLayout):
         filePicker.pathPicked.connect(self._openFile)
         TTkHelper.overlay(None, filePicker, 20, 5, True)
 
-    def _openFile(self, filePath):
+    @pyTTkSlot(TTkMenuButton)
+    def _setKodeStyle(self, btn):
+        style = btn.data()
+        TTKodeCfg.options['style'] = style
+        TTKodeCfg.save(searches=False, filters=False, colors=False, options=True)
+        for document in self._documents.values():
+            document['doc'].setKodeStyle(style)
+
+    @pyTTkSlot(TTkMenuButton)
+    def _showStats(self, btn):
+        KodeTextDocument.statsEnabled = True
+        for document in self._documents.values():
+            document['doc'].setStatsEnabled(True)
+        TTkHelper.overlay(None, KodeStatsWindow(documents=self._documents), 5, 3)
+
+    @pyTTkSlot(TTkMenuButton)
+    def _toggleFollow(self, btn):
+        if (doc := self._activeDoc) and (document := self._documents.get(doc.filePath())):
+            self._setFollow(document, not doc.following())
+
+    def _setFollow(self, document, enabled):
+        doc = document['doc']
+        maxLines = TTKodeCfg.options.get('followMaxLines', TTKodeCfg.followMaxLines)
+        if not doc.setFollow(enabled, maxLines=maxLines):
+            TTkLog.warn(f"Unable to follow the edited or memory mapped (large) file: {doc.filePath()}")
+            return
+        if enabled:
+            # The appended lines are not reloaded
+            from .kodewatcher import KodeFileWatcher
+            KodeFileWatcher.unwatch(doc.filePath(), self._fileChanged)
+        for tview in document['tabs']:
+            tview.setReadOnly(enabled)
+            if enabled:
+                tview.goToLine(len(doc._dataLines)-1)
+
+    @pyTTkSlot(TTkMenuButton)
+    def _showQuickOpen(self, btn):
+        from .kodequickopen import KodePathIndex, KodeQuickOpenWindow
+        if KodePathIndex.root() is None:
+            KodePathIndex.start('.')
+        quickOpen = KodeQuickOpenWindow()
+        quickOpen.fileActivated.connect(self._openFile)
+        TTkHelper.overlay(None, quickOpen, 10, 3, True)
+
+    @pyTTkSlot(TTkMenuButton)
+    def _showSymbols(self, btn):
+        from .kodesymbols import KodeSymbolIndex, KodeSymbolsWindow
+        # The symbols of the open documents are indexed by their highlight
+        KodeSymbolIndex.start('.')
+        symbols = KodeSymbolsWindow()
+        symbols.symbolActivated.connect(self._openFile)
+        TTkHelper.overlay(None, symbols, 10, 3, True)
+
+    @pyTTkSlot(TTkMenuButton)
+    def _showSearch(self, btn):
+        if not self._searchPanel:
+            from .kodesearch import KodeSearchIndex, KodeSearchPanel
+            # Loaded and updated from the first search
+            KodeSearchIndex.start('.')
+            self._searchPanel = KodeSearchPanel()
+            self._searchPanel.resultActivated.connect(self._openFile)
+            self._leftSplitter.addWidget(self._searchPanel)
+        self._searchPanel.focusQuery()
+
+    @pyTTkSlot(TTkTabWidget, int, TTkWidget, object)
+    def _tabChanged(self, tabWidget, index, widget, doc):
+        # The document in the current tab is highlighted first
+        self._activeDoc = doc
+        self._activeTab = tabWidget
+        if doc:
+            KodeHighlighter.setActive(doc)
+            KodeHighlighter.trim(TTKodeCfg.options.get('highlightMemory', TTKodeCfg.highlightMemory))
+
+    @pyTTkSlot(TTkMenuButton)
+    def _closeFile(self, btn):
+        if (tabWidget := self._activeTab) and (index := tabWidget.currentIndex()) >= 0:
+            tabWidget.tabCloseRequested.emit(index)
+
+    @pyTTkSlot(TTkTabWidget, int)
+    def _tabClosed(self, tabWidget, index):
+        # The tab is already removed, its editor (the parent of the view) has no parent
+        for filePath, document in list(self._documents.items()):
+            doc = document['doc']
+            for tview in [t for t in document['tabs'] if not t.parentWidget().parentWidget()]:
+                document['tabs'].remove(tview)
+                doc.kodeHighlightUpdate.disconnect(tview.highlightUpdate)
+                tview.setDocument(None)
+            if document['tabs']:
+                continue
+            # The last tab of the document, it is released
+            from .kodewatcher import KodeFileWatcher
+            KodeFileWatcher.unwatch(filePath, self._fileChanged)
+            doc.close()
+            del self._documents[filePath]
+            if doc is self._activeDoc:
+                self._activeDoc = None
+
+    def _openFile(self, filePath, line=None):
         filePath = os.path.realpath(filePath)
         if filePath in self._documents:
             doc = self._documents[filePath]['doc']
         else:
-            with open(filePath, 'r') as f:
-                content = f.read()
-            doc = KodeTextDocument(text=content, filePath=filePath)
+            style = TTKodeCfg.options.get('style','gruvbox-dark')
+            if os.path.getsize(filePath) >= TTKodeCfg.options.get('largeFileSize', TTKodeCfg.largeFileSize):
+                lines = KodeMappedLines.fromFile(filePath)
+                TTkLog.debug(f"Mapped {filePath}: {len(lines)} lines")
+                doc = KodeTextDocument(
+                            lines=lines, filePath=filePath, style=style,
+                            lexer=KodeLexer.forFile(filePath, str(lines[0]), guess=False))
+            else:
+                with open(filePath, 'r') as f:
+                    content = f.read()
+                doc = KodeTextDocument(
+                            text=content, filePath=filePath, style=style, cached=True,
+                            lexer=KodeLexer.forFile(filePath, content, guess=False))
+                from .kodewatcher import KodeFileWatcher
+                KodeFileWatcher.watch(filePath, self._fileChanged)
             self._documents[filePath] = {'doc':doc,'tabs':[]}
-        tview = KodeTextEditView(document=doc, readOnly=False)
+        tview = KodeTextEditView(document=doc, readOnly=doc.following())
         tedit = TTkTextEdit(textEditView=tview, lineNumber=True)
-        doc.kodeHighlightUpdate.connect(tedit.update)
+        self._documents[filePath]['tabs'].append(tview)
+        doc.kodeHighlightUpdate.connect(tview.highlightUpdate)
         label = TTkString(TTkCfg.theme.fileIcon.getIcon(filePath),TTkCfg.theme.fileIconColor) + TTkColor.RST + " " + os.path.basename(filePath)
 
-        self._kodeTab.addTab(tedit, label)
+        self._kodeTab.addTab(tedit, label, doc)
         self._kodeTab.setCurrentWidget(tedit)
+        KodeHighlighter.setActive(doc)
+        if line is not None:
+            tview.goToLine(line)
 
-        # def _closeFile():
-        #     if (index := KodeTab.lastUsed.currentIndex()) >= 0:
-        #         KodeTab.lastUsed.removeTab(index)
+    def _fileChanged(self, filePath):
+        # Called by the KodeFileWatcher worker
+        if (document := self._documents.get(filePath)) and not document['doc'].reloadFile():
+            TTkLog.warn(f"Changed on disk, the local changes are kept: {filePath}")
 
 def main():
     TTKodeCfg.pathCfg = appdirs.user_config_dir("ttkode")
 
+    # ttkode highlight ... (headless, see KodeBatch)
+    if sys.argv[1:2] == ['highlight']:
+        from .kodebatch import KodeBatch
+        sys.exit(KodeBatch.main(sys.argv[2:]))
+
     parser = argparse.ArgumentParser()
     # parser.add_argument('-f', help='Full Screen', action='store_true')
     parser.add_argument('-c', help=f'config folder (default: "{TTKodeCfg.pathCfg}")', default=TTKodeCfg.pathCfg)
+    parser.add_argument('--follow', help='follow the files growing on disk (i.e. logs)', action='store_true')
     parser.add_argument('filename', type=str, nargs='*',
                     help='the filename/s')
     args = parser.parse_args()
@@ -148,7 +299,7 @@ def main():
 
     TTkTheme.loadTheme(TTkTheme.NERD)
 
-    root = TTk( layout=TTKode(files=args.filename), title="TTkode",
+    root = TTk( layout=TTKode(files=args.filename, follow=args.follow), title="TTkode",
                 sigmask=(
                     # TTkTerm.Sigmask.CTRL_C |
                     TTkTerm.Sigmask.CTRL_Q |